@@ -43,8 +43,14 @@ function getClientOptions(): LanguageClientOptions {
         ],
         outputChannelName: "Torque Language Server",
         synchronize: {
+            // Send the server settings on start and on every change
+            configurationSection: "torqueServer",
             // Notify the server about file changes to '.yaml files contain in the workspace
-            fileEvents: workspace.createFileSystemWatcher("**/*.yaml"),
+            // and to the scripts and variables files of applications and services
+            fileEvents: [
+                workspace.createFileSystemWatcher("**/*.yaml"),
+                workspace.createFileSystemWatcher("**/{applications,services}/*/*"),
+            ],
         },
     };
 }
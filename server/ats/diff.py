@@ -0,0 +1,160 @@
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, List, Optional, Tuple, Union
+
+from server.ats.trees.common import (BaseTree, MappingNode, ObjectNode, PropertyNode, SequenceNode, TextNode,
+                                     YamlNode, get_node_schema)
+
+ADDED = "added"
+REMOVED = "removed"
+MODIFIED = "modified"
+MOVED = "moved"
+
+# Logical path of the node: names of the properties and identities of sequence items,
+# like ("applications", "web", "inputs", "PORT"). Items without identity are addressed by index
+Path = Tuple[Union[str, int], ...]
+
+
+@dataclass
+class NodeChange:
+    change_type: str
+    path: Path
+    old: Optional[YamlNode] = None
+    new: Optional[YamlNode] = None
+
+
+@dataclass
+class TreeDiff:
+    changes: List[NodeChange] = field(default_factory=list)
+
+    def __bool__(self) -> bool:
+        return bool(self.changes)
+
+    def get_changes(self, *paths: Path, change_types: Iterable[str] = None) -> List[NodeChange]:
+        """Returns the changes of the nodes located under any of the paths or containing
+        them (all the changes if paths are not provided)"""
+        result = []
+        for change in self.changes:
+            if change_types is not None and change.change_type not in change_types:
+                continue
+            if paths and not any(_is_overlapping(change.path, path) for path in paths):
+                continue
+            result.append(change)
+
+        return result
+
+    def affects(self, *paths: Path) -> bool:
+        """Checks if content of the nodes under any of the paths was changed.
+        Reordering of sequence items doesn't count"""
+        return bool(self.get_changes(*paths, change_types=(ADDED, REMOVED, MODIFIED)))
+
+
+def _is_overlapping(path: Path, other: Path) -> bool:
+    length = min(len(path), len(other))
+    return path[:length] == other[:length]
+
+
+def diff(old_tree: Optional[BaseTree], new_tree: Optional[BaseTree]) -> TreeDiff:
+    """Compares two versions of a document tree. Nodes are matched by their logical
+    identity (property names, ids of applications and services, keys of inputs,
+    names of outputs), not by their positions in the documents"""
+    result = TreeDiff()
+    _diff_nodes(old_tree, new_tree, (), result.changes)
+    return result
+
+
+def _diff_nodes(old: Optional[YamlNode], new: Optional[YamlNode], path: Path, changes: List[NodeChange]) -> None:
+    if old is None and new is None:
+        return
+
+    if old is None:
+        changes.append(NodeChange(ADDED, path, new=new))
+        return
+
+    if new is None:
+        changes.append(NodeChange(REMOVED, path, old=old))
+        return
+
+    if type(old) is not type(new):
+        changes.append(NodeChange(MODIFIED, path, old, new))
+        return
+
+    if old.get_hash() == new.get_hash():
+        return
+
+    if isinstance(old, TextNode):
+        if old.text != new.text:
+            changes.append(NodeChange(MODIFIED, path, old, new))
+
+    elif isinstance(old, MappingNode):
+        # property values and items of mappings sequences (whose keys are their identities)
+        if not isinstance(old, PropertyNode) and _get_text(old.key) != _get_text(new.key):
+            changes.append(NodeChange(MODIFIED, path, old, new))
+        else:
+            _diff_nodes(old.value, new.value, path, changes)
+
+    elif isinstance(old, ObjectNode):
+        schema = get_node_schema(type(old))
+        for attr in schema.child_fields:
+            _diff_nodes(getattr(old, attr), getattr(new, attr), path + (schema.names[attr],), changes)
+
+    elif isinstance(old, SequenceNode):
+        _diff_sequences(old, new, path, changes)
+
+    else:
+        changes.append(NodeChange(MODIFIED, path, old, new))
+
+
+def _get_text(node: Optional[TextNode]) -> Optional[str]:
+    return node.text if node is not None else None
+
+
+def _get_identity(node: YamlNode) -> Optional[str]:
+    if isinstance(node, MappingNode):
+        return _get_text(node.key)
+    if isinstance(node, TextNode):
+        return node.text
+    return None
+
+
+def _get_identities(seq: SequenceNode) -> Optional[Dict[str, int]]:
+    """Returns identity -> index of the item, None when items can't be identified"""
+    identities = {}
+    for index, node in enumerate(seq.nodes):
+        identity = _get_identity(node)
+        if identity is None or identity in identities:
+            return None
+        identities[identity] = index
+
+    return identities
+
+
+def _diff_sequences(old: SequenceNode, new: SequenceNode, path: Path, changes: List[NodeChange]) -> None:
+    old_ids = _get_identities(old)
+    new_ids = _get_identities(new)
+
+    if old_ids is None or new_ids is None:
+        for index in range(max(len(old.nodes), len(new.nodes))):
+            old_item = old.nodes[index] if index < len(old.nodes) else None
+            new_item = new.nodes[index] if index < len(new.nodes) else None
+            _diff_nodes(old_item, new_item, path + (index,), changes)
+        return
+
+    for identity, index in old_ids.items():
+        if identity not in new_ids:
+            changes.append(NodeChange(REMOVED, path + (identity,), old=old.nodes[index]))
+
+    # order of the items present in both versions
+    old_order = [identity for identity in old_ids if identity in new_ids]
+    new_order = [identity for identity in new_ids if identity in old_ids]
+    old_positions = {identity: i for i, identity in enumerate(old_order)}
+
+    for position, identity in enumerate(new_order):
+        old_item = old.nodes[old_ids[identity]]
+        new_item = new.nodes[new_ids[identity]]
+        if old_positions[identity] != position:
+            changes.append(NodeChange(MOVED, path + (identity,), old_item, new_item))
+        _diff_nodes(old_item, new_item, path + (identity,), changes)
+
+    for identity, index in new_ids.items():
+        if identity not in old_ids:
+            changes.append(NodeChange(ADDED, path + (identity,), new=new.nodes[index]))
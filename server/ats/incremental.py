@@ -0,0 +1,227 @@
+from typing import List, Optional, Tuple
+
+from pygls.lsp.types import Range
+
+from server.ats import yaml_backend
+from server.ats.parser import Parser
+from server.ats.trees.common import BaseTree, PropertyNode, SequenceNode, TextNode, YamlNode
+
+# characters which could make a block depend on the rest of the document
+# (anchors, aliases and tags). Blocks containing them are always reparsed in full
+_CONTEXT_DEPENDENT_CHARS = ('&', '*', '!')
+
+
+def _is_block_boundary(line: str, indent: int) -> bool:
+    """Checks if the line starts a new block on the same or lower indentation level"""
+    content = line.lstrip(' ')
+    if not content.strip() or content.startswith('#'):
+        return False
+
+    return len(line) - len(content) <= indent
+
+
+def _get_block_end(lines: List[str], start: int, indent: int) -> int:
+    """Returns the number of the first line after the block started at the line 'start'"""
+    for num in range(start + 1, len(lines)):
+        if _is_block_boundary(lines[num], indent):
+            return num
+
+    return len(lines)
+
+
+def _is_item_start(line: str, indent: int) -> bool:
+    return line[indent:indent + 2] == '- ' and not line[:indent].strip()
+
+
+def _shift_pos(pos: Optional[Tuple[int, int]], lines: int) -> Optional[Tuple[int, int]]:
+    if pos is None:
+        return pos
+    return pos[0] + lines, pos[1]
+
+
+def _shift_subtree(node: YamlNode, lines: int, from_line: int = 0, skip: YamlNode = None) -> None:
+    """Moves all positions of the subtree located on the line 'from_line' or after it"""
+    stack = [node]
+    while stack:
+        current = stack.pop()
+        if current is skip:
+            continue
+
+        # nothing to move in nodes which end before the changed lines
+        if current.end_pos is not None and current.end_pos[0] < from_line:
+            continue
+
+        if current.start_pos is not None and current.start_pos[0] >= from_line:
+            current.start_pos = _shift_pos(current.start_pos, lines)
+        if current.end_pos is not None and current.end_pos[0] >= from_line:
+            current.end_pos = _shift_pos(current.end_pos, lines)
+        if isinstance(current, TextNode):
+            current.update_spans()
+
+        stack.extend(current.get_children())
+
+
+def _get_ancestors(node: YamlNode) -> List[YamlNode]:
+    ancestors = []
+    parent = node.parent
+    while parent is not None:
+        ancestors.append(parent)
+        parent = parent.parent
+
+    return ancestors
+
+
+def _find_sequence_item(tree: BaseTree, line: int) -> Optional[Tuple[PropertyNode, SequenceNode, int]]:
+    """Looks for the top-level sequence item which starts on the line or before it"""
+    for prop in tree.get_children():
+        if not isinstance(prop, PropertyNode) or not isinstance(prop.value, SequenceNode):
+            continue
+        if prop.start_pos is None or prop.end_pos is None:
+            continue
+        if not prop.start_pos[0] < line <= prop.end_pos[0]:
+            continue
+
+        seq: SequenceNode = prop.value
+        index = None
+        for i, item in enumerate(seq.nodes):
+            if item.start_pos is None or item.start_pos[0] > line:
+                break
+            index = i
+
+        if index is None:
+            return None
+
+        return prop, seq, index
+
+    return None
+
+
+def reparse_block(tree: BaseTree, kind: str, old_source: str, new_source: str, change_range: Range) -> bool:
+    """Reparses only the top-level sequence item (e.g. an application in a blueprint)
+    affected by the change and splices the result into the tree.
+
+    Sources must be normalized. Positions of the nodes placed after the changed
+    item are moved accordingly. Returns False without touching the tree
+    when the change cannot be handled incrementally."""
+    old_lines = old_source.split('\n')
+    new_lines = new_source.split('\n')
+    first_line, last_line = change_range.start.line, change_range.end.line
+
+    found = _find_sequence_item(tree, first_line)
+    if found is None:
+        return False
+
+    prop, seq, index = found
+    item = seq.nodes[index]
+
+    block_start = item.start_pos[0]
+    indent = item.start_pos[1] - 2
+    if indent < 0 or prop.key.start_pos[1] != 0 or not _is_item_start(old_lines[block_start], indent):
+        return False
+
+    old_block_end = _get_block_end(old_lines, block_start, indent)
+    if last_line >= old_block_end:
+        return False
+
+    delta = len(new_lines) - len(old_lines)
+    new_block_end = old_block_end + delta
+    if new_block_end <= block_start or not _is_item_start(new_lines[block_start], indent):
+        return False
+
+    for num in range(block_start + 1, new_block_end):
+        if _is_block_boundary(new_lines[num], indent):
+            return False
+
+    # all ancestors except the sequence itself must start before the item
+    for ancestor in _get_ancestors(seq):
+        if ancestor.start_pos is None or ancestor.start_pos[0] >= block_start:
+            return False
+    # The sequence usually starts with the dash of its first item, which stays in place.
+    # In some documents the parser moves the start to a later item, within the block
+    # it can't be told where the start moves to
+    if block_start <= seq.start_pos[0] < old_block_end and seq.start_pos != (block_start, indent):
+        return False
+
+    # The block is parsed together with the next meaningful line, since the tokens
+    # of that line define where the nodes of the block end
+    block = new_lines[block_start:new_block_end + 1]
+    if any(char in line for line in block for char in _CONTEXT_DEPENDENT_CHARS):
+        return False
+
+    key_line = old_lines[prop.key.start_pos[0]]
+    header = key_line[prop.key.start_pos[1]:prop.key.end_pos[1]] + ":"
+    partial_doc = "\n".join([header] + block)
+
+    try:
+        yaml_backend.load(partial_doc)
+        partial_tree = Parser(partial_doc, kind=kind).parse()
+    except Exception:
+        return False
+
+    partial_prop = getattr(partial_tree, prop.key.text, None)
+    if partial_prop is None or not isinstance(partial_prop.value, SequenceNode) or not partial_prop.value.nodes:
+        return False
+
+    partial_seq: SequenceNode = partial_prop.value
+    new_item = partial_seq.nodes[0]
+    if type(new_item) is not type(item) or new_item.start_pos != (1, item.start_pos[1]):
+        return False
+
+    # The parser must be in the same state after the item as it was before it.
+    # Otherwise the change affects the nodes after the item as well
+    # line of the partial document following the block, past its end for the last block
+    context_line = new_block_end - block_start + 1
+    if partial_seq.start_pos != (1, indent):
+        return False
+    if new_block_end < len(new_lines) and _is_item_start(new_lines[new_block_end], indent):
+        if len(partial_seq.nodes) != 2 or partial_seq.nodes[1].start_pos != (context_line, indent + 2):
+            return False
+    elif len(partial_seq.nodes) != 1 or new_block_end < len(new_lines) and partial_prop.end_pos != (context_line, 0):
+        return False
+
+    # errors found outside of the item are allowed only on the line following the block
+    new_entries = partial_tree.error_sink.get_entries(new_item)
+    block_errors = {id(error) for error, _ in new_entries}
+    for error in partial_tree.error_sink:
+        if id(error) not in block_errors and error.start_pos[0] < context_line:
+            return False
+
+    # errors located in the old block must come from the item, the parser could attach
+    # some of them to the ancestors and these wouldn't be replaced by the new ones
+    item_errors = {id(error) for error in tree.error_sink.get_errors(item)}
+    for error in tree.error_sink:
+        if id(error) not in item_errors and error.start_pos is not None \
+                and block_start <= error.start_pos[0] < old_block_end:
+            return False
+
+    # the tree could be changed starting from here
+    tree.reset_position_index()
+    offset = block_start - 1
+    _shift_subtree(new_item, offset)
+    for error, _ in new_entries:
+        error.start_pos = _shift_pos(error.start_pos, offset)
+        error.end_pos = _shift_pos(error.end_pos, offset)
+
+    tree.error_sink.remove(item)
+    new_item.parent = seq
+    seq.nodes[index] = new_item
+    seq.reset_hash()
+    for error, origin in new_entries:
+        tree.error_sink.add(error, origin)
+
+    if delta:
+        _shift_subtree(tree, delta, from_line=old_block_end, skip=new_item)
+        for error in tree.error_sink:
+            if id(error) in block_errors:
+                continue
+            if error.start_pos is not None and error.start_pos[0] >= old_block_end:
+                error.start_pos = _shift_pos(error.start_pos, delta)
+            if error.end_pos is not None and error.end_pos[0] >= old_block_end:
+                error.end_pos = _shift_pos(error.end_pos, delta)
+
+    # when the item is the last one in the document, its ancestors end with it
+    if old_block_end == len(old_lines):
+        for ancestor, partial_ancestor in ((seq, partial_seq), (prop, partial_prop), (tree, partial_tree)):
+            ancestor.end_pos = _shift_pos(partial_ancestor.end_pos, offset)
+
+    return True
@@ -1,9 +1,16 @@
-from typing import Tuple
+import functools
+import time
+from dataclasses import dataclass
+from typing import AbstractSet, Dict, Iterable, Iterator, List, Optional, Tuple
+
 import yaml
-from yaml.tokens import (BlockEndToken, BlockEntryToken, BlockMappingStartToken,
-                         BlockSequenceStartToken, KeyToken,
-                         ScalarToken, Token, ValueToken, StreamStartToken, StreamEndToken)
+from yaml.error import MarkedYAMLError
+from yaml.tokens import (AnchorToken, BlockEndToken, BlockEntryToken, BlockMappingStartToken,
+                         BlockSequenceStartToken, FlowMappingEndToken, FlowMappingStartToken,
+                         FlowSequenceEndToken, FlowSequenceStartToken, KeyToken,
+                         ScalarToken, TagToken, Token, ValueToken, StreamStartToken, StreamEndToken)
 
+from server.ats import yaml_backend
 from server.ats.trees.app import AppTree
 from server.ats.trees.blueprint import BlueprintTree
 from server.ats.trees.common import (PropertyNode, YamlNode, TextNode, MappingNode, BaseTree,
@@ -26,28 +33,148 @@ class ParserError(Exception):
     def __str__(self) -> str:
         return f"Parser issue with message '{self.message}' on position {self.start_pos} - {self.end_pos}"
 
+    def __reduce__(self):
+        # errors of the documents parsed in worker processes are sent back pickled
+        return type(self), (self.message, self.start_pos, self.end_pos)
+
+
+@dataclass
+class TokenTiming:
+    count: int = 0
+    seconds: float = 0.0
+
 
 class UnprocessedNode(YamlNode):
+    __slots__ = ()
+
     def add(self):
         return UnprocessedNode()
 
 
+_COLLECTION_START_TOKENS = frozenset({BlockMappingStartToken, BlockSequenceStartToken,
+                                      FlowMappingStartToken, FlowSequenceStartToken})
+_COLLECTION_END_TOKENS = frozenset({BlockEndToken, FlowMappingEndToken, FlowSequenceEndToken})
+# tokens finishing the value of a root-level key
+_ROOT_VALUE_END_TOKENS = frozenset({KeyToken, BlockEndToken, FlowMappingEndToken})
+
+
 class Parser:
-    def __init__(self, document: str):
-        self.document = self._remove_invalid_characters(document)
+    def __init__(self, document: str, kind: str = None, tokens: List[Token] = None,
+                 sections: AbstractSet[str] = None):
+        """Document's kind and tokens could be provided when they are already known
+        to avoid loading and scanning the document one more time. When the sections
+        are provided, only these top-level sections of the document are parsed"""
+        self.document = self.normalize(document)
+        self.tokens = tokens
+        self.sections = sections
         try:
-            self.tree = self._get_tree()
+            self.tree = self._get_tree(kind)
         except ValueError as ve:
             raise ParserError(str(ve))
 
         self.nodes_stack: [YamlNode] = []
         self.tokens_stack: [Token] = []
+        # nodes found to belong to the tree by their ids, the nodes are kept, so the ids are not reused
+        self.tree_nodes: Dict[int, YamlNode] = {id(self.tree): self.tree}
 
         self.is_array_item: bool = False
+        # the error the parsing stopped on in the recovery mode
+        self.error: Optional[NodeError] = None
 
-    def _remove_invalid_characters(self, document: str):
+    @staticmethod
+    def normalize(document: str) -> str:
+        """Removes invalid characters from the document"""
         return document.replace('\t', '  ')
 
+    @staticmethod
+    def find_kind(tokens: Iterable[Token]) -> Optional[str]:
+        """Returns the value of the root-level 'kind' key.
+
+        Tokens are consumed only until the value is found, so the rest of the
+        document isn't scanned at all. Returns None when the root isn't a mapping
+        or it has no 'kind' key with a scalar value"""
+        depth = 0
+        expected = None  # the token type the key-value sequence continues with
+        for token in tokens:
+            if isinstance(token, (BlockMappingStartToken, BlockSequenceStartToken,
+                                  FlowMappingStartToken, FlowSequenceStartToken)):
+                if depth == 0 and not isinstance(token, (BlockMappingStartToken, FlowMappingStartToken)):
+                    return None
+                depth += 1
+                expected = None
+
+            elif isinstance(token, (BlockEndToken, FlowMappingEndToken, FlowSequenceEndToken)):
+                depth -= 1
+                if depth == 0:
+                    return None
+
+            elif depth != 1 or isinstance(token, (AnchorToken, TagToken)):
+                continue
+
+            elif isinstance(token, KeyToken):
+                expected = ScalarToken
+
+            elif isinstance(token, ScalarToken) and expected is ScalarToken:
+                expected = ValueToken if token.value == 'kind' else None
+
+            elif isinstance(token, ValueToken) and expected is ValueToken:
+                expected = "value"
+
+            elif isinstance(token, ScalarToken) and expected == "value":
+                return token.value
+
+            else:
+                expected = None
+
+        return None
+
+    @staticmethod
+    def select_sections(tokens: Iterable[Token], sections: AbstractSet[str]) -> Iterator[Token]:
+        """Drops the tokens of the root-level keys which are not in the sections
+        together with their values. Values are fast-forwarded by tracking the nesting
+        depth of the collections until the next root-level key or the end of the root"""
+        depth = 0
+        skipping = False
+        # root-level key token waiting for the scalar telling its name
+        key = None
+        for token in tokens:
+            token_type = type(token)
+            if skipping:
+                if depth == 1 and token_type in _ROOT_VALUE_END_TOKENS:
+                    skipping = False
+                else:
+                    if token_type in _COLLECTION_START_TOKENS:
+                        depth += 1
+                    elif token_type in _COLLECTION_END_TOKENS:
+                        depth -= 1
+                    continue
+
+            if key is not None:
+                if token_type is ScalarToken and token.value not in sections:
+                    key = None
+                    skipping = True
+                    continue
+                yield key
+                key = None
+
+            if depth == 1 and token_type is KeyToken:
+                key = token
+                continue
+
+            if token_type in _COLLECTION_START_TOKENS:
+                depth += 1
+            elif token_type in _COLLECTION_END_TOKENS:
+                depth -= 1
+            yield token
+
+        if key is not None:
+            yield key
+
+    @staticmethod
+    def get_document_kind(document: str) -> Optional[str]:
+        """Detects the document's kind without loading the whole document"""
+        return Parser.find_kind(yaml_backend.iter_scan(document))
+
     @staticmethod
     def get_token_start(token: Token) -> Tuple[int, int]:
         return token.start_mark.line, token.start_mark.column
@@ -56,6 +183,24 @@ class Parser:
     def get_token_end(token: Token) -> Tuple[int, int]:
         return token.end_mark.line, token.end_mark.column
 
+    def _add_error(self, node: YamlNode, error: NodeError) -> None:
+        """Same as node.add_error(), but the nodes found to belong to the tree are remembered,
+        so the ancestors of the nodes are visited once however many errors are found"""
+        path = []
+        ancestor = node
+        while ancestor is not None and id(ancestor) not in self.tree_nodes:
+            path.append(ancestor)
+            ancestor = ancestor.parent
+
+        if ancestor is None:
+            # errors of the nodes detached from the tree (like the content
+            # of unknown properties) are not collected
+            return
+
+        for visited in path:
+            self.tree_nodes[id(visited)] = visited
+        self.tree.error_sink.add(error, node)
+
     def _handle_hanging_dash(self, token):
         # remove unnecessary empty element added to sequence
         self.nodes_stack.pop()
@@ -65,7 +210,7 @@ class Parser:
             raise ParserError(message="Wrong structure of sequence", token=token)
 
         seq.nodes.pop()
-        seq.add_error(NodeError(
+        self._add_error(seq, NodeError(
             start_pos=self.get_token_start(token),
             end_pos=self.get_token_end(token),
             message="Element could not be empty")
@@ -80,11 +225,12 @@ class Parser:
         node.end_pos = self.get_token_end(token)
 
         if isinstance(node, TextNode):
-            node.text = token.value
+            error = node.set_text(token.value)
+            if error is not None:
+                self._add_error(node, error)
 
         else:
-            # TODO: replace with parser exception
-            raise Exception("Wrong node. Expected TextNode")
+            raise ParserError(message="Wrong node. Expected TextNode", token=token)
 
     def _process_object_child(self, token: ScalarToken):
         """Gets the property of the last Node in a stack and puts
@@ -98,7 +244,7 @@ class Parser:
 
         # TODO: replace with parser exception
         except Exception:
-            node.add_error(NodeError(
+            self._add_error(node, NodeError(
                 start_pos=Parser.get_token_start(token),
                 end_pos=Parser.get_token_end(token),
                 message=f"Parent node doesn't have child with name '{token.value}'"
@@ -113,265 +259,408 @@ class Parser:
         child_node.key.end_pos = self.get_token_end(token)
         self.nodes_stack.append(child_node)
 
+    def _close_property(self, token: Token) -> None:
+        """Key and BlockEnd tokens finish the property on top of the stack"""
+        self.nodes_stack[-1].end_pos = self.get_token_end(token)
+        self.nodes_stack.pop()
+
+        # case with empty value:
+        if isinstance(self.tokens_stack[-1], ValueToken):
+            self.tokens_stack.pop()
+
     def _process_token(self, token: Token) -> None:
-        if (self.nodes_stack and isinstance(self.nodes_stack[-1], PropertyNode)
-                and isinstance(token, (KeyToken, BlockEndToken))):
+        token_type = type(token)
+        try:
+            if (token_type in self._PROPERTY_CLOSING_TOKENS and self.nodes_stack
+                    and isinstance(self.nodes_stack[-1], PropertyNode)):
+                self._close_property(token)
 
-            self.nodes_stack[-1].end_pos = self.get_token_end(token)
-            self.nodes_stack.pop()
+            top_type = type(self.tokens_stack[-1]) if self.tokens_stack else None
+            handler = self._TOKEN_HANDLERS.get((token_type, top_type)) or self._DEFAULT_TOKEN_HANDLERS.get(token_type)
+            if handler is not None:
+                handler(self, token)
 
-            # case with empty value:
-            if isinstance(self.tokens_stack[-1], ValueToken):
-                self.tokens_stack.pop()
+        except IndexError:
+            # handlers expect the stacks to hold the nodes and tokens the token continues,
+            # the token closing or continuing something which wasn't opened empties them
+            raise ParserError(message="Wrong structure of document", token=token)
 
-        # beginning of document
-        if isinstance(token, StreamStartToken):
-            self.tree.start_pos = self.get_token_start(token)
-            self.tokens_stack.append(token)
-            return
+    # beginning and end of the document
 
-        if isinstance(token, BlockEntryToken):
-            # Check if before we didn't have empty array element
-            if isinstance(self.tokens_stack[-1], BlockEntryToken):
-                extra_token = self.tokens_stack.pop()
-                self._handle_hanging_dash(extra_token)
+    def _start_stream(self, token: StreamStartToken) -> None:
+        self.tree.start_pos = self.get_token_start(token)
+        self.tokens_stack.append(token)
 
-            if isinstance(self.nodes_stack[-1], MappingNode):
-                # We are processing the first element of array but sequence wasn't created yet
-                val: YamlNode = self.nodes_stack[-1].get_value()
-                val.start_pos = self.get_token_start(token)
-                self.nodes_stack.append(val)
+    def _end_stream(self, token: StreamEndToken) -> None:
+        self.tree.end_pos = self.get_token_start(token)
 
-            self.tokens_stack.append(token)
+    # sequence items
 
-            self.is_array_item = True
-            # last node in stack must implement add() method
-            try:
-                node = self.nodes_stack[-1].add()
-                self.nodes_stack.append(node)
-            except Exception:
-                raise ParserError(f"Wrong stucture of document", token=token)
-                # raise Exception(f"Unable to add item to the node's container : {e}")
-
-        if isinstance(token, StreamEndToken):
-            self.tree.end_pos = self.get_token_start(token)
-            return
+    def _start_item_after_empty_item(self, token: BlockEntryToken) -> None:
+        # Previous array element was empty
+        extra_token = self.tokens_stack.pop()
+        self._handle_hanging_dash(extra_token)
+        self._start_item(token)
 
-        # the beginning of the object or mapping
-        if isinstance(token, BlockMappingStartToken):
-            last_node = self.nodes_stack[-1]
+    def _start_item(self, token: BlockEntryToken) -> None:
+        if isinstance(self.nodes_stack[-1], MappingNode):
+            # We are processing the first element of array but sequence wasn't created yet
+            val: YamlNode = self.nodes_stack[-1].get_value()
+            val.start_pos = self.get_token_start(token)
+            self.nodes_stack.append(val)
 
-            if isinstance(last_node, MappingNode) and not isinstance(self.tokens_stack[-1], BlockEntryToken):
-                self.tokens_stack.append(token)
-                value_node = last_node.get_value()
-                self.nodes_stack.append(value_node)
-                value_node.start_pos = self.get_token_start(token)
+        self.tokens_stack.append(token)
 
-                if self.is_array_item:
-                    self.is_array_item = False
+        self.is_array_item = True
+        # last node in stack must implement add() method
+        try:
+            node = self.nodes_stack[-1].add()
+            self.nodes_stack.append(node)
+        except Exception:
+            raise ParserError(f"Wrong stucture of document", token=token)
 
-                return
+    # the beginning of the object or mapping
 
-            self.tokens_stack.append(token)
-            last_node.start_pos = self.get_token_start(token)
+    def _start_mapping(self, token: BlockMappingStartToken) -> None:
+        last_node = self.nodes_stack[-1]
 
-        if isinstance(token, BlockSequenceStartToken):
+        if isinstance(last_node, MappingNode):
             self.tokens_stack.append(token)
+            value_node = last_node.get_value()
+            self.nodes_stack.append(value_node)
+            value_node.start_pos = self.get_token_start(token)
+
+            if self.is_array_item:
+                self.is_array_item = False
+
             return
 
-        if isinstance(token, BlockEndToken):
-            top = self.tokens_stack.pop()
+        self._start_item_mapping(token)
 
-            # Handle sequence with last empty element
-            if isinstance(top, BlockEntryToken):
-                self._handle_hanging_dash(top)
-                top = self.tokens_stack.pop()
+    def _start_item_mapping(self, token: BlockMappingStartToken) -> None:
+        self.tokens_stack.append(token)
+        self.nodes_stack[-1].start_pos = self.get_token_start(token)
 
-            # TODO: refactor condition
-            if (isinstance(top, (BlockMappingStartToken, BlockSequenceStartToken))
-                    and isinstance(self.tokens_stack[-1], (ValueToken, BlockEntryToken, StreamStartToken))):
-                node = self.nodes_stack.pop()
-                node.end_pos = self.get_token_end(token)
-                self.tokens_stack.pop()
+    def _push_token(self, token: Token) -> None:
+        self.tokens_stack.append(token)
 
-            elif isinstance(top, ValueToken):
-                if self.is_array_item:
-                    # case when mapping didn't have value after ':'
-                    # inputs:
-                    #   API_PORT: 9090
-                    #   PORT:
-
-                    # remove last Node and ValueToken and BlockEndToken as well
-                    node = self.nodes_stack.pop()
-                    node.end_pos = self.get_token_end(token)
-                    if not isinstance(self.tokens_stack[-1], (BlockMappingStartToken, BlockSequenceStartToken)):
-                        raise Exception("Wrong structure of document")  # TODO: provide better message
-                    self.tokens_stack.pop()
-
-                    if not isinstance(self.tokens_stack[-1], BlockEntryToken):
-                        raise Exception("Wrong structure of document")  # TODO: provide better message
-                    self.tokens_stack.pop()
-                    self.is_array_item = False
-
-                elif isinstance(self.nodes_stack[-1], (UnprocessedNode, SequenceNode)):
-                    # In means that we just finished processing a sequence without indentation
-                    # which means document didn't have BlockSequenceStartToken at the beginning of the block
-                    # So, this BlockEndToken is related to previous object => we need to remove not only the
-                    # List node but also the previous one
-
-                    # first remove sequence node from stack
-                    seq_node = self.nodes_stack.pop()
-                    # in this case it's ok the end pos will be the same for both objects
-                    seq_node.end_pos = self.get_token_end(token)
-
-                    # check if we have property on top
-                    if isinstance(self.nodes_stack[-1], PropertyNode):
-                        self.nodes_stack[-1].end_pos = self.get_token_end(token)
-                        self.nodes_stack.pop()
-
-                    # then check if after ValueToken removal we have any start token on the top of the tokens stack
-                    if not isinstance(self.tokens_stack[-1], (BlockMappingStartToken, BlockSequenceStartToken)):
-                        raise Exception("Wrong structure of document")  # TODO: provide better message
-
-                    # and remove it from the token stack
-                    self.tokens_stack.pop()
-                    # and node itself as well
-                    prev_node = self.nodes_stack.pop()
-                    prev_node.end_pos = self.get_token_end(token)
-
-                    if isinstance(self.tokens_stack[-1], (ValueToken, BlockEntryToken)):
-                        # remove value token opening it
-                        self.tokens_stack.pop()
+    # the end of the block
 
-                else:
-                    # We expected a value for property inside object but it wasn't found after ValueToken
-                    # It means BlockEndToken closes the parent
-                    # Close expected node
-                    node = self.nodes_stack.pop()
-                    node.end_pos = self.get_token_end(token)
-                    # Close parent node
-                    self.nodes_stack[-1].end_pos = self.get_token_end(token)
-                    self.nodes_stack.pop()
-
-        if isinstance(token, KeyToken):
-            # if sequence doesnt have indentation => there is no BlockEndToken at the end
-            # and in such case KeyToken will go just after the ValueToken opening the sequence
-            # It also covers issues when object has empty property
-            if isinstance(self.tokens_stack[-1], ValueToken):
-                # in this case we need first correctly finalize sequence node
-                node = self.nodes_stack.pop()
-                node.end_pos = self.get_token_start(token)
-                self.tokens_stack.pop()  # remove ValueToken
-
-                # and also handle property if exist
-                if isinstance(self.nodes_stack[-1], PropertyNode):
-                    prop = self.nodes_stack.pop()
-                    prop.end_pos = self.get_token_end(token)
-
-            # Case when key followed after sequence with no indentation
-            # and the last element of this sequence was empty
-            if self.is_array_item and isinstance(self.tokens_stack[-1], BlockEntryToken):
-                self._handle_hanging_dash(self.tokens_stack[-1])
-                self.tokens_stack.pop()  # remove BlockEntryToken
-                self.nodes_stack.pop()  # remove sequence
-
-                # and also handle property if exist
-                if isinstance(self.nodes_stack[-1], PropertyNode):
-                    prop = self.nodes_stack.pop()
-                    prop.end_pos = self.get_token_end(token)
+    def _end_block_after_empty_item(self, token: BlockEndToken) -> None:
+        # Handle sequence with last empty element
+        self._handle_hanging_dash(self.tokens_stack.pop())
+        self._end_block(token)
 
-            self.tokens_stack.append(token)
-            return
+    def _end_block(self, token: BlockEndToken) -> None:
+        top = self.tokens_stack.pop()
+        if isinstance(top, ValueToken):
+            self._end_block_without_value(token)
 
-        if isinstance(token, ValueToken):
-            self.tokens_stack.append(token)
-            return
+        elif isinstance(top, (BlockMappingStartToken, BlockSequenceStartToken)):
+            self._end_collection(token)
 
-        if isinstance(token, ScalarToken) and isinstance(self.tokens_stack[-1], ValueToken):
-            node = self.nodes_stack[-1]
-            if isinstance(node, UnprocessedNode):
+    def _end_collection(self, token: BlockEndToken) -> None:
+        # TODO: refactor condition
+        if isinstance(self.tokens_stack[-1], (ValueToken, BlockEntryToken, StreamStartToken)):
+            node = self.nodes_stack.pop()
+            node.end_pos = self.get_token_end(token)
+            self.tokens_stack.pop()
+
+    def _end_block_without_value(self, token: BlockEndToken) -> None:
+        if self.is_array_item:
+            # case when mapping didn't have value after ':'
+            # inputs:
+            #   API_PORT: 9090
+            #   PORT:
+
+            # remove last Node and ValueToken and BlockEndToken as well
+            node = self.nodes_stack.pop()
+            node.end_pos = self.get_token_end(token)
+            if not isinstance(self.tokens_stack[-1], (BlockMappingStartToken, BlockSequenceStartToken)):
+                raise ParserError(message="Wrong structure of document", token=token)
+            self.tokens_stack.pop()
+
+            if not isinstance(self.tokens_stack[-1], BlockEntryToken):
+                raise ParserError(message="Wrong structure of document", token=token)
+            self.tokens_stack.pop()
+            self.is_array_item = False
+
+        elif isinstance(self.nodes_stack[-1], (UnprocessedNode, SequenceNode)):
+            # In means that we just finished processing a sequence without indentation
+            # which means document didn't have BlockSequenceStartToken at the beginning of the block
+            # So, this BlockEndToken is related to previous object => we need to remove not only the
+            # List node but also the previous one
+
+            # first remove sequence node from stack
+            seq_node = self.nodes_stack.pop()
+            # in this case it's ok the end pos will be the same for both objects
+            seq_node.end_pos = self.get_token_end(token)
+
+            # check if we have property on top
+            if isinstance(self.nodes_stack[-1], PropertyNode):
+                self.nodes_stack[-1].end_pos = self.get_token_end(token)
                 self.nodes_stack.pop()
+
+            # then check if after ValueToken removal we have any start token on the top of the tokens stack
+            if not isinstance(self.tokens_stack[-1], (BlockMappingStartToken, BlockSequenceStartToken)):
+                raise ParserError(message="Wrong structure of document", token=token)
+
+            # and remove it from the token stack
+            self.tokens_stack.pop()
+            # and node itself as well
+            prev_node = self.nodes_stack.pop()
+            prev_node.end_pos = self.get_token_end(token)
+
+            if isinstance(self.tokens_stack[-1], (ValueToken, BlockEntryToken)):
+                # remove value token opening it
                 self.tokens_stack.pop()
-                return
-
-            if not isinstance(node, MappingNode):
-                raise ParserError(message="Expected mapping value here", token=token)
-            try:
-                value_node = node.get_value(expected_type=TextNode)
-            except ValueError as e:
-                raise ParserError(message=f"Scalar cannot be accepted here. Object expected", token=token)
-            self.nodes_stack.append(value_node)
 
-            self._process_scalar_token(token)
+        else:
+            # We expected a value for property inside object but it wasn't found after ValueToken
+            # It means BlockEndToken closes the parent
+            # Close expected node
+            node = self.nodes_stack.pop()
+            node.end_pos = self.get_token_end(token)
+            # Close parent node
+            self.nodes_stack[-1].end_pos = self.get_token_end(token)
+            self.nodes_stack.pop()
+
+    # keys
+
+    def _start_key_after_value(self, token: KeyToken) -> None:
+        # if sequence doesnt have indentation => there is no BlockEndToken at the end
+        # and in such case KeyToken will go just after the ValueToken opening the sequence
+        # It also covers issues when object has empty property
+
+        # in this case we need first correctly finalize sequence node
+        node = self.nodes_stack.pop()
+        node.end_pos = self.get_token_start(token)
+        self.tokens_stack.pop()  # remove ValueToken
+
+        # and also handle property if exist
+        if isinstance(self.nodes_stack[-1], PropertyNode):
+            prop = self.nodes_stack.pop()
+            prop.end_pos = self.get_token_end(token)
+
+        if isinstance(self.tokens_stack[-1], BlockEntryToken):
+            self._start_key_after_item(token)
+        else:
+            self.tokens_stack.append(token)
+
+    def _start_key_after_item(self, token: KeyToken) -> None:
+        # Case when key followed after sequence with no indentation
+        # and the last element of this sequence was empty
+        if self.is_array_item:
+            self._handle_hanging_dash(self.tokens_stack[-1])
+            self.tokens_stack.pop()  # remove BlockEntryToken
+            self.nodes_stack.pop()  # remove sequence
+
+            # and also handle property if exist
+            if isinstance(self.nodes_stack[-1], PropertyNode):
+                prop = self.nodes_stack.pop()
+                prop.end_pos = self.get_token_end(token)
+
+        self.tokens_stack.append(token)
+
+    # scalars
+
+    def _process_value_scalar(self, token: ScalarToken) -> None:
+        node = self.nodes_stack[-1]
+        if isinstance(node, UnprocessedNode):
+            self.nodes_stack.pop()
             self.tokens_stack.pop()
+            return
 
-            if self.is_array_item:
-                self.is_array_item = False
+        if not isinstance(node, MappingNode):
+            raise ParserError(message="Expected mapping value here", token=token)
+        try:
+            value_node = node.get_value(expected_type=TextNode)
+        except ValueError as e:
+            raise ParserError(message=f"Scalar cannot be accepted here. Object expected", token=token)
+        self.nodes_stack.append(value_node)
+
+        self._process_scalar_token(token)
+        self.tokens_stack.pop()
+
+        if self.is_array_item:
+            self.is_array_item = False
+
+    def _process_key_scalar(self, token: ScalarToken) -> None:
+        if not self.is_array_item:
+            self._process_object_child(token)
             return
 
-        if isinstance(token, ScalarToken) and isinstance(self.tokens_stack[-1], (KeyToken, BlockEntryToken)):
-            if not self.is_array_item:
-                self._process_object_child(token)
+        node = self.nodes_stack[-1]
 
-            else:
-                node = self.nodes_stack[-1]
+        # process object first
+        if not isinstance(node, (MappingNode, TextNode)):
+            self.is_array_item = False
+            self._process_object_child(token)
+            return
 
-                if isinstance(node, UnprocessedNode) and isinstance(self.tokens_stack[-1], BlockEntryToken):
-                    self.nodes_stack.pop()
-                    self.is_array_item = False
-                    self.tokens_stack.pop()
-                    return
+        if isinstance(node, MappingNode):
+            self.nodes_stack.append(node.get_key())
 
-                # process object first
-                if not isinstance(node, (MappingNode, TextNode)):
-                    self.is_array_item = False
-                    self._process_object_child(token)
-                    return
+        self._process_scalar_token(token)
+        self.tokens_stack.pop()
 
-                if isinstance(node, MappingNode):
-                    key_node = node.get_key()
-                    self.nodes_stack.append(key_node)
+    def _process_item_scalar(self, token: ScalarToken) -> None:
+        if not self.is_array_item:
+            self._process_object_child(token)
+            return
 
-                if isinstance(self.tokens_stack[-1], BlockEntryToken):
-                    # case when element in sequence doesn't have value and colon:
-                    # inputs:
-                    #   - A
-                    #   - B
-                    last_node = self.nodes_stack[-1]  # store TextNode before deleting
-                    self._process_scalar_token(token)
+        node = self.nodes_stack[-1]
 
-                    self.nodes_stack[-1].end_pos = last_node.end_pos
-                    self.nodes_stack[-1].start_pos = last_node.start_pos
+        if isinstance(node, UnprocessedNode):
+            self.nodes_stack.pop()
+            self.is_array_item = False
+            self.tokens_stack.pop()
+            return
+
+        # process object first
+        if not isinstance(node, (MappingNode, TextNode)):
+            self.is_array_item = False
+            self._process_object_child(token)
+            return
 
-                    if isinstance(node, MappingNode):
-                        # Sequence was processed as a list of Mapping Nodes
-                        self.nodes_stack.pop()
+        if isinstance(node, MappingNode):
+            self.nodes_stack.append(node.get_key())
 
-                    self.is_array_item = False
+        # case when element in sequence doesn't have value and colon:
+        # inputs:
+        #   - A
+        #   - B
+        last_node = self.nodes_stack[-1]  # store TextNode before deleting
+        self._process_scalar_token(token)
 
-                else:
-                    self._process_scalar_token(token)
+        self.nodes_stack[-1].end_pos = last_node.end_pos
+        self.nodes_stack[-1].start_pos = last_node.start_pos
 
-                self.tokens_stack.pop()
+        if isinstance(node, MappingNode):
+            # Sequence was processed as a list of Mapping Nodes
+            self.nodes_stack.pop()
+
+        self.is_array_item = False
+        self.tokens_stack.pop()
 
-    def parse(self) -> BaseTree:
-        data = yaml.scan(self.document, Loader=yaml.FullLoader)
+    def _process_unexpected_token(self, token: Token) -> None:
+        # the root block has been already closed
+        raise ParserError(message="Wrong structure of document", token=token)
+
+    # Handlers of the tokens keyed on the token type and the type of the token
+    # on top of the tokens stack. Default handlers are used for the rest of the
+    # tokens stack states. Tokens without handlers are skipped
+    _TOKEN_HANDLERS = {
+        (StreamStartToken, None): _start_stream,
+        (BlockEntryToken, BlockEntryToken): _start_item_after_empty_item,
+        (BlockMappingStartToken, BlockEntryToken): _start_item_mapping,
+        (BlockEndToken, BlockEntryToken): _end_block_after_empty_item,
+        (KeyToken, ValueToken): _start_key_after_value,
+        (KeyToken, BlockEntryToken): _start_key_after_item,
+        (ScalarToken, ValueToken): _process_value_scalar,
+        (ScalarToken, KeyToken): _process_key_scalar,
+        (ScalarToken, BlockEntryToken): _process_item_scalar,
+        (BlockEntryToken, None): _process_unexpected_token,
+        (BlockMappingStartToken, None): _process_unexpected_token,
+        (BlockEndToken, None): _process_unexpected_token,
+        (KeyToken, None): _process_unexpected_token,
+        (ScalarToken, None): _process_unexpected_token,
+    }
+
+    _DEFAULT_TOKEN_HANDLERS = {
+        StreamEndToken: _end_stream,
+        BlockEntryToken: _start_item,
+        BlockMappingStartToken: _start_mapping,
+        BlockSequenceStartToken: _push_token,
+        BlockEndToken: _end_block,
+        KeyToken: _push_token,
+        ValueToken: _push_token,
+    }
+
+    _PROPERTY_CLOSING_TOKENS = (KeyToken, BlockEndToken)
+
+    def parse(self, timings: Dict[str, TokenTiming] = None, recover: bool = False) -> BaseTree:
+        """Builds the tree of the document. When the 'timings' dict is provided,
+        the time spent on processing each type of tokens is collected into it.
+
+        In the recovery mode an error doesn't make the whole tree lost: the part of
+        the tree built before the error is returned with the error attached to it.
+        The error itself is kept in the 'error' attribute of the parser"""
+        data = self.tokens if self.tokens is not None else yaml_backend.scan(self.document)
+        if self.sections is not None:
+            data = self.select_sections(data, self.sections)
         self.nodes_stack.append(self.tree)
 
-        for token in data:
-            self._process_token(token)
+        process_token = self._process_token
+        if timings is not None:
+            process_token = functools.partial(self._process_token_timed, timings=timings)
+
+        token = None
+        try:
+            for token in data:
+                process_token(token)
+
+        except Exception as e:
+            if recover:
+                self._recover(e, token)
+            else:
+                if not isinstance(e, yaml.YAMLError):
+                    self._check_document()
+                raise
 
         return self.tree
 
-    def _get_tree(self) -> BaseTree:
+    def _check_document(self) -> None:
+        """Raises the error of the YAML loader when the document is invalid.
+
+        The document isn't loaded up front, so the structure errors the scanner
+        doesn't detect are surfaced only once the tokens can't be built into a tree"""
+        yaml_backend.load(self.document)
+
+    def _process_token_timed(self, token: Token, timings: Dict[str, TokenTiming]) -> None:
+        started = time.perf_counter()
+        self._process_token(token)
+        elapsed = time.perf_counter() - started
+
+        timing = timings.setdefault(type(token).__name__, TokenTiming())
+        timing.count += 1
+        timing.seconds += elapsed
+
+    def _recover(self, error: Exception, last_token: Optional[Token]) -> None:
+        """Closes all the nodes which were being processed when the error happened
+        and attaches the error to the deepest of them"""
+        if isinstance(error, ParserError) and error.start_pos is not None:
+            start_pos, end_pos, message = error.start_pos, error.end_pos, error.message
+        elif isinstance(error, MarkedYAMLError) and error.problem_mark is not None:
+            start_pos = end_pos = (error.problem_mark.line, error.problem_mark.column)
+            message = error.problem
+        elif last_token is not None:
+            start_pos, end_pos, message = self.get_token_start(last_token), self.get_token_end(last_token), str(error)
+        else:
+            start_pos = end_pos = (0, 0)
+            message = str(error)
+
+        self.error = NodeError(start_pos=start_pos, end_pos=end_pos, message=message)
+
+        nodes = [node for node in self.nodes_stack if not isinstance(node, UnprocessedNode)] or [self.tree]
+        for node in nodes:
+            if node.start_pos is None:
+                node.start_pos = start_pos
+            if node.end_pos is None:
+                node.end_pos = start_pos
+
+        self._add_error(nodes[-1], self.error)
+
+    def _get_tree(self, doc_type: str = None) -> BaseTree:
         trees = {
             'application': AppTree,
             'blueprint': BlueprintTree,
             'TerraForm': ServiceTree
         }
 
-        yaml_obj = yaml.load(self.document, Loader=yaml.FullLoader)
-        doc_type = yaml_obj.get('kind', '')
+        if doc_type is None:
+            tokens = self.tokens if self.tokens is not None else yaml_backend.iter_scan(self.document)
+            doc_type = self.find_kind(tokens) or ''
 
         if doc_type not in trees:
             raise ValueError(f"Unable to initialize tree from document kind '{doc_type}'")
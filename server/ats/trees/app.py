@@ -1,27 +1,26 @@
 from abc import ABC
-from dataclasses import dataclass
-from server.ats.trees.common import (BaseTree, ResourceMappingNode, SequenceNode,
+from server.ats.trees.common import (slotted_dataclass, BaseTree, ResourceMappingNode, SequenceNode,
                                      TextNode, TreeWithOutputs, ScalarNode, ObjectNode)
 
 
-@dataclass
+@slotted_dataclass
 class DebuggingNode(ObjectNode):
     allow_direct_access: ScalarNode = None
     connection_protocol: ScalarNode = None
 
 
-@dataclass
+@slotted_dataclass
 class SpecNode(ObjectNode):
-    @dataclass
+    @slotted_dataclass
     class KubernetesSpecNode(ObjectNode):
         cpu: TextNode = None
         ram: TextNode = None
 
-    @dataclass
+    @slotted_dataclass
     class AwsSpecNode(ObjectNode):
         instance_type: TextNode = None
 
-    @dataclass
+    @slotted_dataclass
     class AzureSpecNode(ObjectNode):
         vm_size: TextNode = None
 
@@ -30,7 +29,7 @@ class SpecNode(ObjectNode):
     kubernetes: KubernetesSpecNode = None
 
 
-@dataclass
+@slotted_dataclass
 class IngressHealthCheckNode(ObjectNode):
     healthy_threshold: ScalarNode = None
     interval: ScalarNode = None
@@ -39,7 +38,8 @@ class IngressHealthCheckNode(ObjectNode):
     timeout: ScalarNode = None
     unhealthy_threshold: ScalarNode = None
 
-    def _get_field_mapping(self) -> {str: str}:
+    @classmethod
+    def _get_field_mapping(cls) -> {str: str}:
         mapping = super()._get_field_mapping()
         mapping.update({
             "healthy-threshold": "healthy_threshold",
@@ -49,18 +49,19 @@ class IngressHealthCheckNode(ObjectNode):
         return mapping
 
 
-@dataclass
+@slotted_dataclass
 class PortInfoNode(ObjectNode):
     port: TextNode = None
     path: TextNode = None
 
 
-@dataclass
+@slotted_dataclass
 class PortInfoInternalNode(PortInfoNode):
     ingress_healthcheck: IngressHealthCheckNode = None
     port_range: TextNode = None
 
-    def _get_field_mapping(self) -> {str: str}:
+    @classmethod
+    def _get_field_mapping(cls) -> {str: str}:
         mapping = super()._get_field_mapping()
         mapping.update({
             "port-range": "port_range",
@@ -69,42 +70,42 @@ class PortInfoInternalNode(PortInfoNode):
         return mapping
 
 
-@dataclass
+@slotted_dataclass
 class ExternalPortInfoMappingNode(ResourceMappingNode):
     value: PortInfoNode = None
 
 
-@dataclass
+@slotted_dataclass
 class InternalPortInfoMappingNode(ResourceMappingNode):
     value: PortInfoInternalNode = None
 
 
-@dataclass
+@slotted_dataclass
 class InfrastructureNode(ObjectNode):
-    @dataclass
+    @slotted_dataclass
     class ComputeNode(ObjectNode):
         spec: SpecNode = None
 
-    @dataclass
+    @slotted_dataclass
     class ConnectivityNode(ObjectNode):
-        @dataclass
+        @slotted_dataclass
         class ExternalPortsSequenceNode(SequenceNode):
             node_type = ExternalPortInfoMappingNode
 
-        @dataclass
+        @slotted_dataclass
         class InternalPortsSequenceNode(SequenceNode):
             node_type = InternalPortInfoMappingNode
 
         external: ExternalPortsSequenceNode = None
         internal: InternalPortsSequenceNode = None
 
-    @dataclass
+    @slotted_dataclass
     class InfraPermissionsNode(ObjectNode):
-        @dataclass
+        @slotted_dataclass
         class InfraAwsPermissionsNode(ObjectNode):
             iam_instance_profile: TextNode = None
 
-        @dataclass
+        @slotted_dataclass
         class InfraAzurePermissionsNode(ObjectNode):
             managed_identity_id: TextNode = None
 
@@ -116,17 +117,17 @@ class InfrastructureNode(ObjectNode):
     permissions: InfraPermissionsNode = None
 
 
-@dataclass
+@slotted_dataclass
 class ConfigurationNode(ObjectNode):
-    @dataclass
+    @slotted_dataclass
     class InitializationNode(ObjectNode):
         script: ScalarNode = None
 
-    @dataclass
+    @slotted_dataclass
     class StartNode(InitializationNode):
         command: ScalarNode = None
 
-    @dataclass
+    @slotted_dataclass
     class HealthcheckNode(InitializationNode):
         timeout: ScalarNode = None
         wait_for_ports: TextNode = None
@@ -136,29 +137,29 @@ class ConfigurationNode(ObjectNode):
     healthcheck: HealthcheckNode = None
 
 
-@dataclass
+@slotted_dataclass
 class AmiImageNode(ObjectNode):
     id: TextNode = None
     region: ScalarNode = None
     username: TextNode = None
 
 
-@dataclass
+@slotted_dataclass(mixin=True)
 class AzureImageProps(ABC):
     subscription_id: TextNode = None
     resource_group: TextNode = None
     image: TextNode = None
 
 
-@dataclass
+@slotted_dataclass
 class AzureImageNode(ObjectNode):
-    @dataclass
+    @slotted_dataclass
     class AzureGalleryImageNode(AzureImageProps, ObjectNode):
         shared_image_gallery: TextNode = None
         image_definition: TextNode = None
         image_version: TextNode = None
 
-    @dataclass
+    @slotted_dataclass
     class AzureCustomImageNode(AzureImageProps, ObjectNode):
         image: TextNode = None
 
@@ -169,7 +170,7 @@ class AzureImageNode(ObjectNode):
     custom: TextNode = None
 
 
-@dataclass
+@slotted_dataclass
 class DockerImageNode(ObjectNode):
     name: TextNode = None
     pull_secret: TextNode = None
@@ -177,24 +178,24 @@ class DockerImageNode(ObjectNode):
     username: TextNode = None
 
 
-@dataclass
+@slotted_dataclass
 class AmiSequenceNode(SequenceNode):
     node_type = AmiImageNode
 
 
-@dataclass
+@slotted_dataclass
 class AzureSequenceNode(SequenceNode):
     node_type = AzureImageNode
 
 
-@dataclass
+@slotted_dataclass
 class DockerImagesSequence(SequenceNode):
     node_type = DockerImageNode
 
 
-@dataclass
+@slotted_dataclass
 class SourceNode(ObjectNode):
-    @dataclass
+    @slotted_dataclass
     class ImageNode(ObjectNode):
         ami: AmiSequenceNode = None
         azure_image: AzureSequenceNode = None
@@ -204,7 +205,7 @@ class SourceNode(ObjectNode):
     os_type: ScalarNode = None
 
 
-@dataclass
+@slotted_dataclass
 class AppTree(TreeWithOutputs, BaseTree):
     configuration: ConfigurationNode = None
     source: SourceNode = None
@@ -1,17 +1,16 @@
-from dataclasses import dataclass
-from server.ats.trees.common import (BaseTree, ScalarMappingsSequence, MappingNode, SequenceNode, TextMapping,
+from server.ats.trees.common import (slotted_dataclass, BaseTree, ScalarMappingsSequence, MappingNode, SequenceNode, TextMapping,
                                      TextMappingSequence, TextNode, ScalarNodesSequence, ScalarNode,
                                      TextNodesSequence, ObjectNode)
 from typing import List, Union
 
 
-@dataclass
+@slotted_dataclass
 class InfrastructureNode(ObjectNode):
-    @dataclass
+    @slotted_dataclass
     class ConnectivityNode(ObjectNode):
-        @dataclass
+        @slotted_dataclass
         class VirtualNetwork(ObjectNode):
-            @dataclass
+            @slotted_dataclass
             class SubnetsNode(ObjectNode):
                 gateway: TextNodesSequence = None
                 management: TextNodesSequence = None
@@ -27,7 +26,7 @@ class InfrastructureNode(ObjectNode):
     connectivity: ConnectivityNode = None
 
 
-@dataclass
+@slotted_dataclass
 class RuleNode(ObjectNode):
     path: ScalarNode = None
     host: ScalarNode = None
@@ -41,9 +40,9 @@ class RuleNode(ObjectNode):
     stickiness: TextNode = None
 
 
-@dataclass
+@slotted_dataclass
 class ListenerNode(ObjectNode):
-    @dataclass
+    @slotted_dataclass
     class RulesSequenceNode(SequenceNode):
         node_type = RuleNode
 
@@ -54,9 +53,9 @@ class ListenerNode(ObjectNode):
     rules: RulesSequenceNode = None
 
 
-@dataclass
+@slotted_dataclass
 class IngressNode(ObjectNode):
-    @dataclass
+    @slotted_dataclass
     class ListenersSequenceNode(SequenceNode):
         node_type = ListenerNode
 
@@ -64,7 +63,7 @@ class IngressNode(ObjectNode):
     listeners: ListenersSequenceNode = None
 
 
-@dataclass
+@slotted_dataclass
 class BlueprintFullInputNode(ObjectNode):
     display_style: ScalarNode = None
     description: ScalarNode = None
@@ -72,7 +71,7 @@ class BlueprintFullInputNode(ObjectNode):
     optional: ScalarNode = None
 
 
-@dataclass
+@slotted_dataclass
 class BlueprintInputNode(MappingNode):
     key: ScalarNode = None
     value: Union[BlueprintFullInputNode, ScalarNode] = None
@@ -86,12 +85,12 @@ class BlueprintInputNode(MappingNode):
             return self.value
 
 
-@dataclass
+@slotted_dataclass
 class BlueprintInputsSequence(SequenceNode):
     node_type = BlueprintInputNode
 
 
-@dataclass
+@slotted_dataclass
 class ServiceResourceNode(ObjectNode):
     input_values: TextMappingSequence = None
     depends_on: ScalarNodesSequence = None
@@ -103,13 +102,13 @@ class ServiceResourceNode(ObjectNode):
         return self._get_seq_nodes("input_values")
         
 
-@dataclass
+@slotted_dataclass
 class ApplicationResourceNode(ServiceResourceNode):
     target: ScalarNode = None
     instances: TextNode = None  # yes, numeric
 
 
-@dataclass
+@slotted_dataclass
 class BlueprintResourceMappingNode(MappingNode):
     key: ScalarNode = None
     value: ServiceResourceNode = None
@@ -135,32 +134,32 @@ class BlueprintResourceMappingNode(MappingNode):
         return self.value.get_inputs()
 
 
-@dataclass
+@slotted_dataclass
 class ApplicationNode(BlueprintResourceMappingNode):
     value: ApplicationResourceNode = None
 
 
-@dataclass
+@slotted_dataclass
 class ServiceNode(BlueprintResourceMappingNode):
     value: ServiceResourceNode = None
 
 
-@dataclass
+@slotted_dataclass
 class BlueprintTree(BaseTree):
-    @dataclass
+    @slotted_dataclass
     class MetadataNode(ObjectNode):
         description: ScalarNode = None
         tags: ScalarMappingsSequence = None
 
-    @dataclass
+    @slotted_dataclass
     class AppsSequence(SequenceNode):
         node_type = ApplicationNode
 
-    @dataclass
+    @slotted_dataclass
     class ServicesSequence(SequenceNode):
         node_type = ServiceNode
 
-    @dataclass
+    @slotted_dataclass
     class DebuggingNode(ObjectNode):
         bastion_availability: ScalarNode = None
         direct_access: ScalarNode = None
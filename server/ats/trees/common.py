@@ -1,10 +1,13 @@
+import hashlib
 from abc import ABC
-from dataclasses import dataclass, field
-from typing import Any, List, Optional, ClassVar, Tuple
-import re
+from dataclasses import dataclass, field, fields
+from typing import Any, Dict, List, Optional, ClassVar, Tuple
 
 from pygls.lsp import types
 
+from server.ats.trees.position_index import PositionIndex
+from server.ats.trees.variables import Span, VariableRef, tokenize_text
+
 
 # TODO: refactor all the code to use this class
 @dataclass
@@ -51,20 +54,261 @@ class NodeError(Exception):
     end_pos: Tuple[int, int]
     message: str
 
+    def __reduce__(self):
+        # exceptions are pickled with their args, which are not set by the dataclass constructor
+        return type(self), (self.start_pos, self.end_pos, self.message)
+
+
+class ErrorSink:
+    """
+    Collects the errors found in a tree. Every error is stored once
+    together with the node it was found in. Errors are indexed by these
+    nodes, so errors of a subtree are selected by walking the subtree only.
+    """
+
+    def __init__(self):
+        # entries by their sequence numbers, in the order they were added
+        self._entries: Dict[int, Tuple[NodeError, "YamlNode"]] = {}
+        # id of the node -> sequence numbers of the entries found in it,
+        # the entries keep the nodes alive, so the ids are not reused
+        self._by_node: Dict[int, List[int]] = {}
+        self._next = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __iter__(self):
+        return (error for error, _ in self._entries.values())
+
+    def add(self, error: NodeError, node: "YamlNode") -> None:
+        self._entries[self._next] = (error, node)
+        self._by_node.setdefault(id(node), []).append(self._next)
+        self._next += 1
+
+    def _get_keys(self, root: "YamlNode") -> List[int]:
+        """Returns the sequence numbers of the entries found in the node and its descendants"""
+        keys = []
+        if not self._by_node:
+            return keys
+
+        stack = [root]
+        while stack:
+            node = stack.pop()
+            node_keys = self._by_node.get(id(node))
+            if node_keys is not None:
+                keys.extend(node_keys)
+            stack.extend(node.get_children())
+
+        keys.sort()
+        return keys
+
+    def get_entries(self, node: "YamlNode" = None) -> List[Tuple[NodeError, "YamlNode"]]:
+        """Returns (error, node it was found in) pairs for the errors found
+        in the node and its descendants (all the errors if node is not provided)"""
+        if node is None:
+            return list(self._entries.values())
+
+        return [self._entries[key] for key in self._get_keys(node)]
+
+    def get_errors(self, node: "YamlNode" = None) -> List[NodeError]:
+        return [error for error, _ in self.get_entries(node)]
+
+    def remove(self, node: "YamlNode") -> List[NodeError]:
+        """Removes the errors found in the node and its descendants and returns them"""
+        removed = []
+        for key in self._get_keys(node):
+            error, origin = self._entries.pop(key)
+            self._by_node.pop(id(origin), None)
+            removed.append(error)
+
+        return removed
+
+
+def _replace_class_cells(namespace: dict, old_cls: type, new_cls: type) -> None:
+    """Makes methods using super() without arguments refer to the recreated class"""
+    for value in namespace.values():
+        if isinstance(value, (classmethod, staticmethod)):
+            value = value.__func__
+        functions = [value.fget, value.fset, value.fdel] if isinstance(value, property) else [value]
+        for func in functions:
+            for cell in getattr(func, "__closure__", None) or ():
+                try:
+                    if cell.cell_contents is old_cls:
+                        cell.cell_contents = new_cls
+                except ValueError:
+                    # empty cell
+                    pass
+
+
+def slotted_dataclass(cls: type = None, *, mixin: bool = False):
+    """Works as @dataclass, but the class stores its fields in __slots__
+    instead of a per-instance __dict__.
+
+    Mixins (classes combined with another node class in multiple inheritance)
+    get empty slots, their fields are stored in the slots of the subclasses"""
+    def wrap(cls: type) -> type:
+        cls = dataclass(cls)
+
+        inherited = set()
+        for base in cls.__mro__[1:]:
+            inherited.update(base.__dict__.get("__slots__", ()))
+
+        names = [f.name for f in fields(cls)]
+        namespace = dict(cls.__dict__)
+        # defaults are kept by __init__, class attributes would conflict with the slots
+        for name in names:
+            namespace.pop(name, None)
+        namespace.pop("__dict__", None)
+        namespace.pop("__weakref__", None)
+        namespace["__slots__"] = () if mixin else tuple(name for name in names if name not in inherited)
+
+        slotted_cls = type(cls)(cls.__name__, cls.__bases__, namespace)
+        slotted_cls.__qualname__ = cls.__qualname__
+        _replace_class_cells(namespace, cls, slotted_cls)
+        return slotted_cls
+
+    return wrap if cls is None else wrap(cls)
+
 
 @dataclass
+class NodeSchema:
+    """Facts about the fields of a node class resolved once per class"""
+
+    # attribute -> annotated type
+    field_types: Dict[str, Any]
+    # attributes holding child nodes
+    child_fields: Tuple[str, ...]
+    # name of the child in the document -> attribute
+    attributes: Dict[str, str]
+    # attribute -> name of the child in the document
+    names: Dict[str, str]
+    # attribute -> members of its Union annotation
+    union_types: Dict[str, tuple]
+    # attribute -> allow_vars of the annotated class (only for text nodes)
+    allow_vars: Dict[str, bool]
+    # attribute -> names of the fields of the annotated node class
+    value_fields: Dict[str, frozenset]
+    _resolved: Dict[Tuple[str, Optional[type]], type] = field(default_factory=dict, repr=False)
+
+    def resolve_class(self, attr: str, expected: type = None) -> type:
+        """Returns the class the value of the attribute must be created with.
+        When the attribute has Union annotation, the first member derived from
+        expected type is used (or just the first member, if expected type is not provided)"""
+        key = (attr, expected)
+        try:
+            return self._resolved[key]
+        except KeyError:
+            pass
+
+        value_class = self.field_types[attr]
+        possible_types = self.union_types.get(attr)
+
+        result_class = None
+        if expected is not None and expected != value_class:
+            if possible_types:
+                for pt in possible_types:
+                    if issubclass(pt, expected):
+                        result_class = pt
+                        break
+            elif isinstance(value_class, type) and issubclass(value_class, expected):
+                result_class = value_class
+            else:
+                raise ValueError(f"Mapping value cannot be initiated with type '{expected}'")
+
+        else:
+            result_class = value_class if not possible_types else possible_types[0]
+
+        self._resolved[key] = result_class
+        return result_class
+
+
+def _get_relative_pos(pos: Optional[Tuple[int, int]], origin: Optional[Tuple[int, int]]) -> Optional[Tuple[int, int]]:
+    if pos is None or origin is None:
+        return pos
+    return pos[0] - origin[0], pos[1] - origin[1]
+
+
+def _get_digest(*parts) -> int:
+    """Stable digest of the parts (strings, numbers and tuples of them). Unlike hash()
+    it has no collisions in practice, so equal digests mean equal subtrees"""
+    digest = hashlib.blake2b(repr(parts).encode("utf-8", "surrogatepass"), digest_size=16).digest()
+    return int.from_bytes(digest, "big")
+
+
+# node class -> its schema
+_SCHEMAS: Dict[type, NodeSchema] = {}
+
+
+def get_node_schema(node_cls: type) -> NodeSchema:
+    schema = _SCHEMAS.get(node_cls)
+    if schema is not None:
+        return schema
+
+    field_types = {f.name: f.type for f in fields(node_cls)}
+    child_fields = tuple(name for name in field_types if name not in node_cls.non_child_attributes)
+
+    attributes = {name: name for name in child_fields}
+    names = dict(attributes)
+    get_field_mapping = getattr(node_cls, "_get_field_mapping", None)
+    if get_field_mapping is not None:
+        for key, attr in get_field_mapping().items():
+            attributes.setdefault(key, attr)
+            names[attr] = key
+
+    union_types = {}
+    allow_vars = {}
+    value_fields = {}
+    for name, field_type in field_types.items():
+        args = getattr(field_type, "__args__", None)
+        if args:
+            union_types[name] = args
+        if isinstance(field_type, type):
+            if issubclass(field_type, TextNode):
+                allow_vars[name] = field_type.allow_vars
+            if hasattr(field_type, "__dataclass_fields__"):
+                value_fields[name] = frozenset(field_type.__dataclass_fields__)
+
+    schema = NodeSchema(
+        field_types=field_types,
+        child_fields=child_fields,
+        attributes=attributes,
+        names=names,
+        union_types=union_types,
+        allow_vars=allow_vars,
+        value_fields=value_fields
+    )
+    _SCHEMAS[node_cls] = schema
+    return schema
+
+
+@slotted_dataclass
 class YamlNode(ABC):
-    non_child_attributes: ClassVar[list] = ["start_pos", "end_pos", "parent", "errors"]
+    non_child_attributes: ClassVar[list] = ["start_pos", "end_pos", "parent", "_hash"]
 
     start_pos: tuple = None
     end_pos: tuple = None
     parent: Optional[Any] = None  # TODO: must be Node, not any
-    errors: List[NodeError] = field(default_factory=list)
+
+    @property
+    def errors(self) -> List[NodeError]:
+        """Errors found in the node and its descendants"""
+        sink = self.get_error_sink()
+        return sink.get_errors(self) if sink is not None else []
+
+    def get_error_sink(self) -> Optional[ErrorSink]:
+        """Returns the errors collector of the tree the node belongs to"""
+        node = self
+        while node.parent is not None:
+            node = node.parent
+
+        return node.error_sink if isinstance(node, BaseTree) else None
 
     def add_error(self, error: NodeError) -> None:
-        self.errors.append(error)
-        if self.parent is not None:
-            self.parent.add_error(error)
+        # errors of the nodes detached from a tree (like the content of
+        # unknown properties) are not collected
+        sink = self.get_error_sink()
+        if sink is not None:
+            sink.add(error, self)
 
     def accept(self, visitor):
         v = visitor.visit_node(self)
@@ -75,13 +319,40 @@ class YamlNode(ABC):
 
     def get_children(self):
         return []
-        
 
-@dataclass
+    def get_hash(self) -> int:
+        """Structural hash of the subtree. It's a digest of the types, texts and
+        relative positions of the nodes, so it doesn't change when the whole
+        subtree is moved in the document"""
+        start = self.start_pos
+        children = tuple(
+            (child.get_hash(), _get_relative_pos(child.start_pos, start), _get_relative_pos(child.end_pos, start))
+            for child in self.get_children()
+        )
+        return _get_digest(type(self).__qualname__, _get_relative_pos(self.end_pos, start), children)
+
+    def reset_hash(self) -> None:
+        """Resets the hashes cached by the node and its ancestors.
+        Must be called when the subtree is changed"""
+        node = self
+        while node is not None:
+            if isinstance(node, (SequenceNode, ObjectNode)):
+                node._hash = None
+            node = node.parent
+
+
+@slotted_dataclass
 class SequenceNode(YamlNode):
     node_type: ClassVar[type] = YamlNode
 
     nodes: [node_type] = field(default_factory=list)
+    _hash: Optional[int] = field(default=None, repr=False, compare=False)
+
+    def get_hash(self) -> int:
+        if self._hash is None:
+            self._hash = super().get_hash()
+
+        return self._hash
 
     def add(self, node: node_type = None):
         if node is None:
@@ -95,11 +366,13 @@ class SequenceNode(YamlNode):
         return self.nodes
 
 
-@dataclass
+@slotted_dataclass
 # Could be extended by VariableNote (for $VAR), PathNode(for artifacts), DoubleQuoted, SingleQuoted etc
 class TextNode(YamlNode):
     allow_vars: ClassVar[bool] = True
     _text: str = ""
+    # literal parts and variable references of the text, kept only for the texts with variables
+    _spans: Optional[Tuple[Span, ...]] = field(default=None, repr=False, compare=False)
 
     @property
     def text(self):
@@ -107,33 +380,63 @@ class TextNode(YamlNode):
 
     @text.setter
     def text(self, v: str):
+        error = self.set_text(v)
+        if error is not None:
+            self.add_error(error)
+
+    def set_text(self, v: str) -> Optional[NodeError]:
+        """Sets the text and returns the validation error instead of adding it to the node"""
+        self._text = v
+        self._spans = tokenize_text(v, self.start_pos) if "$" in v else None
         try:
             self._validate(v)
         except NodeError as e:
-            self.add_error(e)
-        self._text = v
+            return e
+
+        return None
+
+    @property
+    def spans(self) -> Tuple[Span, ...]:
+        """Literal parts and variable references of the text with their positions in the document"""
+        if self._spans is None:
+            return tokenize_text(self._text, self.start_pos)
+
+        return self._spans
+
+    def get_variables(self) -> List[VariableRef]:
+        if self._spans is None:
+            return []
+
+        return [span for span in self._spans if isinstance(span, VariableRef)]
+
+    def get_hash(self) -> int:
+        return _get_digest(type(self).__qualname__, _get_relative_pos(self.end_pos, self.start_pos), self._text)
+
+    def update_spans(self) -> None:
+        """Recalculates positions of the spans after the node was moved"""
+        if self._spans is not None:
+            self._spans = tokenize_text(self._text, self.start_pos)
 
     def _validate(self, v: str):
         pass
 
 
 class ScalarNode(TextNode):
+    __slots__ = ()
     allow_vars = False
 
     def _validate(self, v: str):
-        regex = re.compile("(\$\{.+?\}|^\$.+?$)")
-        # find first
-        m = regex.search(v)
-        if m and self.allow_vars is False:
-            offset = m.span()
-            raise NodeError(
-                start_pos=(self.start_pos[0], self.start_pos[1] + offset[0]),
-                end_pos=(self.end_pos[0], self.end_pos[1] + offset[1]),
-                message="Variables are not allowed here"
-            )
+        if self.allow_vars is False:
+            variables = self.get_variables()
+            if variables:
+                raise NodeError(
+                    start_pos=variables[0].start_pos,
+                    end_pos=variables[0].end_pos,
+                    message="Variables are not allowed here"
+                )
 
 
-@dataclass
+@slotted_dataclass
 class MappingNode(YamlNode):  # TODO: actually all torque nodes must inherit this
     key: ScalarNode = None
     value: YamlNode = None
@@ -141,7 +444,7 @@ class MappingNode(YamlNode):  # TODO: actually all torque nodes must inherit thi
 
     def get_key(self):
         if self.key is None:
-            key_class = self.__dataclass_fields__['key'].type
+            key_class = get_node_schema(type(self)).field_types['key']
             self.key = key_class(parent=self)
 
         return self.key
@@ -152,8 +455,7 @@ class MappingNode(YamlNode):  # TODO: actually all torque nodes must inherit thi
         When value has Union typing annotation it will try to initialize it with provided expected_type
         If expected_type is not provided, first type from Union will be used"""
         if self.value is None:
-            value_class = self.__dataclass_fields__['value'].type
-            result_class = self._get_annotated_class(value_class=value_class, expected=expected_type)
+            result_class = get_node_schema(type(self)).resolve_class('value', expected=expected_type)
             self.value = result_class(parent=self.key)
 
         return self.value
@@ -167,32 +469,12 @@ class MappingNode(YamlNode):  # TODO: actually all torque nodes must inherit thi
 
         return children
 
-    def _get_annotated_class(self, value_class: type, expected: type = None) -> type:
-        try:
-            possible_types = value_class.__args__  # check if it's union
-
-        except AttributeError:
-            possible_types = None
-
-        result_class = None
-        if expected is not None and expected != value_class:
-            if possible_types:
-                for pt in possible_types:
-                    if issubclass(pt, expected):
-                        result_class = pt
-                        break
-            elif isinstance(value_class, type) and issubclass(value_class, expected):
-                result_class = value_class
-            else:
-                raise ValueError(f"Mapping value cannot be initiated with type '{expected}'")
-
-        else:
-            result_class = value_class if not possible_types else possible_types[0]
-
-        return result_class
-
 
+@slotted_dataclass
 class PropertyNode(MappingNode):
+    # set for properties holding text values
+    allow_vars: bool = False
+
     @property
     def identifier(self):
         if self.key:
@@ -200,20 +482,24 @@ class PropertyNode(MappingNode):
 
     def get_value(self, expected_type: type = None):
         if self.value is None:
-            value_class = self.parent.__dataclass_fields__[self.identifier].type
-            result_class = self._get_annotated_class(value_class=value_class, expected=expected_type)
+            result_class = get_node_schema(type(self.parent)).resolve_class(self.identifier, expected=expected_type)
             self.value = result_class(parent=self.key)
 
         return self.value
 
     def __getattr__(self, name: str) -> Any:
+        if name.startswith("__"):
+            # special lookups (like the ones made by pickle) are not delegated to the value,
+            # slots of the node are not initialized yet during unpickling
+            raise AttributeError(name)
+
         val = getattr(self.value, name, None)
 
         if val:
             return val
         else:
-            value_class = self.parent.__dataclass_fields__[self.identifier].type
-            if name not in value_class.__dataclass_fields__:
+            value_fields = get_node_schema(type(self.parent)).value_fields.get(self.identifier)
+            if value_fields is None or name not in value_fields:
                 raise AttributeError(f"Value of PropertyNode '{self.identifier}' doesn't not have attribute '{name}'")
             
             return None
@@ -225,9 +511,19 @@ class PropertyNode(MappingNode):
     #         setattr(self, name, value)
 
     
-@dataclass
+@slotted_dataclass
 class ObjectNode(YamlNode, ABC):
-    def _get_field_mapping(self) -> {str: str}:
+    _hash: Optional[int] = field(default=None, repr=False, compare=False)
+
+    def get_hash(self) -> int:
+        if self._hash is None:
+            self._hash = super().get_hash()
+
+        return self._hash
+
+    @classmethod
+    def _get_field_mapping(cls) -> {str: str}:
+        """Names of the children in the document which differ from the attributes"""
         return {}
 
     def get_child(self, child_name: str):
@@ -235,7 +531,8 @@ class ObjectNode(YamlNode, ABC):
         If the value is None, creates a child of type
         specified in type annotations and returns it
         """
-        attr = child_name if hasattr(self, child_name) else self._get_field_mapping().get(child_name, None)
+        schema = get_node_schema(type(self))
+        attr = schema.attributes.get(child_name)
 
         # attribute could not be found in both object itself and mapping table
         if attr is None:
@@ -247,30 +544,27 @@ class ObjectNode(YamlNode, ABC):
         if child is None:
             child = PropertyNode(parent=self)
             child.get_key().text = attr
-
-            # Get type of the child according to its annotation
-            child_cls = self.__dataclass_fields__.get(attr).type
-        
-            if issubclass(child_cls, TextNode):
-                child.allow_vars = child_cls.allow_vars
-            try:    
-                setattr(self, attr, child)
-            except Exception:
-                raise
+            child.allow_vars = schema.allow_vars.get(attr, False)
+            setattr(self, attr, child)
 
         return child
 
     def get_children(self):
         """Returns all child nodes. Nodes are actually
         attributes which are not excluded and do not equal None"""
-        fields = vars(self)
-        return [val for key, val in fields.items() if val and key not in self.non_child_attributes]
+        children = []
+        for name in get_node_schema(type(self)).child_fields:
+            val = getattr(self, name)
+            if val:
+                children.append(val)
+
+        return children
 
     def _get_seq_nodes(self, property_name) -> List[Any]:
         if not hasattr(self, property_name):
             raise AttributeError
 
-        if not issubclass(self.__dataclass_fields__[property_name].type, SequenceNode):
+        if not issubclass(get_node_schema(type(self)).field_types[property_name], SequenceNode):
             return ValueError(f"Property '{property_name}' is not sequence")
         
         prop: PropertyNode = getattr(self, property_name, None)
@@ -282,19 +576,19 @@ class ObjectNode(YamlNode, ABC):
         return seq.nodes 
                 
 
-@dataclass
+@slotted_dataclass
 class ScalarNodesSequence(SequenceNode):
     """Container for simple text arrays
     like outputs, depends on """
     node_type = ScalarNode
 
 
-@dataclass
+@slotted_dataclass
 class TextNodesSequence(SequenceNode):
     node_type = TextNode
 
 
-@dataclass
+@slotted_dataclass
 class ResourceMappingNode(MappingNode):
     key: ScalarNode = None
 
@@ -303,25 +597,25 @@ class ResourceMappingNode(MappingNode):
         return self.key
 
 
-@dataclass
+@slotted_dataclass
 class TextMapping(MappingNode):
     key: ScalarNode = None
     value: TextNode = None
     allow_vars = True
 
 
-@dataclass
+@slotted_dataclass
 class TextMappingSequence(SequenceNode):
     node_type = TextMapping
 
 
-@dataclass
+@slotted_dataclass
 class ScalarMappingNode(MappingNode):
     key: ScalarNode = None
     value: ScalarNode = None
 
 
-@dataclass
+@slotted_dataclass
 class ScalarMappingsSequence(SequenceNode):
     """
     Node representing the list of inputs
@@ -329,13 +623,33 @@ class ScalarMappingsSequence(SequenceNode):
     node_type = ScalarMappingNode
 
 
-@dataclass
+@slotted_dataclass
 class BaseTree(ObjectNode):
+    non_child_attributes: ClassVar[list] = ObjectNode.non_child_attributes + ["_position_index", "error_sink"]
+
+    _position_index: Optional[PositionIndex] = field(default=None, repr=False, compare=False)
+    error_sink: ErrorSink = field(default_factory=ErrorSink, repr=False, compare=False)
     inputs_node: ScalarMappingsSequence = None
     kind: ScalarNode = None
     spec_version: ScalarNode = None
 
-    def _get_field_mapping(self) -> {str: str}:
+    def get_position_index(self) -> PositionIndex:
+        """Returns the index of the nodes' positions. It's built on the first
+        request and must be reset whenever the tree is changed"""
+        if self._position_index is None:
+            self._position_index = PositionIndex(self)
+
+        return self._position_index
+
+    def reset_position_index(self) -> None:
+        self._position_index = None
+
+    @property
+    def errors(self) -> List[NodeError]:
+        return self.error_sink.get_errors()
+
+    @classmethod
+    def _get_field_mapping(cls) -> {str: str}:
         mapping = super()._get_field_mapping()
         mapping.update(
             {"inputs": "inputs_node"}
@@ -346,7 +660,7 @@ class BaseTree(ObjectNode):
         return self._get_seq_nodes("inputs_node")
 
 
-@dataclass
+@slotted_dataclass(mixin=True)
 class TreeWithOutputs(ObjectNode, ABC):
     outputs: ScalarNodesSequence = None
 
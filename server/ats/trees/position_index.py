@@ -0,0 +1,96 @@
+from bisect import bisect_right
+from typing import Any, Dict, List, Optional, Tuple
+
+
+class PositionIndex:
+    """
+    Sorted interval index of the tree nodes.
+
+    Children of every node are kept sorted by their start positions together
+    with the running maximum of their end positions, so the node under the
+    cursor is found with a binary search on each level of the tree instead
+    of visiting all the nodes. Nodes without positions are transparent:
+    their children are indexed as the children of their parent.
+    """
+
+    def __init__(self, tree: Any):
+        self.tree = tree
+        # id of the node -> (starts, children, running max of ends)
+        self._levels: Dict[int, Tuple[List[tuple], List[Any], List[tuple]]] = {}
+
+        stack = [tree]
+        while stack:
+            node = stack.pop()
+            children = self._get_positioned_children(node)
+            if not children:
+                continue
+
+            # sort is stable, so among the nodes starting at the same position
+            # the last child of the node stays the last one
+            children.sort(key=lambda child: child.start_pos)
+            max_ends = []
+            max_end = None
+            for child in children:
+                if max_end is None or child.end_pos > max_end:
+                    max_end = child.end_pos
+                max_ends.append(max_end)
+
+            self._levels[id(node)] = ([child.start_pos for child in children], children, max_ends)
+            stack.extend(children)
+
+    @staticmethod
+    def _get_positioned_children(node: Any) -> List[Any]:
+        children = []
+        pending = list(reversed(node.get_children()))
+        while pending:
+            child = pending.pop()
+            if child.start_pos is None or child.end_pos is None:
+                pending.extend(reversed(child.get_children()))
+            else:
+                children.append(child)
+
+        return children
+
+    def get_node_at(self, line: int, col: int) -> Optional[Any]:
+        """Returns the innermost node containing the position (both ends inclusive).
+        When several children of a node contain it, the one starting last is chosen"""
+        pos = (line, col)
+        node = self.tree
+        if node.start_pos is None or node.end_pos is None:
+            result = None
+        elif node.start_pos <= pos <= node.end_pos:
+            result = node
+        else:
+            return None
+
+        while True:
+            level = self._levels.get(id(node))
+            if level is None:
+                return result
+
+            starts, children, max_ends = level
+            found = None
+            i = bisect_right(starts, pos) - 1
+            # earlier siblings could contain the position only while their ends reach it
+            while i >= 0 and max_ends[i] >= pos:
+                if children[i].end_pos >= pos:
+                    found = children[i]
+                    break
+                i -= 1
+
+            if found is None:
+                return result
+
+            node = result = found
+
+    def get_path_at(self, line: int, col: int) -> List[Any]:
+        """Returns the innermost node containing the position with all its ancestors,
+        starting from the root of the tree"""
+        node = self.get_node_at(line, col)
+        path = []
+        while node is not None:
+            path.append(node)
+            node = node.parent
+
+        path.reverse()
+        return path
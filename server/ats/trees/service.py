@@ -1,16 +1,15 @@
-from dataclasses import dataclass
-from server.ats.trees.common import (BaseTree, ObjectNode, TreeWithOutputs,
+from server.ats.trees.common import (slotted_dataclass, BaseTree, ObjectNode, TreeWithOutputs,
                                      TextNode, ScalarNodesSequence, TextMappingSequence, ScalarNode)
 
 
-@dataclass
+@slotted_dataclass
 class ModuleNode(ObjectNode):
     source: TextNode = None
     enable_auto_tagging: ScalarNode = None
     exclude_from_tagging: ScalarNodesSequence = None
 
 
-@dataclass
+@slotted_dataclass
 class VariablesNode(ObjectNode):
     var_file: ScalarNode = None
     values: TextMappingSequence = None
@@ -19,13 +18,13 @@ class VariablesNode(ObjectNode):
         return self._get_seq_nodes("values")
 
 
-@dataclass
+@slotted_dataclass
 class PermissionsNode(ObjectNode):
-    @dataclass
+    @slotted_dataclass
     class AzurePermissionsNode(ObjectNode):
         managed_identity_id: TextNode = None
 
-    @dataclass
+    @slotted_dataclass
     class AwsPermissionsNode(ObjectNode):
         role_arn: TextNode = None
         external_id: TextNode = None
@@ -34,7 +33,7 @@ class PermissionsNode(ObjectNode):
     aws: AwsPermissionsNode = None
 
 
-@dataclass
+@slotted_dataclass
 class ServiceTree(BaseTree, TreeWithOutputs):
     module: ModuleNode = None
     terraform_version: TextNode = None
@@ -0,0 +1,88 @@
+import re
+from dataclasses import dataclass
+from typing import Optional, Tuple, Union
+
+# ${name} anywhere in the text or $name taking the whole text
+VARIABLE_REGEX = re.compile(r"(\$\{.+?\}|^\$.+?$)")
+
+
+@dataclass(frozen=True)
+class TextSpan:
+    """Literal part of a text value"""
+
+    text: str
+    start_pos: Optional[Tuple[int, int]]
+    end_pos: Optional[Tuple[int, int]]
+
+
+@dataclass(frozen=True)
+class VariableRef:
+    """Reference to a variable in a text value like $name, ${name} or $torque.applications.app.dns"""
+
+    text: str
+    start_pos: Optional[Tuple[int, int]]
+    end_pos: Optional[Tuple[int, int]]
+    # name without '$' and braces
+    name: str
+    braced: bool
+
+    @property
+    def path(self) -> Tuple[str, ...]:
+        return tuple(self.name.split("."))
+
+    @property
+    def expression(self) -> str:
+        """Reference in the form of $name"""
+        return "$" + self.name
+
+
+Span = Union[TextSpan, VariableRef]
+
+
+def tokenize_text(text: str, start_pos: Optional[Tuple[int, int]] = None) -> Tuple[Span, ...]:
+    """Splits the text into literal parts and variable references. Positions of
+    the spans are calculated from the position of the text in the document"""
+    def get_pos(offset: int) -> Optional[Tuple[int, int]]:
+        if start_pos is None:
+            return None
+        return start_pos[0], start_pos[1] + offset
+
+    spans = []
+    last = 0
+    for match in VARIABLE_REGEX.finditer(text):
+        start, end = match.span()
+        if start > last:
+            spans.append(TextSpan(text=text[last:start], start_pos=get_pos(last), end_pos=get_pos(start)))
+
+        ref_text = match.group()
+        braced = ref_text.startswith("${") and ref_text.endswith("}")
+        spans.append(VariableRef(
+            text=ref_text,
+            start_pos=get_pos(start),
+            end_pos=get_pos(end),
+            name=ref_text[2:-1] if braced else ref_text[1:],
+            braced=braced
+        ))
+        last = end
+
+    if last < len(text) or not spans:
+        spans.append(TextSpan(text=text[last:], start_pos=get_pos(last), end_pos=get_pos(len(text))))
+
+    return tuple(spans)
+
+
+def get_trailing_reference(text: str) -> Optional[str]:
+    """Returns the name of the variable reference which is not finished
+    at the end of the text ('torque.applications.' for 'url: ${torque.applications.'),
+    None if the text doesn't end inside a reference"""
+    index = text.rfind("$")
+    if index < 0:
+        return None
+
+    name = text[index + 1:]
+    if name.startswith("{"):
+        name = name[1:]
+    if "}" in name:
+        return None
+
+    return name
@@ -0,0 +1,79 @@
+import itertools
+from typing import Any, Iterable, Iterator, List
+
+import yaml
+from yaml.error import Mark
+from yaml.tokens import Token
+
+# libyaml based loader when PyYAML was built with it. CFullLoader is used
+# instead of CLoader/CSafeLoader to keep the FullLoader constructor semantics
+# the rest of the server relies on
+CLoader = getattr(yaml, 'CFullLoader', None) if getattr(yaml, '__with_libyaml__', False) else None
+
+Loader = CLoader or yaml.FullLoader
+
+
+def scan(document: str) -> Iterable[Token]:
+    """Scans the document with the libyaml scanner when it's available.
+
+    Token positions are exactly the same as the ones of the pure python
+    scanner. Invalid documents are rescanned by the pure python scanner,
+    so errors (messages and marks) don't depend on the backend either."""
+    if CLoader is None:
+        return yaml.scan(document, Loader=yaml.FullLoader)
+
+    try:
+        tokens = list(yaml.scan(document, Loader=CLoader))
+    except yaml.YAMLError:
+        return yaml.scan(document, Loader=yaml.FullLoader)
+
+    if not document.endswith('\n'):
+        _fix_stream_end(tokens, document)
+
+    return tokens
+
+
+def iter_scan(document: str) -> Iterator[Token]:
+    """Lazily scans the document, so the caller could stop as soon as it finds
+    what it's looking for. Unlike scan(), positions of the tokens closing
+    the stream are left as libyaml reports them"""
+    if CLoader is None:
+        yield from yaml.scan(document, Loader=yaml.FullLoader)
+        return
+
+    scanned = 0
+    try:
+        for token in yaml.scan(document, Loader=CLoader):
+            scanned += 1
+            yield token
+    except yaml.YAMLError:
+        # continue with the pure python scanner from the same token
+        yield from itertools.islice(yaml.scan(document, Loader=yaml.FullLoader), scanned, None)
+
+
+def load(document: str) -> Any:
+    """Loads the document with the libyaml loader when it's available.
+    Errors are reported by the pure python loader"""
+    if CLoader is None:
+        return yaml.load(document, Loader=yaml.FullLoader)
+
+    try:
+        return yaml.load(document, Loader=CLoader)
+    except yaml.YAMLError:
+        return yaml.load(document, Loader=yaml.FullLoader)
+
+
+def _fix_stream_end(tokens: List[Token], document: str) -> None:
+    """libyaml places the tokens closing a document without a trailing line break
+    at the beginning of the next line while the pure python scanner places them
+    right after the last character of the document"""
+    last_line = document.count('\n')
+    c_end = (last_line + 1, 0)
+    end_column = len(document) - document.rfind('\n') - 1
+
+    for token in reversed(tokens):
+        if (token.start_mark.line, token.start_mark.column) != c_end:
+            break
+
+        mark = Mark(token.start_mark.name, len(document), last_line, end_column, None, None)
+        token.start_mark = token.end_mark = mark
@@ -0,0 +1,79 @@
+from typing import List
+
+
+def generate_blueprint(apps_count: int) -> str:
+    """Generates a blueprint with the given number of applications
+    using all kinds of nodes the parser supports"""
+    lines = [
+        "spec_version: 1",
+        "kind: blueprint",
+        "inputs:",
+        "  - DB_USER",
+        "  - DB_PASS:",
+        "      display_style: masked",
+        "      default_value: secret",
+        "artifacts:",
+    ]
+    lines.extend(f"  - app{num}: artifacts/app{num}.zip" for num in range(apps_count))
+    lines.append("applications:")
+    for num in range(apps_count):
+        lines.extend([
+            f"  - app{num}:",
+            "      instances: 1",
+            "      # application inputs",
+            "      input_values:",
+            "        - DB_USER: $DB_USER",
+            f"        - DB_HOST: $torque.applications.app{max(num - 1, 0)}.outputs.host",
+            "        - PORT: 3306",
+            "        - MODE:",
+            "      depends_on:",
+            f"        - app{max(num - 1, 0)}",
+        ])
+
+    return "\n".join(lines) + "\n"
+
+
+def generate_tfvars(variables_count: int) -> str:
+    """Generates a tfvars file with the given number of top-level variables
+    with scalar, map, list and heredoc values and comments"""
+    lines = []
+    for num in range(variables_count):
+        kind = num % 4
+        lines.append(f"# variable {num} = commented out")
+        if kind == 0:
+            lines.append(f'var_{num} = "value-${{var.prefix}}-{num}"  // trailing comment')
+        elif kind == 1:
+            lines.extend([
+                f"map_{num} = {{",
+                f'  name  = "item{num}"',
+                "  tags = {",
+                '    owner = "team"',
+                f"    index = {num}",
+                "  }",
+                "}",
+            ])
+        elif kind == 2:
+            lines.extend([
+                f"list_{num} = [",
+                '  "a = b",',
+                f'  "{num}",',
+                "]",
+            ])
+        else:
+            lines.extend([
+                f"script_{num} = <<-EOT",
+                "  #!/bin/bash",
+                f"  export VALUE={num}",
+                "  EOT",
+            ])
+
+    return "\n".join(lines) + "\n"
+
+
+def read_documents(paths: List[str]) -> List[str]:
+    documents = []
+    for path in paths:
+        with open(path, "r") as f:
+            documents.append(f.read())
+
+    return documents
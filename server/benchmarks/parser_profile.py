@@ -0,0 +1,35 @@
+"""Shows how parse time is distributed between the token types.
+
+Usage: python -m server.benchmarks.parser_profile [--apps N] [FILE ...]
+"""
+import argparse
+from typing import Dict
+
+from server.ats import yaml_backend
+from server.ats.parser import Parser, TokenTiming
+from server.benchmarks.common import generate_blueprint, read_documents
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("files", nargs="*", help="documents to parse (a generated blueprint by default)")
+    parser.add_argument("--apps", type=int, default=500, help="applications in the generated blueprint")
+    args = parser.parse_args()
+
+    documents = read_documents(args.files) if args.files else [generate_blueprint(args.apps)]
+
+    timings: Dict[str, TokenTiming] = {}
+    for doc in documents:
+        # tokens are scanned in advance to measure the parser only
+        Parser(doc, tokens=list(yaml_backend.scan(doc))).parse(timings=timings)
+
+    total = sum(timing.seconds for timing in timings.values())
+    print(f"{'token':<26}{'count':>10}{'seconds':>10}{'us/token':>10}{'share':>8}")
+    for name, timing in sorted(timings.items(), key=lambda item: item[1].seconds, reverse=True):
+        print(f"{name:<26}{timing.count:>10}{timing.seconds:>10.3f}"
+              f"{timing.seconds / timing.count * 1e6:>10.2f}{timing.seconds / total:>8.1%}")
+    print(f"{'total':<26}{sum(t.count for t in timings.values()):>10}{total:>10.3f}")
+
+
+if __name__ == "__main__":
+    main()
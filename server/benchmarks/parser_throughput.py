@@ -0,0 +1,66 @@
+"""Measures parse throughput (lines/sec) of the pure python and libyaml backends.
+
+Usage: python -m server.benchmarks.parser_throughput [--apps N] [--repeat N] [FILE ...]
+"""
+import argparse
+import time
+from typing import Callable, List
+
+from server.ats import yaml_backend
+from server.ats.parser import Parser
+from server.benchmarks.common import generate_blueprint, read_documents
+
+
+def _measure(func: Callable[[str], object], documents: List[str], repeat: int) -> float:
+    """Returns the best time of processing all the documents"""
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        for doc in documents:
+            func(doc)
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+
+    return best
+
+
+def _run(documents: List[str], repeat: int) -> None:
+    lines = sum(doc.count("\n") + 1 for doc in documents)
+    backends = [("python", None)]
+    if yaml_backend.CLoader is not None:
+        backends.append(("libyaml", yaml_backend.CLoader))
+    else:
+        print("PyYAML is built without libyaml, only the python backend is measured")
+
+    stages = [
+        ("scan", lambda doc: list(yaml_backend.scan(doc))),
+        ("load", yaml_backend.load),
+        ("parse", lambda doc: Parser(doc).parse()),
+    ]
+
+    print(f"{len(documents)} document(s), {lines} lines, best of {repeat}")
+    print(f"{'backend':<10}{'stage':<8}{'seconds':>10}{'lines/sec':>14}")
+    c_loader = yaml_backend.CLoader
+    try:
+        for name, loader in backends:
+            yaml_backend.CLoader = loader
+            for stage, func in stages:
+                elapsed = _measure(func, documents, repeat)
+                print(f"{name:<10}{stage:<8}{elapsed:>10.3f}{lines / elapsed:>14,.0f}")
+    finally:
+        yaml_backend.CLoader = c_loader
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("files", nargs="*", help="documents to parse (a generated blueprint by default)")
+    parser.add_argument("--apps", type=int, default=500, help="applications in the generated blueprint")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    documents = read_documents(args.files) if args.files else [generate_blueprint(args.apps)]
+    _run(documents, args.repeat)
+
+
+if __name__ == "__main__":
+    main()
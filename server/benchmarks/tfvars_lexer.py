@@ -0,0 +1,74 @@
+"""Measures extraction of variables from large tfvars files by the streaming lexer
+compared with the regular expression over the whole file it replaced.
+
+Usage: python -m server.benchmarks.tfvars_lexer [--variables N] [--repeat N] [FILE ...]
+"""
+import argparse
+import os
+import re
+import tempfile
+import time
+import tracemalloc
+from typing import Callable, List, Tuple
+
+from server.benchmarks.common import generate_tfvars
+from server.utils.tfvars import iter_tfvars_variables
+
+
+def _lexer(path: str) -> List[str]:
+    with open(path, "r") as f:
+        return [var.name for var in iter_tfvars_variables(f)]
+
+
+def _regex(path: str) -> List[str]:
+    with open(path, "r") as f:
+        return re.findall(r"(^.+?)\s*=", f.read(), re.MULTILINE)
+
+
+def _measure(func: Callable[[str], List[str]], path: str, repeat: int) -> Tuple[float, int, int]:
+    """Returns the best time, the number of found variables and the peak of allocated memory"""
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        found = func(path)
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+
+    tracemalloc.start()
+    func(path)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return best, len(found), peak
+
+
+def _run(path: str, repeat: int) -> None:
+    size = os.path.getsize(path)
+    print(f"{path}: {size / 2 ** 20:.1f} MB, best of {repeat}")
+    print(f"{'extractor':<10}{'seconds':>10}{'MB/sec':>10}{'variables':>12}{'peak MB':>10}")
+    for name, func in (("regex", _regex), ("lexer", _lexer)):
+        elapsed, found, peak = _measure(func, path, repeat)
+        print(f"{name:<10}{elapsed:>10.3f}{size / 2 ** 20 / elapsed:>10.1f}{found:>12,}{peak / 2 ** 20:>10.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("files", nargs="*", help="tfvars files (a generated one by default)")
+    parser.add_argument("--variables", type=int, default=40000, help="variables in the generated file")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    if args.files:
+        for path in args.files:
+            _run(path, args.repeat)
+        return
+
+    with tempfile.TemporaryDirectory() as folder:
+        path = os.path.join(folder, "generated.tfvars")
+        with open(path, "w") as f:
+            f.write(generate_tfvars(args.variables))
+        _run(path, args.repeat)
+
+
+if __name__ == "__main__":
+    main()
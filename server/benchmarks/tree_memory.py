@@ -0,0 +1,57 @@
+"""Measures the memory retained by a parsed tree (bytes per node).
+
+Usage: python -m server.benchmarks.tree_memory [--nodes N] [FILE ...]
+"""
+import argparse
+import gc
+import tracemalloc
+from typing import List
+
+from server.ats import yaml_backend
+from server.ats.parser import Parser
+from server.ats.trees.common import BaseTree, YamlNode
+from server.benchmarks.common import generate_blueprint, read_documents
+
+# nodes in a generated blueprint per application
+NODES_PER_APP = 27
+
+
+def _get_nodes(tree: BaseTree) -> List[YamlNode]:
+    nodes = []
+    stack = [tree]
+    while stack:
+        node = stack.pop()
+        nodes.append(node)
+        stack.extend(node.get_children())
+
+    return nodes
+
+
+def _measure(document: str) -> None:
+    tokens = list(yaml_backend.scan(document))
+
+    gc.collect()
+    tracemalloc.start()
+    tree = Parser(document, tokens=tokens).parse()
+    gc.collect()
+    retained, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    nodes = _get_nodes(tree)
+    print(f"{len(nodes)} nodes, {len(tree.error_sink)} errors, {retained:,} bytes retained, "
+          f"{retained / len(nodes):.1f} bytes per node")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("files", nargs="*", help="documents to parse (a generated blueprint by default)")
+    parser.add_argument("--nodes", type=int, default=10000, help="approximate size of the generated blueprint")
+    args = parser.parse_args()
+
+    documents = read_documents(args.files) if args.files else [generate_blueprint(args.nodes // NODES_PER_APP)]
+    for doc in documents:
+        _measure(doc)
+
+
+if __name__ == "__main__":
+    main()
@@ -16,10 +16,12 @@
 ############################################################################
 import asyncio
 from dataclasses import dataclass
+import functools
 import logging
 from server.ats.trees.app import AppTree
 
 from server.ats.trees.common import BaseTree, PropertyNode
+from server.ats.trees.variables import get_trailing_reference
 from server.utils.common import is_var_allowed
 from server.validation.factory import ValidatorFactory
 
@@ -29,7 +31,6 @@ from pygls.lsp.types.language_features.completion import CompletionTriggerKind,
 from pygls.lsp import types
 from pygls.lsp.types.basic_structures import TextDocumentItem, TextEdit, VersionedTextDocumentIdentifier
 from pygls.lsp import types, InitializeResult
-import yaml
 import time
 import uuid
 import os
@@ -37,19 +38,30 @@ import glob
 import re
 import pathlib
 from json import JSONDecodeError
-from typing import Any, Dict, Optional, Tuple, List, Union, cast
+from typing import Any, Dict, Optional, Set, Tuple, List, Union, cast
 
 from server.ats.parser import   BlueprintTree, Parser, ParserError
 
 from server.utils import services, applications, common
+from server.utils.file_cache import invalidate_file
+from server.utils.references import REFERENCE_GRAPH, Reference, get_blueprint_references
+from server.utils.validation_scheduler import DEBOUNCE_DELAY, VALIDATION_SCHEDULER
+from server.utils.workspace_index import APPLICATION, SERVICE, WORKSPACE_INDEX
+from server.utils.analysis import (DocumentAnalysis, analyze_detached, get_document_analysis, get_tree_for_position,
+                                   has_document_analysis, put_document_analysis, remove_document_analysis,
+                                   update_document_analysis, using_document_analysis)
+from server.utils.priority_scheduler import Priority, PriorityScheduler
+from server.utils.workers import LARGE_DOCUMENT_SIZE, THREAD_WORKERS, WORKER_POOL
 from pygls.protocol import LanguageServerProtocol
 
-from pygls.lsp.methods import (CODE_LENS, COMPLETION, COMPLETION_ITEM_RESOLVE, DOCUMENT_LINK, TEXT_DOCUMENT_DID_CHANGE,
+from pygls.lsp.methods import (CODE_LENS, COMPLETION, COMPLETION_ITEM_RESOLVE, DOCUMENT_LINK, INITIALIZED, SHUTDOWN,
+                               TEXT_DOCUMENT_DID_CHANGE,
                                TEXT_DOCUMENT_DID_CLOSE, TEXT_DOCUMENT_DID_OPEN, HOVER, REFERENCES, DEFINITION, 
-                               TEXT_DOCUMENT_SEMANTIC_TOKENS, TEXT_DOCUMENT_SEMANTIC_TOKENS_FULL, TEXT_DOCUMENT_SEMANTIC_TOKENS_FULL_DELTA, WORKSPACE_DID_CHANGE_WATCHED_FILES)
+                               TEXT_DOCUMENT_SEMANTIC_TOKENS, TEXT_DOCUMENT_SEMANTIC_TOKENS_FULL, TEXT_DOCUMENT_SEMANTIC_TOKENS_FULL_DELTA, WORKSPACE_DID_CHANGE_CONFIGURATION,
+                               WORKSPACE_DID_CHANGE_WATCHED_FILES)
 from pygls.lsp.types import (CompletionItem, CompletionList, CompletionOptions,
                              CompletionParams, ConfigurationItem,
-                             ConfigurationParams, Diagnostic, Location,
+                             ConfigurationParams, DidChangeConfigurationParams, Diagnostic, Location,
                              DidChangeTextDocumentParams, Command,
                              DidCloseTextDocumentParams, Hover, TextDocumentPositionParams,
                              DidOpenTextDocumentParams, MessageType, Position,
@@ -57,16 +69,35 @@ from pygls.lsp.types import (CompletionItem, CompletionList, CompletionOptions,
                              Unregistration, UnregistrationParams, 
                              DocumentLink, DocumentLinkParams,
                              CodeLens, CodeLensOptions, CodeLensParams,
-                             workspace, CompletionItemKind, DidChangeWorkspaceFoldersParams)
+                             workspace, CompletionItemKind, DidChangeWorkspaceFoldersParams,
+                             InitializedParams, WorkDoneProgressBegin, WorkDoneProgressEnd, WorkDoneProgressReport)
 from pygls.server import LanguageServer
+from pygls.uris import to_fs_path
 from pygls.workspace import Document, Workspace, position_from_utf16
 
-DEBOUNCE_DELAY = 0.3
+# watched changes of more definitions than this (like after git pull) are applied by rescanning the workspace
+RESCAN_THRESHOLD = 20
 
 
 class TorqueLanguageServer(LanguageServer):
     CONFIGURATION_SECTION = 'torqueServer'
+    CMD_GET_SCHEDULER_METRICS = 'torque.getSchedulerMetrics'
     latest_opened_document = None
+    # the document opened or changed last, its diagnostics go before the other ones
+    active_document_uri = None
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # a slot per worker thread, the jobs mostly wait for the workers
+        self.scheduler = PriorityScheduler(slots=THREAD_WORKERS)
+
+    def get_priority(self, uri: str) -> Priority:
+        """Priority of the work on the document"""
+        if uri == self.active_document_uri:
+            return Priority.ACTIVE_DOCUMENT
+        if uri in self.workspace.documents:
+            return Priority.OPEN_DOCUMENT
+        return Priority.BACKGROUND
 
 
 torque_ls = TorqueLanguageServer()
@@ -74,7 +105,7 @@ torque_ls = TorqueLanguageServer()
 
 def _diagnose_tree_errors(tree: BaseTree) -> list:
     diagnostics = []
-    for error in tree.errors:
+    for error in tree.error_sink:
         d = Diagnostic(
             range=Range(
                 start=Position(line=error.start_pos[0], character=error.start_pos[1]),
@@ -85,25 +116,37 @@ def _diagnose_tree_errors(tree: BaseTree) -> list:
     return diagnostics
 
 
-def _validate(ls, params):
-    text_doc = ls.workspace.get_document(params.text_document.uri)
+async def _validate(ls, params):
+    await _validate_document(ls, params.text_document.uri)
 
-    source = text_doc.source
-    diagnostics = _validate_yaml(source) if source else []
 
-    if not diagnostics:
+def _get_diagnostics(ls, text_doc: Document) -> Tuple[DocumentAnalysis, List[Diagnostic], Optional[Set[Reference]]]:
+    """Validates the document. Runs in the worker threads, so the state of the server
+    is updated by the caller. Returns the analysis, the diagnostics and the references
+    of the blueprint (None for other documents)"""
+    analysis = get_document_analysis(text_doc)
+    diagnostics = list(analysis.yaml_diagnostics)
+    references = None
+
+    # documents without anything but comments have neither a tree nor an error
+    if not diagnostics and (analysis.tree is not None or analysis.parse_error is not None):
         try:
-            tree = Parser(source).parse()
+            tree = analysis.get_tree()
+            if isinstance(tree, BlueprintTree):
+                references = get_blueprint_references(tree)
             diagnostics += _diagnose_tree_errors(tree)
             cls_validator = ValidatorFactory.get_validator(tree)
             validator = cls_validator(tree, text_doc)
             diagnostics += validator.validate()
         except ParserError as e:
+            # errors of the document as a whole (like an unknown kind) have no position
+            start_pos = e.start_pos or (0, 0)
+            end_pos = e.end_pos or start_pos
             diagnostics.append(
                 Diagnostic(
                     range=Range(
-                        start=Position(line=e.start_pos[0], character=e.start_pos[1]),
-                        end=Position(line=e.end_pos[0], character=e.end_pos[1])),
+                        start=Position(line=start_pos[0], character=start_pos[1]),
+                        end=Position(line=end_pos[0], character=end_pos[1])),
                     message=e.message))
         except ValueError as e:
             diagnostics.append(
@@ -114,32 +157,114 @@ def _validate(ls, params):
                     message=str(e)))
         except Exception as ex:
             import sys
-            print('Error on line {}'.format(sys.exc_info()[-1].tb_lineno), type(ex).__name__, ex)
-            logging.error('Error on line {}'.format(sys.exc_info()[-1].tb_lineno), type(ex).__name__, ex)
+            message = 'Error on line {} {} {}'.format(sys.exc_info()[-1].tb_lineno, type(ex).__name__, ex)
+            logging.error(message)
+            # messages are sent to the client from the event loop
+            ls.loop.call_soon_threadsafe(ls.show_message_log, message, MessageType.Error)
+
+    return analysis, diagnostics, references
+
+
+async def _validate_document(ls, uri: str) -> Optional[DocumentAnalysis]:
+    """Validates the document off the event loop and publishes the diagnostics.
+    Returns the analysis, None if the document was changed meanwhile"""
+    priority = ls.get_priority(uri)
+    async with ls.scheduler.slot(priority):
+        text_doc = ls.workspace.get_document(uri)
+        # open documents are changed in place by the notifications handled meanwhile
+        snapshot = Document(uri, source=text_doc.source, version=text_doc.version)
+
+        if len(snapshot.source) > LARGE_DOCUMENT_SIZE and not has_document_analysis(snapshot):
+            try:
+                put_document_analysis(await WORKER_POOL.run_in_process(analyze_detached, uri, snapshot.version,
+                                                                       snapshot.source))
+            except Exception as ex:
+                # the document is analyzed by the worker thread instead
+                logging.error(f"Unable to analyze '{uri}' in a worker process: {ex}")
+            await ls.scheduler.checkpoint(priority)
+
+        with using_document_analysis(uri):
+            analysis, diagnostics, references = await WORKER_POOL.run_in_thread(_get_diagnostics, ls, snapshot)
+
+    if uri in ls.workspace.documents and ls.workspace.get_document(uri).version != snapshot.version:
+        # superseded by a newer version, it's validated on its own
+        return None
+
+    if references is not None:
+        REFERENCE_GRAPH.set_blueprint(uri, references)
+
+    analysis.diagnostics = diagnostics
+    if VALIDATION_SCHEDULER.can_publish(uri, snapshot.version):
+        VALIDATION_SCHEDULER.set_published(uri, snapshot.version)
+        ls.publish_diagnostics(uri, diagnostics)
+
+    return analysis
+
+
+async def _validate_blueprints(ls, uris):
+    """Revalidates the blueprints, the analyses of the ones not opened in the editor are not kept"""
+    for uri in sorted(uris):
+        await _validate_document(ls, uri)
+        if uri not in ls.workspace.documents:
+            remove_document_analysis(uri)
+
+
+def _supports_work_done_progress(server: TorqueLanguageServer) -> bool:
+    window = server.client_capabilities.window
+    return bool(window and window.work_done_progress)
+
+
+@torque_ls.feature(INITIALIZED)
+async def initialized(server: TorqueLanguageServer, params: InitializedParams):
+    """Indexes applications and services of the workspace in the background,
+    so the first blueprint validation doesn't have to load them."""
+    root = server.workspace.root_path
+    if not root:
+        return
+
+    token = str(uuid.uuid4())
+    progress = _supports_work_done_progress(server)
+    if progress:
+        try:
+            await server.progress.create_async(token)
+            server.progress.begin(token, WorkDoneProgressBegin(title="Indexing Torque workspace", percentage=0))
+        except Exception as ex:
+            logging.error(ex)
+            progress = False
 
-    ls.publish_diagnostics(text_doc.uri, diagnostics)
+    def report(done: int, total: int):
+        if progress:
+            server.progress.report(token, WorkDoneProgressReport(message=f"{done}/{total}",
+                                                                 percentage=done * 100 // total))
 
+    executor = WORKER_POOL.get_process_executor()
+    async with server.scheduler.slot(Priority.BACKGROUND):
+        total = await WORKSPACE_INDEX.warm_up(root, executor, on_progress=report,
+                                              checkpoint=lambda: server.scheduler.checkpoint(Priority.BACKGROUND))
+        await REFERENCE_GRAPH.load(root, executor)
+    logging.debug(f"Scheduler after indexing: {server.scheduler.get_metrics()}")
 
-def _validate_yaml(source):
-    """Validates yaml file."""
-    diagnostics = []
+    if progress:
+        server.progress.end(token, WorkDoneProgressEnd(message=f"Indexed {total} definitions"))
 
-    try:
-        yaml.load(source, Loader=yaml.FullLoader)
-    except yaml.MarkedYAMLError as ex:
-        mark = ex.problem_mark
-        d = Diagnostic(
-            range=Range(
-                start=Position(line=mark.line - 1, character=mark.column - 1),
-                end=Position(line=mark.line - 1, character=mark.column)
-            ),
-            message=ex.problem,
-            source=type(torque_ls).__name__
-        )
-        
-        diagnostics.append(d)
+    # cross-file diagnostics of the blueprints validated meanwhile were provisional
+    if total:
+        for doc in list(server.workspace.documents.values()):
+            if '/blueprints/' in doc.uri:
+                await _validate_document(server, doc.uri)
+
+
+@torque_ls.command(TorqueLanguageServer.CMD_GET_SCHEDULER_METRICS)
+def get_scheduler_metrics(server: TorqueLanguageServer, *args) -> Dict[str, Any]:
+    """Returns queue depths and wait times of the work of each priority"""
+    return server.scheduler.get_metrics()
+
+
+@torque_ls.feature(SHUTDOWN)
+def shutdown(server: TorqueLanguageServer, *args):
+    """Stops the worker threads and processes"""
+    WORKER_POOL.shutdown()
 
-    return diagnostics
 
 @torque_ls.feature(TEXT_DOCUMENT_DID_CHANGE)
 def did_change(server: TorqueLanguageServer, params: DidChangeTextDocumentParams):
@@ -147,20 +272,42 @@ def did_change(server: TorqueLanguageServer, params: DidChangeTextDocumentParams
     if '/blueprints/' in params.text_document.uri or \
        '/applications/' in params.text_document.uri or \
        '/services/' in params.text_document.uri:
-        _validate(server, params)
         text_doc = server.workspace.get_document(params.text_document.uri)
-        
-        source = text_doc.source
-        yaml_obj = yaml.load(source, Loader=yaml.FullLoader) # todo: refactor
-        doc_type = yaml_obj.get('kind', '')
-        
-        if doc_type == "application":
-            app_name = pathlib.Path(params.text_document.uri).name.replace(".yaml", "")
-            applications.reload_app_details(app_name=app_name, app_source=source)
-            
-        elif doc_type == "TerraForm":
-            srv_name = pathlib.Path(params.text_document.uri).name.replace(".yaml", "")
-            services.reload_service_details(srv_name, srv_source=source)
+        server.active_document_uri = text_doc.uri
+        update_document_analysis(text_doc, params.content_changes)
+        # changes made within the delay are validated together
+        VALIDATION_SCHEDULER.schedule(text_doc.uri, text_doc.version,
+                                      functools.partial(_validate_changed_document, server))
+
+
+async def _validate_changed_document(server: TorqueLanguageServer, uri: str, version: Optional[int]):
+    """Validates the changed document and the blueprints referring to it
+    if the inputs or outputs of the application or service changed"""
+    if uri not in server.workspace.documents:
+        # closed meanwhile
+        return
+
+    text_doc = server.workspace.get_document(uri)
+    if text_doc.version != version:
+        # superseded by a newer version, it's validated on its own
+        return
+
+    source = text_doc.source
+    analysis = await _validate_document(server, uri)
+    if analysis is None:
+        return
+
+    doc_type = analysis.kind
+
+    if doc_type == "application":
+        app_name = pathlib.Path(uri).name.replace(".yaml", "")
+        if applications.reload_app_details(app_name=app_name, app_source=source, app_tree=analysis.tree):
+            await _validate_blueprints(server, REFERENCE_GRAPH.get_blueprints((APPLICATION, app_name)))
+
+    elif doc_type == "TerraForm":
+        srv_name = pathlib.Path(uri).name.replace(".yaml", "")
+        if services.reload_service_details(srv_name, srv_source=source, srv_tree=analysis.tree):
+            await _validate_blueprints(server, REFERENCE_GRAPH.get_blueprints((SERVICE, srv_name)))
 
 
 @torque_ls.feature(TEXT_DOCUMENT_DID_OPEN)
@@ -170,46 +317,116 @@ async def did_open(server: TorqueLanguageServer, params: DidOpenTextDocumentPara
        '/applications/' in params.text_document.uri or \
        '/services/' in params.text_document.uri:
         server.latest_opened_document = params.text_document
+        server.active_document_uri = params.text_document.uri
         server.show_message('Detected a Torque file', msg_type=MessageType.Log)
         server.workspace.put_document(params.text_document)
-        _validate(server, params)
-
+        VALIDATION_SCHEDULER.cancel(params.text_document.uri)
+        await _validate(server, params)
+
+
+@torque_ls.feature(TEXT_DOCUMENT_DID_CLOSE)
+def did_close(server: TorqueLanguageServer, params: DidCloseTextDocumentParams):
+    """Text document did close notification."""
+    VALIDATION_SCHEDULER.forget(params.text_document.uri)
+    remove_document_analysis(params.text_document.uri)
+    name = pathlib.Path(params.text_document.uri).name.replace(".yaml", "")
+    if '/applications/' in params.text_document.uri:
+        applications.forget_app_document(name)
+    elif '/services/' in params.text_document.uri:
+        services.forget_service_document(name)
+    if '/blueprints/' in params.text_document.uri:
+        # unsaved changes of the blueprint are discarded
+        REFERENCE_GRAPH.reload_blueprint(params.text_document.uri)
+
+
+@torque_ls.feature(WORKSPACE_DID_CHANGE_CONFIGURATION)
+def configuration_changed(server: TorqueLanguageServer, params: DidChangeConfigurationParams):
+    """Applies the settings of the server section, the client sends them on start and on every change"""
+    settings = params.settings.get(TorqueLanguageServer.CONFIGURATION_SECTION) \
+        if isinstance(params.settings, dict) else None
+    if not isinstance(settings, dict):
+        return
+
+    delay = settings.get("validationDelay")
+    if isinstance(delay, (int, float)):
+        # milliseconds in the settings
+        VALIDATION_SCHEDULER.set_delay(delay / 1000)
+    else:
+        VALIDATION_SCHEDULER.set_delay(DEBOUNCE_DELAY)
 
 
 @torque_ls.feature(WORKSPACE_DID_CHANGE_WATCHED_FILES)
 async def workspace_changed(server: TorqueLanguageServer, params: DidChangeWorkspaceFoldersParams):
     """Workspace changed notification."""
-    current_file_changed = False
-    for change in params.changes:
-        if change.uri != server.latest_opened_document.uri:
-            if '/applications/' in change.uri or '/services/' in change.uri:        
-                if change.type != workspace.FileChangeType.Deleted:
-                    text_doc = server.workspace.get_document(change.uri)
-                    source = text_doc.source
-                    yaml_obj = yaml.load(source, Loader=yaml.FullLoader) # todo: refactor
-                    doc_type = yaml_obj.get('kind', '')
-                    
-                    if doc_type == "application":
-                        app_name = pathlib.Path(change.uri).name.replace(".yaml", "")
-                        applications.reload_app_details(app_name=app_name, app_source=source)
-                        
-                    elif doc_type == "TerraForm":
-                        srv_name = pathlib.Path(change.uri).name.replace(".yaml", "")
-                        services.reload_service_details(srv_name, srv_source=source)
+    latest_uri = server.latest_opened_document.uri if server.latest_opened_document else None
+    # blueprints are revalidated only if they refer to the apps and services whose inputs or outputs changed
+    changed_resources = set()
+    # definitions of apps and services are reported by both watchers of the client
+    changes = list({(change.uri, change.type): change for change in params.changes}.values())
+    definition_changes = [change for change in changes if change.uri.endswith('.yaml') and
+                          ('/applications/' in change.uri or '/services/' in change.uri)]
+    rescan = len(definition_changes) > RESCAN_THRESHOLD
+    for change in changes:
+        invalidate_file(to_fs_path(change.uri), listing_changed=change.type != workspace.FileChangeType.Changed)
+        if change.uri == latest_uri:
+            continue
+
+        if '/blueprints/' in change.uri:
+            # references of the open blueprints are updated when they are validated
+            if change.uri not in server.workspace.documents:
+                if change.type == workspace.FileChangeType.Deleted:
+                    REFERENCE_GRAPH.remove_blueprint(change.uri)
                 else:
-                    if '/applications/' in change.uri:
-                        app_name = pathlib.Path(change.uri).name.replace(".yaml", "")
-                        applications.remove_app_details(app_name=app_name)
-                        
-                    elif '/services/' in change.uri:
-                        srv_name = pathlib.Path(change.uri).name.replace(".yaml", "")
-                        services.remove_service_details(srv_name)
-        else:
-            current_file_changed = True
+                    REFERENCE_GRAPH.reload_blueprint(change.uri)
+
+        elif '/applications/' in change.uri or '/services/' in change.uri:
+            change_path = pathlib.Path(change.uri)
+            if not change_path.name.endswith('.yaml'):
+                # scripts and variables files of the resource
+                kind = APPLICATION if '/applications/' in change.uri else SERVICE
+                WORKSPACE_INDEX.update_file(kind, change_path.parent.name, change_path.name,
+                                            exists=change.type != workspace.FileChangeType.Deleted)
+
+            elif rescan:
+                continue
+
+            elif change.type != workspace.FileChangeType.Deleted:
+                text_doc = server.workspace.get_document(change.uri)
+                source = text_doc.source
+                doc_type = Parser.get_document_kind(source)
+
+                if doc_type == "application":
+                    app_name = pathlib.Path(change.uri).name.replace(".yaml", "")
+                    if applications.reload_app_details(app_name=app_name, app_source=source):
+                        changed_resources.add((APPLICATION, app_name))
+
+                elif doc_type == "TerraForm":
+                    srv_name = pathlib.Path(change.uri).name.replace(".yaml", "")
+                    if services.reload_service_details(srv_name, srv_source=source):
+                        changed_resources.add((SERVICE, srv_name))
+            else:
+                if '/applications/' in change.uri:
+                    app_name = pathlib.Path(change.uri).name.replace(".yaml", "")
+                    applications.remove_app_details(app_name=app_name)
+                    changed_resources.add((APPLICATION, app_name))
+
+                elif '/services/' in change.uri:
+                    srv_name = pathlib.Path(change.uri).name.replace(".yaml", "")
+                    services.remove_service_details(srv_name)
+                    changed_resources.add((SERVICE, srv_name))
+
+    if rescan:
+        # definitions of the open documents are indexed from the documents
+        open_names = {pathlib.Path(uri).name.replace(".yaml", "") for uri in server.workspace.documents}
+        for kind in (APPLICATION, SERVICE):
+            changed_resources.update((kind, name) for name in WORKSPACE_INDEX.rescan(kind, exclude=open_names))
+        # rescanned definitions were summarized from some of their sections
+        executor = WORKER_POOL.get_process_executor()
+        for kind in (APPLICATION, SERVICE):
+            changed_resources.update((kind, name) for name in await WORKSPACE_INDEX.verify(kind, executor))
+
     try:
-        if '/blueprints/' in server.latest_opened_document.uri and not current_file_changed:
-            print('validating')
-            _validate(server, DidOpenTextDocumentParams(text_document=server.latest_opened_document))
+        await _validate_blueprints(server, REFERENCE_GRAPH.get_blueprints(*changed_resources))
     except Exception as ex:
         logging.error(ex)
 
@@ -234,23 +451,23 @@ async def workspace_changed(server: TorqueLanguageServer, params: DidChangeWorks
 @torque_ls.feature(COMPLETION, CompletionOptions(resolve_provider=False))
 def completions(params: Optional[CompletionParams] = None) -> CompletionList:
     """Returns completion items."""
+    with torque_ls.scheduler.interactive():
+        return _get_completions(params)
+
+
+def _get_completions(params: CompletionParams) -> CompletionList:
     doc = torque_ls.workspace.get_document(params.text_document.uri)
-    
-    try:
-        yaml_obj = yaml.load(doc.source, Loader=yaml.FullLoader)
-        if yaml_obj:
-            doc_type = yaml_obj.get('kind', '')
-        else:
-            return CompletionList(is_incomplete=True, items=[])
-    except yaml.MarkedYAMLError as ex:
+    # while the document is being edited and can't be parsed,
+    # the tree of its last parsed version is used
+    doc_type, tree, tree_position = get_tree_for_position(doc, params.position)
+    if doc_type is None:
         return CompletionList(is_incomplete=True, items=[])
 
-    tree = Parser(doc.source).parse()
     words = common.preceding_words(doc, params.position)
     last_word = words[-1] if words else ""
     
     if last_word.endswith('$') or last_word.endswith(':'):
-        if is_var_allowed(tree, params.position):
+        if is_var_allowed(tree, tree_position):
             inputs_names_list = [i_node.key.text for i_node in tree.get_inputs()]
             if doc_type == "blueprint":
                 inputs_names_list.append("torque")
@@ -276,14 +493,10 @@ def completions(params: Optional[CompletionParams] = None) -> CompletionList:
         if last_word.endswith('.'):
             if words and len(words) > 1 and words[1] == words[-1] and words[0] != '-':
                 cur_word = words[-1]
-                word_parts = cur_word.split('$')
-                if word_parts:
-                    if word_parts[-1].startswith('{torque.'):
-                        cur_word = word_parts[-1][1:]
-                    elif word_parts[-1].startswith('torque.'):
-                        cur_word = word_parts[-1]
-                    else:
-                        cur_word = ''
+                if '$' in cur_word:
+                    cur_word = get_trailing_reference(cur_word) or ''
+                if not cur_word.startswith('torque.'):
+                    cur_word = ''
                 if cur_word:
                     options = []
                     if cur_word.startswith('torque'):
@@ -314,25 +527,15 @@ def completions(params: Optional[CompletionParams] = None) -> CompletionList:
                             if len(parts) == 4 and parts[2] != '':
                                 options = ['outputs', 'dns']
                             elif len(parts) == 5 and parts[3] == 'outputs':
-                                apps = applications.get_available_applications(root)
-                                for app in apps:
-                                    if app == parts[2]:
-                                        outputs = applications.get_app_outputs(app_name=parts[2])
-                                        if outputs:
-                                            options.extend(outputs)
-                                        break
+                                applications.get_available_applications(root)
+                                options.extend(applications.get_app_outputs(app_name=parts[2]))
                         elif cur_word.startswith('torque.services.'):
                             parts = cur_word.split('.')
                             if len(parts) == 4 and parts[2] != '':
                                 options.append('outputs')
                             elif len(parts) == 5 and parts[3] == 'outputs':
-                                apps = services.get_available_services(root)
-                                for app in apps:
-                                    if app == parts[2]:
-                                        outputs = services.get_service_outputs(srv_name=parts[2])
-                                        if outputs:
-                                            options.extend(outputs)
-                                        break
+                                services.get_available_services(root)
+                                options.extend(services.get_service_outputs(srv_name=parts[2]))
     
                     line = params.position.line
                     char = params.position.character
@@ -358,25 +561,27 @@ def completions(params: Optional[CompletionParams] = None) -> CompletionList:
             if parent == "applications":
                 apps = applications.get_available_applications(root)
                 for app in apps:
-                    if apps[app]['app_completion']:
+                    completion = applications.get_app_completion(app)
+                    if completion:
                         items.append(CompletionItem(label=app,
                                                     kind=CompletionItemKind.Reference,
                                                     text_edit=TextEdit(
                                                                     range=Range(start=Position(line=line, character=char-2),
                                                                                 end=Position(line=line, character=char)),
-                                                                    new_text=apps[app]['app_completion'],
+                                                                    new_text=completion,
                                                     )))
     
             if parent == "services":
                 srvs = services.get_available_services(root)
                 for srv in srvs:
-                    if srvs[srv]['srv_completion']:
+                    completion = services.get_service_completion(srv)
+                    if completion:
                         items.append(CompletionItem(label=srv,
                                                     kind=CompletionItemKind.Reference,
                                                     text_edit=TextEdit(
                                                                     range=Range(start=Position(line=line, character=char-2),
                                                                                 end=Position(line=line, character=char)),
-                                                                    new_text=srvs[srv]['srv_completion'],
+                                                                    new_text=completion,
                                                     )))
         
         if items:
@@ -496,24 +701,26 @@ def completions(params: Optional[CompletionParams] = None) -> CompletionList:
 
 @torque_ls.feature(DOCUMENT_LINK)
 async def lsp_document_link(server: TorqueLanguageServer, params: DocumentLinkParams,) -> List[DocumentLink]:
-    await asyncio.sleep(DEBOUNCE_DELAY)
+    # links are computed after the diagnostics of the documents with a higher priority
+    async with server.scheduler.slot(server.get_priority(params.text_document.uri)):
+        return _get_document_links(server, params)
+
+
+def _get_document_links(server: TorqueLanguageServer, params: DocumentLinkParams) -> List[DocumentLink]:
     links: List[DocumentLink] = []
     
     doc = torque_ls.workspace.get_document(params.text_document.uri)
-    try:
-        yaml_obj = yaml.load(doc.source, Loader=yaml.FullLoader)
-        if yaml_obj:
-            doc_type = yaml_obj.get('kind', '')
-        else:
-            return links
-    except yaml.MarkedYAMLError as ex:
+    analysis = get_document_analysis(doc)
+
+    doc_type = analysis.kind
+    if doc_type is None:
         return links
 
     root = torque_ls.workspace.root_path        
 
     if doc_type == "blueprint":
         try:
-            bp_tree = Parser(doc.source).parse()            
+            bp_tree = analysis.get_tree()
         except Exception as ex:
             import sys
             logging.error('Error on line {}'.format(sys.exc_info()[-1].tb_lineno), type(ex).__name__, ex)
@@ -541,7 +748,7 @@ async def lsp_document_link(server: TorqueLanguageServer, params: DocumentLinkPa
     
     elif doc_type == "application":
         try:
-            app_tree: AppTree = Parser(doc.source).parse()        
+            app_tree: AppTree = analysis.get_tree()
             app_name = doc.filename.replace('.yaml', '')    
         except Exception as ex:
             import sys
@@ -572,7 +779,7 @@ async def lsp_document_link(server: TorqueLanguageServer, params: DocumentLinkPa
 
     elif doc_type == "TerraForm":
         try:
-            srv_tree = Parser(doc.source).parse()        
+            srv_tree = analysis.get_tree()
             srv_name = doc.filename.replace('.yaml', '')    
         except Exception as ex:
             import sys
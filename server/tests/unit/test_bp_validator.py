@@ -0,0 +1,40 @@
+from pygls.workspace import Document
+
+from server.ats.parser import Parser
+from server.validation.bp_validatior import BlueprintValidationHandler
+
+BLUEPRINT = '''spec_version: 1
+kind: blueprint
+
+inputs:
+  - HOST
+  - PORT
+  - DB
+  - TAG
+  - UNUSED
+  # - COMMENTED
+
+applications:
+  - web:
+      input_values:
+        - URL: http://$HOST:80/${PORT}
+        - DB_HOST: $DB_HOST
+        - DB_NAME: $DB-main
+        - NOTE: see $COMMENTED # and $UNUSED
+'''
+
+
+def _get_unused_inputs(source: str) -> list:
+    tree = Parser(source).parse()
+    handler = BlueprintValidationHandler(tree, Document("file:///workspace/blueprints/bp.yaml", source))
+    handler._check_for_unused_blueprint_inputs()
+    return sorted(diagnostic.message for diagnostic in handler._diagnostics)
+
+
+def test_embedded_references_use_inputs():
+    assert _get_unused_inputs(BLUEPRINT) == ["Unused variable TAG", "Unused variable UNUSED"]
+
+
+def test_references_in_comments_are_not_uses():
+    source = BLUEPRINT.replace("$DB-main", "main # $DB")
+    assert _get_unused_inputs(source) == ["Unused variable DB", "Unused variable TAG", "Unused variable UNUSED"]
@@ -0,0 +1,49 @@
+from server.ats.diff import ADDED, MODIFIED, MOVED, REMOVED, diff
+from server.ats.parser import Parser
+
+APP = '''kind: application
+spec_version: 1
+inputs:
+  - PORT: 80
+  - HOST
+outputs:
+  - URL
+configuration:
+  start:
+    command: ./start.sh
+'''
+
+
+def _get_changes(old_source: str, new_source: str) -> list:
+    result = diff(Parser(old_source).parse(), Parser(new_source).parse())
+    return [(change.change_type, change.path) for change in result.changes]
+
+
+def test_equal_trees_have_no_changes():
+    result = diff(Parser(APP).parse(), Parser(APP.replace("kind", "# the app\nkind")).parse())
+    assert not result
+    assert not result.affects(("inputs",))
+
+
+def test_changes_are_located_by_logical_paths():
+    source = APP.replace("80", "8080").replace("  - URL\n", "  - IP\n").replace("./start.sh", "./run.sh")
+    assert _get_changes(APP, source) == [
+        (MODIFIED, ("inputs", "PORT")),
+        (REMOVED, ("outputs", "URL")),
+        (ADDED, ("outputs", "IP")),
+        (MODIFIED, ("configuration", "start", "command")),
+    ]
+
+
+def test_reordering_does_not_affect_content():
+    source = APP.replace("  - PORT: 80\n  - HOST\n", "  - HOST\n  - PORT: 80\n")
+    old_tree = Parser(APP).parse()
+    result = diff(old_tree, Parser(source).parse())
+    assert [change.change_type for change in result.changes] == [MOVED, MOVED]
+    assert not result.affects(("inputs",), ("outputs",))
+    assert result.affects(("inputs", "HOST")) is False
+    assert diff(old_tree, Parser(APP.replace("HOST", "HOST: x")).parse()).affects(("inputs",))
+
+
+def test_changed_kind_replaces_the_root():
+    assert _get_changes(APP, APP.replace("application", "blueprint")) == [(MODIFIED, ())]
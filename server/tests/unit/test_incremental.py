@@ -0,0 +1,171 @@
+from pygls.lsp.types import Position, Range
+
+from server.ats.incremental import reparse_block
+from server.ats.parser import Parser
+from server.ats.trees.common import TextNode
+
+BLUEPRINT = '''spec_version: 1
+kind: blueprint
+
+inputs:
+  - DB_USER: admin
+  - PORT
+
+applications:
+  - web:
+      instances: 2
+      input_values:
+        - PORT: $PORT
+      depends_on:
+        - db
+  - db:
+      instances: 1
+  - cache:
+      instances: 3
+
+services:
+  - bucket:
+      input_values:
+        - NAME: artifacts
+'''
+
+
+def _edit(source: str, start: tuple, end: tuple, text: str):
+    """Replaces the text between the positions, returns the new source and the changed range"""
+    lines = source.split('\n')
+    before = '\n'.join(lines[:start[0]] + [lines[start[0]][:start[1]]])
+    after = '\n'.join([lines[end[0]][end[1]:]] + lines[end[0] + 1:])
+    change_range = Range(start=Position(line=start[0], character=start[1]),
+                         end=Position(line=end[0], character=end[1]))
+    return before + text + after, change_range
+
+
+def _dump(node, out=None) -> list:
+    out = [] if out is None else out
+    out.append((type(node).__name__, node.start_pos, node.end_pos,
+                node.text if isinstance(node, TextNode) else None))
+    for child in node.get_children():
+        _dump(child, out)
+    return out
+
+
+def _get_errors(tree) -> list:
+    return sorted((error.start_pos, error.end_pos, error.message) for error in tree.error_sink)
+
+
+def _splice(source: str, start: tuple, end: tuple, text: str):
+    """Returns whether the change was spliced, the spliced tree and the tree of a full reparse"""
+    new_source, change_range = _edit(source, start, end, text)
+    tree = Parser(source).parse()
+    spliced = reparse_block(tree, "blueprint", source, new_source, change_range)
+    return spliced, tree, Parser(new_source).parse()
+
+
+def _assert_same_trees(tree, full_tree):
+    assert _dump(tree) == _dump(full_tree)
+    assert _get_errors(tree) == _get_errors(full_tree)
+
+
+def _assert_splice(source: str, start: tuple, end: tuple, text: str, spliced: bool) -> None:
+    """Checks that the change is spliced or refused as expected. The spliced tree must be
+    the same as the tree of a full reparse, a refused change must leave the tree as it was"""
+    new_source, change_range = _edit(source, start, end, text)
+    tree = Parser(source).parse()
+    assert reparse_block(tree, "blueprint", source, new_source, change_range) is spliced
+    _assert_same_trees(tree, Parser(new_source if spliced else source).parse())
+
+
+def test_value_changed_in_place():
+    spliced, tree, full_tree = _splice(BLUEPRINT, (9, 17), (9, 18), "5")
+    assert spliced
+    _assert_same_trees(tree, full_tree)
+
+
+def test_lines_added_to_first_item():
+    spliced, tree, full_tree = _splice(BLUEPRINT, (13, 12), (13, 12), "\n        - cache")
+    assert spliced
+    _assert_same_trees(tree, full_tree)
+
+
+def test_lines_removed_from_first_item():
+    spliced, tree, full_tree = _splice(BLUEPRINT, (11, 21), (13, 12), "")
+    assert spliced
+    _assert_same_trees(tree, full_tree)
+
+
+def test_lines_added_to_middle_item():
+    spliced, tree, full_tree = _splice(BLUEPRINT, (15, 18), (15, 18), "\n      depends_on:\n        - web")
+    assert spliced
+    _assert_same_trees(tree, full_tree)
+
+
+def test_last_item_of_document():
+    spliced, tree, full_tree = _splice(BLUEPRINT, (22, 16), (22, 25), "logs\n        - EXTRA: 1")
+    assert spliced
+    _assert_same_trees(tree, full_tree)
+
+
+def test_errors_are_replaced():
+    spliced, tree, full_tree = _splice(BLUEPRINT, (9, 6), (9, 15), "unknown")
+    assert spliced
+    assert _get_errors(full_tree)
+    _assert_same_trees(tree, full_tree)
+
+
+def test_change_outside_of_item_is_not_spliced():
+    source = BLUEPRINT
+    tree = Parser(source).parse()
+    before = _dump(tree)
+    new_source, change_range = _edit(source, (18, 0), (18, 0), "\nclouds:\n  - AWS: us-east-1")
+    assert not reparse_block(tree, "blueprint", source, new_source, change_range)
+    assert _dump(tree) == before
+
+
+def test_oddly_indented_items():
+    # the start of the sequence is placed at its last item by the parser
+    source = '''spec_version: 1
+kind: blueprint
+
+applications:
+# comment
+   - a0:
+      input_values:
+      - A: 0
+   - a1:
+     instances: 1
+   - a2:
+services:
+- s0:
+'''
+    _assert_splice(source, (6, 16), (6, 16), "", spliced=True)
+    _assert_splice(source, (7, 0), (7, 0), " ", spliced=True)
+    # the block of the item contains the start of the sequence
+    _assert_splice(source, (9, 17), (9, 17), "0", spliced=False)
+
+
+def test_error_of_ancestor_in_block():
+    # 'instances' is on the level of the application name, the error is attached outside of the item
+    source = '''spec_version: 1
+kind: blueprint
+
+applications:
+   - a0:
+     instances: 0
+   - a1:
+      instances: 1
+'''
+    _assert_splice(source, (5, 5), (5, 5), "  ", spliced=False)
+
+
+def test_error_on_last_line_of_document():
+    # the error found on the last line of the item is attached outside of the item
+    source = '''spec_version: 1
+kind: blueprint
+
+services:
+- s0:
+    instances: 0'''
+    _assert_splice(source, (5, 0), (5, 2), "", spliced=False)
+    # the error of a property on the last line is found in the item and spliced with it
+    source = source.replace("    instances: 0", "    input_values:\n    - A: 1")
+    _assert_splice(source, (6, 0), (6, 10), "    instances: 0", spliced=True)
@@ -0,0 +1,70 @@
+import pytest
+import yaml
+
+from server.ats.parser import Parser, ParserError
+
+# the value of 'clouds' is a mapping with an empty key, which the YAML parser rejects
+INVALID_YAML = '''spec_version: 1
+kind: blueprint
+clouds:
+ :  - AWS: us-east-1
+'''
+
+# valid YAML: 'instances' is on the level of the application name, so the stream
+# has more block ends than the parser opened
+WRONG_STRUCTURE = '''spec_version: 1
+kind: blueprint
+
+applications:
+  - web:
+    instances: 1
+'''
+
+
+def test_invalid_yaml_is_reported_by_loader():
+    with pytest.raises(yaml.YAMLError):
+        Parser(INVALID_YAML).parse()
+
+
+def test_invalid_yaml_is_recovered():
+    parser = Parser(INVALID_YAML)
+    tree = parser.parse(recover=True)
+    assert parser.error is not None
+    assert tree.kind.value.text == "blueprint"
+
+
+def test_wrong_structure_is_parser_error():
+    with pytest.raises(ParserError) as info:
+        Parser(WRONG_STRUCTURE).parse()
+    assert info.value.message == "Wrong structure of document"
+    assert info.value.start_pos == (6, 0)
+
+
+def test_wrong_structure_is_recovered():
+    parser = Parser(WRONG_STRUCTURE)
+    tree = parser.parse(recover=True)
+    assert parser.error.start_pos == (6, 0)
+    assert parser.error in list(tree.error_sink)
+
+
+def test_errors_are_selected_by_subtree():
+    source = '''spec_version: 1
+kind: blueprint
+
+applications:
+  - web:
+      bogus: 1
+  - db:
+      unknown: 1
+      other: 2
+'''
+    tree = Parser(source).parse()
+    web, db = tree.applications.value.nodes
+    assert [error.start_pos for error in tree.error_sink.get_errors(web)] == [(5, 6)]
+    db_errors = tree.error_sink.get_errors(db)
+    assert [error.start_pos for error in db_errors] == [(7, 6), (8, 6)]
+    assert len(tree.error_sink) == 3
+
+    assert tree.error_sink.remove(db) == db_errors
+    assert tree.error_sink.get_errors(db) == []
+    assert [error.start_pos for error in tree.error_sink] == [(5, 6)]
@@ -0,0 +1,123 @@
+import asyncio
+
+from server.utils.priority_scheduler import Priority, PriorityScheduler
+
+
+def _run(coro):
+    return asyncio.run(coro)
+
+
+def test_waiting_jobs_are_served_by_priority():
+    async def main():
+        scheduler = PriorityScheduler(slots=1)
+        order = []
+        release = asyncio.Event()
+
+        async def job(name, priority, wait=False):
+            async with scheduler.slot(priority):
+                order.append(name)
+                if wait:
+                    await release.wait()
+
+        first = asyncio.ensure_future(job("first", Priority.BACKGROUND, wait=True))
+        await asyncio.sleep(0)
+        others = [asyncio.ensure_future(job(name, priority)) for name, priority in (
+            ("background", Priority.BACKGROUND),
+            ("open", Priority.OPEN_DOCUMENT),
+            ("active", Priority.ACTIVE_DOCUMENT),
+        )]
+        await asyncio.sleep(0)
+        assert scheduler.get_queue_depth() == 3
+
+        release.set()
+        await asyncio.gather(first, *others)
+        return order
+
+    assert _run(main()) == ["first", "active", "open", "background"]
+
+
+def test_running_job_is_preempted_at_checkpoint():
+    async def main():
+        scheduler = PriorityScheduler(slots=1)
+        order = []
+        queued = asyncio.Event()
+
+        async def background():
+            async with scheduler.slot(Priority.BACKGROUND):
+                for step in range(3):
+                    order.append(f"background {step}")
+                    await queued.wait()
+                    await scheduler.checkpoint(Priority.BACKGROUND)
+
+        async def active():
+            async with scheduler.slot(Priority.ACTIVE_DOCUMENT):
+                order.append("active")
+
+        running = asyncio.ensure_future(background())
+        await asyncio.sleep(0)
+        waiting = asyncio.ensure_future(active())
+        await asyncio.sleep(0)
+        assert scheduler.get_queue_depth() == 1
+        queued.set()
+        await asyncio.gather(running, waiting)
+        return order, scheduler.get_metrics()
+
+    order, metrics = _run(main())
+    assert order == ["background 0", "active", "background 1", "background 2"]
+    assert metrics["preemptions"] == 1
+    # the slot taken again after the preemption is not a wait of another job
+    assert metrics["wait_times"]["background"]["count"] == 1
+    assert metrics["wait_times"]["active_document"]["count"] == 1
+    assert metrics["running"] == 0
+
+
+def test_checkpoint_without_waiting_jobs_keeps_slot():
+    async def main():
+        scheduler = PriorityScheduler(slots=1)
+        async with scheduler.slot(Priority.ACTIVE_DOCUMENT):
+            await scheduler.checkpoint(Priority.ACTIVE_DOCUMENT)
+        return scheduler.get_metrics()
+
+    metrics = _run(main())
+    assert metrics["preemptions"] == 0
+    assert metrics["wait_times"]["active_document"]["count"] == 1
+
+
+def test_cancelled_job_leaves_queue():
+    async def main():
+        scheduler = PriorityScheduler(slots=1)
+        release = asyncio.Event()
+
+        async def holder():
+            async with scheduler.slot(Priority.BACKGROUND):
+                await release.wait()
+
+        async def waiter():
+            async with scheduler.slot(Priority.OPEN_DOCUMENT):
+                pass
+
+        running = asyncio.ensure_future(holder())
+        await asyncio.sleep(0)
+        waiting = asyncio.ensure_future(waiter())
+        await asyncio.sleep(0)
+        assert scheduler.get_queue_depth() == 1
+
+        waiting.cancel()
+        await asyncio.gather(waiting, return_exceptions=True)
+        assert scheduler.get_queue_depth() == 0
+
+        release.set()
+        await running
+        return scheduler.get_metrics()
+
+    assert _run(main())["running"] == 0
+
+
+def test_interactive_requests_are_collected():
+    scheduler = PriorityScheduler(slots=1)
+    with scheduler.interactive():
+        pass
+
+    metrics = scheduler.get_metrics()
+    assert metrics["wait_times"]["interactive"]["count"] == 1
+    assert "interactive" not in metrics["queue_depth"]
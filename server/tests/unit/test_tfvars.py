@@ -0,0 +1,97 @@
+import re
+
+from server.utils.tfvars import TfvarsVariable, iter_tfvars_variables
+
+SAMPLE_TFVARS = '''region = "eu-west-1"
+instance_type    = "t2.micro"
+"bucket_name" = "artifacts"
+count = 3
+enabled = true
+'''
+
+
+def _read_with_regex(content: str) -> list:
+    """The reader the lexer replaced"""
+    return re.findall(r"(^.+?)\s*=", content, re.MULTILINE)
+
+
+def _get_names(content: str) -> list:
+    return [var.name for var in iter_tfvars_variables(content.splitlines(True))]
+
+
+def test_plain_assignments_match_regex_reader():
+    expected = [name.strip('"') for name in _read_with_regex(SAMPLE_TFVARS)]
+    assert _get_names(SAMPLE_TFVARS) == expected
+
+
+def test_quoted_name():
+    variables = list(iter_tfvars_variables(['"bucket_name" = "artifacts"\n']))
+    assert variables == [TfvarsVariable(name="bucket_name", start_pos=(0, 1), end_pos=(0, 12),
+                                        value_start=(0, 16), value_end=(0, 27))]
+
+
+def test_unbalanced_quote_is_not_a_name():
+    assert _get_names('"region = "eu"\nzone = "a"\n') == ["zone"]
+
+
+def test_nested_keys_are_skipped():
+    content = '''tags = {
+  owner = "me"
+  nested = {
+    deep = [1, 2]
+  }
+}
+subnets = [
+  "a",
+  "b",
+]
+after = 1
+'''
+    assert _get_names(content) == ["tags", "subnets", "after"]
+
+
+def test_multiline_value_span():
+    content = 'tags = {\n  owner = "me"\n}\n'
+    variable, = iter_tfvars_variables(content.splitlines(True))
+    assert variable.value_start == (0, 7)
+    assert variable.value_end == (2, 1)
+
+
+def test_comments_are_skipped():
+    content = '''# commented = 1
+// also = 2
+/* block = 3
+   still = 4 */
+name = "x" # trailing = 5
+'''
+    assert _get_names(content) == ["name"]
+
+
+def test_heredoc_body_is_skipped():
+    content = '''script = <<EOT
+key = value
+  EOT
+indented = <<-EOT
+    inner = 1
+    EOT
+last = 1
+'''
+    assert _get_names(content) == ["script", "indented", "last"]
+
+
+def test_template_interpolation_with_quotes():
+    content = '''greeting = "hello ${var.names["first"]} = ${lookup(x, "}")}"
+escaped = "$${not = template}"
+after = 1
+'''
+    assert _get_names(content) == ["greeting", "escaped", "after"]
+
+
+def test_comparison_is_not_an_assignment():
+    assert _get_names('a == b\nc => d\ne = 1\n') == ["e"]
+
+
+def test_unterminated_value_at_end_of_file():
+    variables = list(iter_tfvars_variables(['tags = {\n', '  owner = "me"\n']))
+    assert [var.name for var in variables] == ["tags"]
+    assert variables[0].value_end == (1, 14)
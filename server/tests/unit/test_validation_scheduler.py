@@ -0,0 +1,112 @@
+import asyncio
+
+from server.utils.validation_scheduler import ValidationScheduler
+
+URI = "file:///workspace/blueprints/main.yaml"
+OTHER_URI = "file:///workspace/blueprints/other.yaml"
+DELAY = 0.01
+
+
+def _run(coro):
+    return asyncio.run(coro)
+
+
+def test_changes_within_delay_are_coalesced():
+    async def main():
+        scheduler = ValidationScheduler(delay=DELAY)
+        calls = []
+        for version in (2, 3, 4):
+            scheduler.schedule(URI, version, lambda uri, version: calls.append((uri, version)))
+        assert scheduler.is_pending(URI)
+        assert calls == []
+
+        await asyncio.sleep(DELAY * 5)
+        assert not scheduler.is_pending(URI)
+        return calls
+
+    assert _run(main()) == [(URI, 4)]
+
+
+def test_documents_are_debounced_separately():
+    async def main():
+        scheduler = ValidationScheduler(delay=DELAY)
+        calls = []
+        scheduler.schedule(URI, 2, lambda uri, version: calls.append((uri, version)))
+        scheduler.schedule(OTHER_URI, 7, lambda uri, version: calls.append((uri, version)))
+        await asyncio.sleep(DELAY * 5)
+        return calls
+
+    assert sorted(_run(main())) == [(URI, 2), (OTHER_URI, 7)]
+
+
+def test_cancelled_validation_is_dropped():
+    async def main():
+        scheduler = ValidationScheduler(delay=DELAY)
+        calls = []
+        scheduler.schedule(URI, 2, lambda uri, version: calls.append(version))
+        assert scheduler.cancel(URI)
+        assert not scheduler.cancel(URI)
+        await asyncio.sleep(DELAY * 5)
+        return calls
+
+    assert _run(main()) == []
+
+
+def test_no_delay_validates_right_away():
+    async def main():
+        scheduler = ValidationScheduler(delay=DELAY)
+        scheduler.set_delay(-1)
+        calls = []
+        scheduler.schedule(URI, 2, lambda uri, version: calls.append(version))
+        assert not scheduler.is_pending(URI)
+        return calls
+
+    assert _run(main()) == [2]
+
+
+def test_coroutine_callback_runs_as_task():
+    async def main():
+        scheduler = ValidationScheduler(delay=DELAY)
+        calls = []
+
+        async def validate(uri, version):
+            await asyncio.sleep(0)
+            calls.append(version)
+
+        async def fail(uri, version):
+            raise ValueError("broken")
+
+        scheduler.schedule(URI, 2, validate)
+        scheduler.schedule(OTHER_URI, 3, fail)
+        await asyncio.sleep(DELAY * 5)
+        return calls
+
+    assert _run(main()) == [2]
+
+
+def test_older_versions_are_not_published():
+    scheduler = ValidationScheduler(delay=DELAY)
+    assert scheduler.can_publish(URI, 3)
+
+    scheduler.set_published(URI, 5)
+    assert not scheduler.can_publish(URI, 4)
+    assert scheduler.can_publish(URI, 5)
+    assert scheduler.can_publish(URI, 6)
+    # documents which are not open have no versions
+    assert scheduler.can_publish(URI, None)
+
+
+def test_reopened_document_starts_versions_anew():
+    async def main():
+        scheduler = ValidationScheduler(delay=DELAY)
+        calls = []
+        scheduler.set_published(URI, 10)
+        scheduler.schedule(URI, 11, lambda uri, version: calls.append(version))
+        scheduler.forget(URI)
+        await asyncio.sleep(DELAY * 5)
+        return scheduler, calls
+
+    scheduler, calls = _run(main())
+    assert calls == []
+    assert not scheduler.is_pending(URI)
+    assert scheduler.can_publish(URI, 1)
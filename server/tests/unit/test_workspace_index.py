@@ -0,0 +1,107 @@
+import asyncio
+
+from server.ats.parser import Parser
+from server.utils import applications
+from server.utils.workspace_index import APPLICATION, WorkspaceIndex, read_resource
+
+VALID_APP = '''kind: application
+inputs:
+  - PORT
+outputs:
+  - URL
+'''
+
+# the error is in a section the summaries skip
+INVALID_APP = '''kind: application
+inputs:
+  - PORT
+source: 1
+'''
+
+
+def _write_app(root, name: str, source: str) -> str:
+    folder = root / "applications" / name
+    folder.mkdir(parents=True, exist_ok=True)
+    path = folder / f"{name}.yaml"
+    path.write_text(source)
+    return str(path)
+
+
+def test_warm_up_verifies_summaries(tmp_path):
+    _write_app(tmp_path, "web", VALID_APP)
+    _write_app(tmp_path, "broken", INVALID_APP)
+    index = WorkspaceIndex()
+
+    assert asyncio.run(index.warm_up(str(tmp_path), executor=None)) == 2
+    web = index.get_resource(APPLICATION, "web")
+    broken = index.get_resource(APPLICATION, "broken")
+    assert web.summary.verified and web.valid
+    assert broken.summary.verified and not broken.valid
+
+
+def test_changed_file_is_summarized_again(tmp_path):
+    path = _write_app(tmp_path, "web", VALID_APP)
+    index = WorkspaceIndex()
+    assert asyncio.run(index.warm_up(str(tmp_path), executor=None)) == 1
+
+    # the summary is replaced with the unverified one of the file as it was
+    details = index.get_resource(APPLICATION, "web")
+    details.summary = read_resource(path)
+    with open(path, "w") as f:
+        f.write(INVALID_APP)
+
+    assert asyncio.run(index.verify(APPLICATION)) == {"web"}
+    details = index.get_resource(APPLICATION, "web")
+    assert details.summary.verified and not details.valid
+    assert details.outputs == ()
+
+
+def test_resources_updated_from_saved_files_are_not_read_again(tmp_path):
+    path = _write_app(tmp_path, "web", VALID_APP)
+    index = WorkspaceIndex()
+    assert asyncio.run(index.warm_up(str(tmp_path), executor=None)) == 1
+
+    # changed on disk and reported by the watcher
+    source = VALID_APP + "  - HOST\n"
+    with open(path, "w") as f:
+        f.write(source)
+    assert index.update_resource(APPLICATION, "web", source)
+    # added after the scan
+    _write_app(tmp_path, "db", INVALID_APP)
+    assert index.update_resource(APPLICATION, "db", INVALID_APP)
+
+    jobs, found = index._scan(APPLICATION, str(tmp_path))
+    assert jobs == []
+    assert found == {"web", "db"}
+
+
+def test_resources_updated_from_unsaved_documents_are_read_again(tmp_path):
+    _write_app(tmp_path, "web", VALID_APP)
+    index = WorkspaceIndex()
+    assert asyncio.run(index.warm_up(str(tmp_path), executor=None)) == 1
+
+    assert index.update_resource(APPLICATION, "web", VALID_APP + "  - HOST\n")
+    assert index.get_resource(APPLICATION, "web").outputs == ("URL", "HOST")
+    assert index.get_resource(APPLICATION, "web").stat is None
+    # the document was closed without saving
+    assert index.rescan(APPLICATION) == {"web"}
+    assert index.get_resource(APPLICATION, "web").outputs == ("URL",)
+
+
+def test_reloads_compare_the_trees_of_documents(tmp_path, monkeypatch):
+    _write_app(tmp_path, "web", VALID_APP)
+    index = WorkspaceIndex()
+    monkeypatch.setattr(applications, "WORKSPACE_INDEX", index)
+    monkeypatch.setattr(applications, "_APP_TREES", {})
+    assert asyncio.run(index.warm_up(str(tmp_path), executor=None)) == 1
+
+    def reload(source: str) -> bool:
+        return applications.reload_app_details("web", source, Parser(source).parse())
+
+    assert not reload(VALID_APP)
+    # reordered outputs are the same for blueprints
+    source = VALID_APP + "  - HOST\n"
+    assert reload(source)
+    assert not reload(source.replace("  - URL\n  - HOST\n", "  - HOST\n  - URL\n"))
+    assert index.get_resource(APPLICATION, "web").outputs == ("HOST", "URL")
+    assert reload(source.replace("HOST", "IP"))
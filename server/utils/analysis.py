@@ -0,0 +1,290 @@
+import threading
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+import yaml
+from yaml.tokens import Token
+from pygls.lsp.types import Diagnostic, Position, Range, TextDocumentContentChangeEvent
+from pygls.workspace import Document
+
+from server.ats import yaml_backend
+from server.ats.incremental import reparse_block
+from server.ats.parser import Parser, ParserError
+from server.ats.trees.common import BaseTree
+
+DIAGNOSTICS_SOURCE = "TorqueLanguageServer"
+
+ANALYSES: Dict[str, "DocumentAnalysis"] = {}
+# the latest analysis of each document which has a tree
+LAST_PARSED: Dict[str, "DocumentAnalysis"] = {}
+# uri -> number of the worker threads using the analyses of the document,
+# their trees are not changed in place meanwhile
+_IN_USE: Dict[str, int] = {}
+# guards the changes of the dicts above, they are made by the worker threads too
+_LOCK = threading.Lock()
+
+
+@dataclass
+class DocumentAnalysis:
+    """
+    Everything derived from a single version of a document.
+
+    One analysis is built per (uri, version) and shared by all the LSP
+    handlers, so the document is loaded, scanned and parsed only once
+    no matter how many requests are made against the same version.
+    """
+
+    uri: str
+    version: Optional[int]
+    source: str
+    normalized_source: str = ""
+    # None when the document is empty or is not a valid yaml mapping
+    kind: Optional[str] = None
+    yaml_diagnostics: List[Diagnostic] = field(default_factory=list)
+    # built lazily for documents which were reparsed incrementally
+    tokens: Optional[List[Token]] = None
+    tree: Optional[BaseTree] = None
+    parse_error: Optional[Exception] = None
+    # the last published diagnostics for this version
+    diagnostics: Optional[List[Diagnostic]] = None
+    # built on demand when the document couldn't be parsed
+    partial_tree: Optional[BaseTree] = None
+    partial_kind: Optional[str] = None
+
+    def is_same_version(self, document: Document) -> bool:
+        return self.version == document.version and self.source == document.source
+
+    def get_tokens(self) -> List[Token]:
+        if self.tokens is None:
+            self.tokens = list(yaml_backend.scan(self.normalized_source))
+
+        return self.tokens
+
+    def get_tree(self) -> BaseTree:
+        """Returns parsed tree or raises the error which didn't allow to build it"""
+        if self.parse_error is not None:
+            raise self.parse_error
+
+        return self.tree
+
+    def get_partial_tree(self) -> Optional[BaseTree]:
+        """Returns the tree even if the document is invalid. In this case the tree
+        contains only the nodes parsed before the error"""
+        if self.tree is not None:
+            return self.tree
+
+        if self.partial_tree is None:
+            try:
+                kind = self.kind if self.kind is not None else Parser.get_document_kind(self.normalized_source)
+                self.partial_tree = Parser(self.normalized_source, kind=kind or '').parse(recover=True)
+            except (yaml.YAMLError, ParserError):
+                # the kind of the document is unknown
+                return None
+
+            self.partial_kind = kind
+
+        return self.partial_tree
+
+
+def validate_yaml(source: str) -> List[Diagnostic]:
+    """Validates yaml file."""
+    return _load_yaml(source)[1]
+
+
+def _load_yaml(source: str):
+    diagnostics = []
+    yaml_obj = None
+
+    try:
+        yaml_obj = yaml_backend.load(source)
+    except yaml.MarkedYAMLError as ex:
+        mark = ex.problem_mark
+        d = Diagnostic(
+            range=Range(
+                start=Position(line=mark.line - 1, character=mark.column - 1),
+                end=Position(line=mark.line - 1, character=mark.column)
+            ),
+            message=ex.problem,
+            source=DIAGNOSTICS_SOURCE
+        )
+
+        diagnostics.append(d)
+
+    return yaml_obj, diagnostics
+
+
+def analyze(uri: str, version: Optional[int], source: str) -> DocumentAnalysis:
+    analysis = DocumentAnalysis(uri=uri, version=version, source=source,
+                                normalized_source=Parser.normalize(source))
+    if not source:
+        return analysis
+
+    yaml_obj, analysis.yaml_diagnostics = _load_yaml(source)
+    if analysis.yaml_diagnostics:
+        return analysis
+
+    if yaml_obj is None:
+        # only comments, there is nothing to parse
+        return analysis
+
+    if not isinstance(yaml_obj, dict):
+        analysis.parse_error = ParserError("Document is not a mapping", start_pos=(0, 0), end_pos=(0, 0))
+        return analysis
+
+    analysis.kind = yaml_obj.get('kind', '')
+    try:
+        analysis.tree = Parser(analysis.normalized_source, kind=analysis.kind, tokens=analysis.get_tokens()).parse()
+    except Exception as e:
+        analysis.parse_error = e
+
+    return analysis
+
+
+def get_document_analysis(document: Document) -> DocumentAnalysis:
+    """Returns the analysis of the current version of the document,
+    building it only if this version hasn't been analyzed yet"""
+    analysis = ANALYSES.get(document.uri)
+
+    if analysis is None or not analysis.is_same_version(document):
+        analysis = _put_analysis(analyze(document.uri, document.version, document.source))
+
+    return analysis
+
+
+def has_document_analysis(document: Document) -> bool:
+    analysis = ANALYSES.get(document.uri)
+    return analysis is not None and analysis.is_same_version(document)
+
+
+def analyze_detached(uri: str, version: Optional[int], source: str) -> DocumentAnalysis:
+    """Analyzes the document in a worker process. Tokens are not sent back,
+    they are scanned again if they are needed"""
+    analysis = analyze(uri, version, source)
+    analysis.tokens = None
+    return analysis
+
+
+def put_document_analysis(analysis: DocumentAnalysis) -> None:
+    """Stores the analysis built elsewhere unless the version was analyzed meanwhile"""
+    _put_analysis(analysis)
+
+
+def _put_analysis(analysis: DocumentAnalysis) -> DocumentAnalysis:
+    """Stores the analysis unless the same version was stored meanwhile, returns the stored one"""
+    with _LOCK:
+        current = ANALYSES.get(analysis.uri)
+        if current is not None and current.version == analysis.version and current.source == analysis.source:
+            return current
+
+        _store_analysis(analysis)
+        return analysis
+
+
+@contextmanager
+def using_document_analysis(uri: str):
+    """Marks the analyses of the document as used by a worker thread, changes
+    made meanwhile are analyzed from scratch instead of changing the tree in place"""
+    with _LOCK:
+        _IN_USE[uri] = _IN_USE.get(uri, 0) + 1
+    try:
+        yield
+    finally:
+        with _LOCK:
+            _IN_USE[uri] -= 1
+            if not _IN_USE[uri]:
+                del _IN_USE[uri]
+
+
+def _store_analysis(analysis: DocumentAnalysis) -> None:
+    """Must be called with the lock held"""
+    ANALYSES[analysis.uri] = analysis
+    if analysis.tree is not None:
+        LAST_PARSED[analysis.uri] = analysis
+
+
+def _remap_line(old_lines: List[str], new_lines: List[str], line: int) -> int:
+    """Maps the line of the new version of a document onto the old one.
+    Lines of the changed region are mapped onto the same offset in the old region"""
+    prefix = 0
+    max_prefix = min(len(old_lines), len(new_lines))
+    while prefix < max_prefix and old_lines[prefix] == new_lines[prefix]:
+        prefix += 1
+
+    if line < prefix:
+        return line
+
+    suffix = 0
+    max_suffix = max_prefix - prefix
+    while suffix < max_suffix and old_lines[-suffix - 1] == new_lines[-suffix - 1]:
+        suffix += 1
+
+    if line >= len(new_lines) - suffix:
+        return line - len(new_lines) + len(old_lines)
+
+    return min(line, len(old_lines) - suffix - 1)
+
+
+def get_tree_for_position(document: Document,
+                          position: Position) -> Tuple[Optional[str], Optional[BaseTree], Position]:
+    """Returns the kind and the tree to serve a request made at the position
+    of the document together with the position mapped onto that tree.
+
+    While the document is being edited and can't be parsed, the tree of its
+    last successfully parsed version is used. Without it, the partial tree
+    of the current version is returned"""
+    analysis = get_document_analysis(document)
+    if analysis.tree is not None:
+        return analysis.kind, analysis.tree, position
+
+    parsed = LAST_PARSED.get(document.uri)
+    if parsed is not None:
+        line = _remap_line(parsed.normalized_source.split('\n'), analysis.normalized_source.split('\n'),
+                           position.line)
+        return parsed.kind, parsed.tree, Position(line=line, character=position.character)
+
+    tree = analysis.get_partial_tree()
+    if tree is None:
+        return None, None, position
+
+    return analysis.partial_kind, tree, position
+
+
+def update_document_analysis(document: Document, changes: List[TextDocumentContentChangeEvent]) -> None:
+    """Tries to build the analysis of the new version of the document by reparsing
+    only the part of the previous version's tree affected by the changes.
+    If it isn't possible, the analysis is rebuilt from scratch on the next request"""
+    previous = ANALYSES.get(document.uri)
+
+    # Trees of applications and services are shared with the workspace cache,
+    # so only blueprints are spliced in place
+    if previous is None or previous.tree is None or previous.kind != 'blueprint':
+        return
+
+    # changes must be applied exactly to the analyzed version
+    if previous.version is None or document.version != previous.version + 1:
+        return
+
+    if len(changes) != 1 or getattr(changes[0], 'range', None) is None:
+        return
+
+    source = document.source
+    normalized_source = Parser.normalize(source)
+    with _LOCK:
+        # the tree is being validated in a worker thread or it was replaced meanwhile
+        if document.uri in _IN_USE or ANALYSES.get(document.uri) is not previous:
+            return
+
+        if not reparse_block(previous.tree, previous.kind, previous.normalized_source,
+                             normalized_source, changes[0].range):
+            return
+
+        _store_analysis(DocumentAnalysis(uri=document.uri, version=document.version, source=source,
+                                         normalized_source=normalized_source, kind=previous.kind,
+                                         tree=previous.tree))
+
+
+def remove_document_analysis(uri: str):
+    with _LOCK:
+        ANALYSES.pop(uri, None)
+        LAST_PARSED.pop(uri, None)
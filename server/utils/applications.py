@@ -1,104 +1,92 @@
-import os
-import logging
 import pathlib
-from server.utils.yaml_utils import format_yaml
-from server.ats.parser import Parser, ParserError
-
-APPLICATIONS = {}
-
-
-def load_app_details(app_name: str, app_source: str):
-    app_tree = None
-    output = None
-    try:
-        app_tree = Parser(document=app_source).parse()
-        
-        output = f"- {app_name}:\n"
-        output += "    instances: 1\n"
-        inputs = app_tree.get_inputs()
-        if inputs:
-            output += "    input_values:\n"
-            for input in inputs:
-                if input.value:
-                    output += f"      - {input.key.text}: {input.value.text}\n"
-                else:
-                    output += f"      - {input.key.text}: \n"
-    except ParserError as e:
-        logging.warning(f"Unable to load application '{dir}.yaml' due to error: {e.message}")        
-    except Exception as e:
-        logging.warning(f"Unable to load appliiation '{dir}.yaml' due to error: {str(e)}")
-                        
-    APPLICATIONS[app_name] = {
-        'app_tree': app_tree,
-        'app_completion': format_yaml(output) if output else None
-    }
-
-
-def reload_app_details(app_name, app_source):
-    if APPLICATIONS: # if there is already a cache, add this file
-        load_app_details(app_name, app_source)
+from typing import Dict, Optional, Tuple
+
+from server.ats.diff import diff
+from server.ats.trees.app import AppTree
+from server.utils.file_cache import list_directory
+from server.utils.workspace_index import (APPLICATION, WORKSPACE_INDEX, ResourceDetails, ResourceSummary,
+                                          get_completion_snippet)
+
+# application name -> tree of its document the details were reloaded from last time and
+# the summary made of it. The next version of the document is compared with the tree
+_APP_TREES: Dict[str, Tuple[AppTree, ResourceSummary]] = {}
+
+
+def load_app_details(app_name: str, app_source: str, app_tree: AppTree = None):
+    WORKSPACE_INDEX.set_resource(APPLICATION, app_name, app_source, app_tree)
+
+
+def reload_app_details(app_name, app_source, app_tree: AppTree = None) -> bool:
+    """Updates the details of the indexed application. Returns False if the parts
+    used by blueprints (inputs and outputs) are the same as before"""
+    old_tree, old_summary = _APP_TREES.pop(app_name, (None, None))
+    details = WORKSPACE_INDEX.get_resources(APPLICATION).get(app_name)
+    indexed_summary = details.summary if details is not None else None
+    changed = WORKSPACE_INDEX.update_resource(APPLICATION, app_name, app_source, app_tree)
+    details = WORKSPACE_INDEX.get_resources(APPLICATION).get(app_name)
+    if app_tree is None or details is None:
+        return changed
+
+    _APP_TREES[app_name] = (app_tree, details.summary)
+    # the tree of an open document could be changed in place by incremental parsing,
+    # it can't be compared with itself. The trees are compared only if the previous
+    # summary was made of the previous tree
+    if changed and old_tree is not None and old_tree is not app_tree and indexed_summary is old_summary:
+        # reordering of the inputs and outputs doesn't matter to blueprints
+        return diff(old_tree, app_tree).affects(("kind",), ("inputs",), ("outputs",))
+
+    return changed
+
+
+def forget_app_document(app_name):
+    """Drops the tree of the closed application document"""
+    _APP_TREES.pop(app_name, None)
 
 
 def remove_app_details(app_name):
-    if APPLICATIONS: # if there is already a cache, remove this file
-        if app_name in APPLICATIONS:
-            APPLICATIONS.pop(app_name)
-        
-
-def get_available_applications(root_folder: str=None):
-    if APPLICATIONS:
-        return APPLICATIONS
-    else:
-        if root_folder:        
-            apps_path = os.path.join(root_folder, 'applications')
-            if os.path.exists(apps_path):
-                for dir in os.listdir(apps_path):
-                    app_dir = os.path.join(apps_path, dir)
-                    if os.path.isdir(app_dir):
-                        files = os.listdir(app_dir)
-                        if f'{dir}.yaml' in files:
-                            f = open(os.path.join(app_dir, f'{dir}.yaml'), "r")
-                            source = f.read()
-                            load_app_details(app_name=dir, app_source=source)
-                                                
-            return APPLICATIONS
-        else:
-            return None
+    _APP_TREES.pop(app_name, None)
+    WORKSPACE_INDEX.remove_resource(APPLICATION, app_name)
+
+
+def get_available_applications(root_folder: str = None) -> Optional[Dict[str, ResourceDetails]]:
+    return WORKSPACE_INDEX.load(APPLICATION, root_folder)
+
+
+def get_app_details(app_name: str) -> Optional[ResourceDetails]:
+    return WORKSPACE_INDEX.get_resource(APPLICATION, app_name)
+
+
+def get_applications_generation() -> int:
+    """Returns the number of changes of the applications details made so far"""
+    return WORKSPACE_INDEX.get_generation(APPLICATION)
 
 
 def get_available_applications_names():
-    if APPLICATIONS:
-        return list(APPLICATIONS.keys())
-    else:
-        return []
+    return list(WORKSPACE_INDEX.get_resources(APPLICATION).keys())
 
 
 def get_app_scripts(app_path: str):
-    scripts = []
-    files = pathlib.Path(app_path.replace("file://", "")).parent.glob("./*")
-    for file in files:
-        if not file.name.endswith('.yaml'):
-            scripts.append(pathlib.Path(file).name)
+    app_dir = pathlib.Path(app_path.replace("file://", "")).parent
+    details = WORKSPACE_INDEX.get_resource(APPLICATION, app_dir.name)
+    if details is not None:
+        return details.get_scripts()
 
-    return scripts
+    return [name for name in list_directory(app_dir) if not name.endswith('.yaml')]
 
 
 def get_app_inputs(app_name):
-    if app_name in APPLICATIONS:
-        app_tree = APPLICATIONS[app_name]["app_tree"]
-        if app_tree and app_tree.inputs_node:
-            inputs = {}            
-            for input in app_tree.get_inputs():
-                inputs[input.key.text] = input.value.text if input.value else None
-            return inputs
-    
-    return {}
+    details = WORKSPACE_INDEX.get_resource(APPLICATION, app_name)
+    return details.inputs if details is not None else {}
 
 
 def get_app_outputs(app_name):
-    if app_name in APPLICATIONS:
-        app_tree = APPLICATIONS[app_name]["app_tree"]
-        outputs = [out.text for out in app_tree.get_outputs()]
-        return outputs
-    
-    return []
+    details = WORKSPACE_INDEX.get_resource(APPLICATION, app_name)
+    return list(details.outputs) if details is not None else []
+
+
+def get_app_completion(app_name) -> Optional[str]:
+    """Returns the snippet adding the application to a blueprint, None if it's not valid"""
+    details = WORKSPACE_INDEX.get_resource(APPLICATION, app_name)
+    if details is None or not details.valid:
+        return None
+    return get_completion_snippet(APPLICATION, app_name, details.inputs)
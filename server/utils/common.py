@@ -2,41 +2,15 @@ from typing import Optional, Tuple, List
 from pygls.lsp import types
 from pygls.workspace import Document, position_from_utf16
 
-from server.ats.trees.common import YamlNode, Position, MappingNode, TextNode, BaseTree
+from server.ats.trees.common import YamlNode, MappingNode, TextNode, BaseTree
 
 
-class Visitor:
-    def __init__(self, cursor_position: types.Position):
-        self.found_node = None
-        self.cursor_position = Position(line=cursor_position.line, col=cursor_position.character)
+def get_path_to_pos(tree: BaseTree, pos: types.Position) -> List[YamlNode]:
+    """Returns the innermost node at the position with all its ancestors"""
+    return tree.get_position_index().get_path_at(pos.line, pos.character)
 
-    def visit_node(self, node: YamlNode):
-        start = Position(node.start_pos[0], node.start_pos[1])
-        end = Position(node.end_pos[0], node.end_pos[1])
 
-        if start <= self.cursor_position <= end:
-            self.found_node = node
-            return True
-
-        return False
-
-
-def get_path_to_pos(tree: BaseTree, pos: Position) -> List[YamlNode]:
-    v = Visitor(cursor_position=pos)
-    tree.accept(visitor=v)
-
-    if not v.found_node:
-        return []
-
-    path: List[YamlNode] = []
-    node = v.found_node
-    while node:
-        path.insert(0, node)
-        node = node.parent
-    return path
-
-
-def is_var_allowed(tree: BaseTree, pos: Position) -> bool:
+def is_var_allowed(tree: BaseTree, pos: types.Position) -> bool:
     path = get_path_to_pos(tree, pos)
 
     if not path:
@@ -0,0 +1,55 @@
+import os
+from typing import Any, Callable, Dict, List, TypeVar
+
+T = TypeVar("T")
+
+# folder path -> names of the files in the folder
+DIRECTORY_LISTINGS: Dict[str, List[str]] = {}
+# file path -> name of the loader -> data the loader extracted from the file
+FILE_DATA: Dict[str, Dict[str, Any]] = {}
+
+
+def _normalize(path: str) -> str:
+    return os.path.normpath(str(path).replace("file://", ""))
+
+
+def list_directory(path: str) -> List[str]:
+    """Returns names of the files in the folder, the listing is cached
+    until a file is created or deleted in the folder"""
+    path = _normalize(path)
+    names = DIRECTORY_LISTINGS.get(path)
+    if names is None:
+        try:
+            with os.scandir(path) as entries:
+                names = sorted(entry.name for entry in entries)
+        except OSError:
+            names = []
+        DIRECTORY_LISTINGS[path] = names
+
+    return names
+
+
+def get_file_data(path: str, loader: Callable[[str], T]) -> T:
+    """Returns loader(path), the result is cached until the file is changed"""
+    path = _normalize(path)
+    data = FILE_DATA.setdefault(path, {})
+    key = loader.__qualname__
+    if key not in data:
+        data[key] = loader(path)
+
+    return data[key]
+
+
+def invalidate_file(path: str, listing_changed: bool = True) -> None:
+    """Drops the cached data of the file changed on disk. The listing of its
+    folder is dropped as well if the file was created or deleted"""
+    path = _normalize(path)
+    FILE_DATA.pop(path, None)
+    if listing_changed:
+        DIRECTORY_LISTINGS.pop(os.path.dirname(path), None)
+        # a whole folder could be created or deleted, the caches are
+        # copied since worker threads could fill them meanwhile
+        prefix = path + os.sep
+        for cache in (DIRECTORY_LISTINGS, FILE_DATA):
+            for cached_path in [p for p in list(cache) if p == path or p.startswith(prefix)]:
+                del cache[cached_path]
@@ -0,0 +1,150 @@
+import asyncio
+import heapq
+import itertools
+import time
+from collections import deque
+from contextlib import asynccontextmanager, contextmanager
+from enum import IntEnum
+from typing import Any, Deque, Dict, List, Tuple
+
+# the latest wait times of each priority kept to compute percentiles
+METRICS_SAMPLES = 1000
+
+
+class Priority(IntEnum):
+    """Priorities of the server work, lower values are served first"""
+
+    # completion and hover requests, they are never queued
+    INTERACTIVE = 0
+    # diagnostics of the document being edited
+    ACTIVE_DOCUMENT = 1
+    # diagnostics and links of the other open documents
+    OPEN_DOCUMENT = 2
+    # workspace indexing and documents which are not open
+    BACKGROUND = 3
+
+
+class _PriorityMetrics:
+    def __init__(self):
+        self.count = 0
+        self.max_wait = 0.0
+        self.waits: Deque[float] = deque(maxlen=METRICS_SAMPLES)
+
+    def add(self, wait: float) -> None:
+        self.count += 1
+        self.max_wait = max(self.max_wait, wait)
+        self.waits.append(wait)
+
+    def get_percentile(self, percent: int) -> float:
+        if not self.waits:
+            return 0.0
+        waits = sorted(self.waits)
+        return waits[min(len(waits) - 1, len(waits) * percent // 100)]
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "count": self.count,
+            "p50_ms": round(self.get_percentile(50) * 1000, 2),
+            "p95_ms": round(self.get_percentile(95) * 1000, 2),
+            "max_ms": round(self.max_wait * 1000, 2),
+        }
+
+
+class PriorityScheduler:
+    """
+    Orders the asynchronous work of the server by priority. Jobs run in one of
+    a limited number of slots, the waiting jobs get the freed slots in the order
+    of their priority and then of their arrival. Running jobs call checkpoint()
+    between the steps of their work: it lets the event loop serve the requests
+    received meanwhile and gives the slot up to a waiting job of a higher priority.
+    Interactive requests are served right away without taking a slot.
+
+    Queue depth and the time jobs wait for their first slot are collected per
+    priority, giving the slot up at checkpoints is counted as a preemption.
+    For interactive requests the time they took is collected instead as they never wait.
+    """
+
+    def __init__(self, slots: int = 2):
+        self.slots = slots
+        self._running = 0
+        # (priority, arrival, future resolved when the slot is granted)
+        self._waiting: List[Tuple[int, int, asyncio.Future]] = []
+        self._arrivals = itertools.count()
+        self._metrics = {priority: _PriorityMetrics() for priority in Priority}
+        self._max_depth = 0
+        self._preemptions = 0
+
+    @asynccontextmanager
+    async def slot(self, priority: Priority):
+        """Runs the block in a slot once the jobs of higher priorities are done"""
+        await self._acquire(priority)
+        try:
+            yield
+        finally:
+            self._release()
+
+    @contextmanager
+    def interactive(self):
+        """Serves the interactive request, the time it takes is collected"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._metrics[Priority.INTERACTIVE].add(time.perf_counter() - started)
+
+    async def checkpoint(self, priority: Priority) -> None:
+        """Yields to the event loop, the slot is given up and acquired again
+        if a job of a higher priority is waiting for it"""
+        await asyncio.sleep(0)
+        if self._waiting and self._waiting[0][0] < priority:
+            self._preemptions += 1
+            self._release()
+            # the job has been running, the time it was preempted for is not its wait time
+            await self._acquire(priority, collect=False)
+
+    def get_queue_depth(self) -> int:
+        return len(self._waiting)
+
+    def get_metrics(self) -> Dict[str, Any]:
+        depths = {priority.name.lower(): 0 for priority in Priority if priority != Priority.INTERACTIVE}
+        for priority, _, _ in self._waiting:
+            depths[Priority(priority).name.lower()] += 1
+
+        return {
+            "running": self._running,
+            "queue_depth": depths,
+            "max_queue_depth": self._max_depth,
+            "preemptions": self._preemptions,
+            "wait_times": {priority.name.lower(): metrics.to_dict() for priority, metrics in self._metrics.items()},
+        }
+
+    async def _acquire(self, priority: Priority, collect: bool = True) -> None:
+        started = time.perf_counter()
+        if self._running < self.slots and not self._waiting:
+            self._running += 1
+        else:
+            entry = (priority, next(self._arrivals), asyncio.get_running_loop().create_future())
+            heapq.heappush(self._waiting, entry)
+            self._max_depth = max(self._max_depth, len(self._waiting))
+            try:
+                await entry[2]
+            except asyncio.CancelledError:
+                if entry[2].done() and not entry[2].cancelled():
+                    # the slot was granted to the cancelled job
+                    self._release()
+                elif entry in self._waiting:
+                    self._waiting.remove(entry)
+                    heapq.heapify(self._waiting)
+                raise
+
+        if collect:
+            self._metrics[priority].add(time.perf_counter() - started)
+
+    def _release(self) -> None:
+        self._running -= 1
+        while self._waiting and self._running < self.slots:
+            _, _, future = heapq.heappop(self._waiting)
+            if future.done():
+                continue
+            self._running += 1
+            future.set_result(None)
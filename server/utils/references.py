@@ -0,0 +1,150 @@
+import asyncio
+import logging
+import os
+from concurrent.futures import Executor
+from typing import Dict, Optional, Set, Tuple
+
+from pygls.uris import from_fs_path, to_fs_path
+
+from server.ats import yaml_backend
+from server.ats.parser import Parser
+from server.ats.trees.blueprint import BlueprintTree
+from server.ats.trees.common import TextNode, YamlNode
+from server.utils.workspace_index import APPLICATION, SERVICE
+
+# (kind, name) of the application or service referenced by a blueprint
+Reference = Tuple[str, str]
+
+BLUEPRINTS_FOLDER = "blueprints"
+
+
+class _VariablesCollector:
+    def __init__(self):
+        self.variables = []
+
+    def visit_node(self, node: YamlNode) -> bool:
+        if isinstance(node, TextNode):
+            self.variables += node.get_variables()
+        return True
+
+
+def get_blueprint_references(tree: BlueprintTree) -> Set[Reference]:
+    """Returns the applications and services the blueprint refers to in its 'applications'
+    and 'services' sections, in 'depends_on' lists and in $torque.applications.<name>
+    and $torque.services.<name> expressions"""
+    apps = {app.id.text for app in tree.get_applications() if app.id is not None}
+    srvs = {srv.id.text for srv in tree.get_services() if srv.id is not None}
+    references = {(APPLICATION, name) for name in apps} | {(SERVICE, name) for name in srvs}
+
+    for res in tree.get_applications() + tree.get_services():
+        for dep in res.deps:
+            if dep.text in apps or dep.text in srvs:
+                continue
+            # dependency on a resource missing in the blueprint, its kind is not known
+            references.update({(APPLICATION, dep.text), (SERVICE, dep.text)})
+
+    collector = _VariablesCollector()
+    tree.accept(collector)
+    for var in collector.variables:
+        path = var.path
+        if len(path) > 2 and path[0].lower() == "torque" and path[1] in ("applications", "services"):
+            references.add((APPLICATION if path[1] == "applications" else SERVICE, path[2]))
+
+    return references
+
+
+def read_blueprint_references(path: str) -> Optional[Set[Reference]]:
+    """Reads and parses the blueprint file, returns its references
+    or None if it's not a valid blueprint. Runs in worker processes"""
+    try:
+        with open(path, "r") as f:
+            document = Parser.normalize(f.read())
+        # the parser tolerates some invalid documents the YAML loader rejects
+        yaml_backend.load(document)
+        tree = Parser(document=document).parse()
+    except Exception:
+        return None
+
+    if not isinstance(tree, BlueprintTree):
+        return None
+
+    return get_blueprint_references(tree)
+
+
+class ReferenceGraph:
+    """
+    Reverse references from the applications and services to the blueprints
+    using them, so that a change of an application or a service revalidates
+    only the blueprints depending on it. Blueprints are identified by uri.
+    """
+
+    def __init__(self):
+        self._references: Dict[str, Set[Reference]] = {}
+        self._blueprints: Dict[Reference, Set[str]] = {}
+
+    def set_blueprint(self, uri: str, references: Set[Reference]) -> None:
+        previous = self._references.get(uri, set())
+        if previous == references:
+            return
+
+        for ref in previous - references:
+            self._blueprints[ref].discard(uri)
+            if not self._blueprints[ref]:
+                del self._blueprints[ref]
+
+        for ref in references - previous:
+            self._blueprints.setdefault(ref, set()).add(uri)
+
+        self._references[uri] = references
+
+    def remove_blueprint(self, uri: str) -> None:
+        self.set_blueprint(uri, set())
+        self._references.pop(uri, None)
+
+    def reload_blueprint(self, uri: str) -> None:
+        """Updates the references of the blueprint from its file"""
+        path = to_fs_path(uri)
+        references = read_blueprint_references(path) if os.path.exists(path) else None
+        if references is None:
+            self.remove_blueprint(uri)
+        else:
+            self.set_blueprint(uri, references)
+
+    def get_references(self, uri: str) -> Set[Reference]:
+        return self._references.get(uri, set())
+
+    def get_blueprints(self, *references: Reference) -> Set[str]:
+        """Returns uris of the blueprints referring to any of the applications or services"""
+        result = set()
+        for ref in references:
+            result |= self._blueprints.get(ref, set())
+        return result
+
+    async def load(self, root_folder: str, executor: Executor) -> int:
+        """Indexes the blueprints of the workspace folder, their files are parsed in
+        parallel by the executor. Blueprints indexed meanwhile (open documents)
+        are kept. Returns the number of indexed blueprints"""
+        blueprints_path = os.path.join(root_folder, BLUEPRINTS_FOLDER)
+        if not os.path.isdir(blueprints_path):
+            return 0
+
+        loop = asyncio.get_running_loop()
+        paths = [os.path.join(blueprints_path, name) for name in os.listdir(blueprints_path)
+                            if name.endswith(".yaml")]
+        results = await asyncio.gather(
+            *[loop.run_in_executor(executor, read_blueprint_references, path) for path in paths],
+            return_exceptions=True)
+
+        count = 0
+        for path, references in zip(paths, results):
+            uri = from_fs_path(path)
+            if isinstance(references, Exception) or references is None or uri in self._references:
+                continue
+            self.set_blueprint(uri, references)
+            count += 1
+
+        logging.debug(f"Reference graph loaded {count} blueprints")
+        return count
+
+
+REFERENCE_GRAPH = ReferenceGraph()
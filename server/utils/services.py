@@ -1,106 +1,106 @@
-import logging
-import os
-import re
 import pathlib
+from typing import Dict, Optional, Tuple
+
 import yaml
-from server.ats.parser import Parser, ParserError
-from server.utils.yaml_utils import format_yaml
+from server.ats.diff import diff
+from server.ats.parser import Parser
+from server.ats.trees.service import ServiceTree
+from server.utils.file_cache import get_file_data, list_directory
+from server.utils.tfvars import iter_tfvars_variables
+from server.utils.workspace_index import (SERVICE, WORKSPACE_INDEX, ResourceDetails, ResourceSummary,
+                                          get_completion_snippet)
 
-SERVICES = {}
+# service name -> tree of its document the details were reloaded from last time and
+# the summary made of it. The next version of the document is compared with the tree
+_SERVICE_TREES: Dict[str, Tuple[ServiceTree, ResourceSummary]] = {}
 
 
-def get_available_services(root_folder: str = None):
-    if SERVICES:
-        return SERVICES
-    else:
-        if root_folder:
-            srv_path = os.path.join(root_folder, 'services')
-            if os.path.exists(srv_path):
-                for dir in os.listdir(srv_path):
-                    srv_dir = os.path.join(srv_path, dir)
-                    if os.path.isdir(srv_dir):
-                        files = os.listdir(srv_dir)
-                        if f'{dir}.yaml' in files:
-                            f = open(os.path.join(srv_dir, f'{dir}.yaml'), "r")
-                            source = f.read()
-                            load_service_details(srv_name=dir, srv_source=source)
-
-            return SERVICES
-        else:
-            return None
+def get_available_services(root_folder: str = None) -> Optional[Dict[str, ResourceDetails]]:
+    return WORKSPACE_INDEX.load(SERVICE, root_folder)
+
+
+def get_service_details(srv_name: str) -> Optional[ResourceDetails]:
+    return WORKSPACE_INDEX.get_resource(SERVICE, srv_name)
+
+
+def get_services_generation() -> int:
+    """Returns the number of changes of the services details made so far"""
+    return WORKSPACE_INDEX.get_generation(SERVICE)
 
 
 def get_available_services_names():
-    if SERVICES:
-        return list(SERVICES.keys())
-    else:
-        return []
+    return list(WORKSPACE_INDEX.get_resources(SERVICE).keys())
 
 
-def load_service_details(srv_name: str, srv_source):
-    srv_tree = None
-    output = None
-    try:
-        srv_tree = Parser(document=srv_source).parse()
+def load_service_details(srv_name: str, srv_source, srv_tree: ServiceTree = None):
+    WORKSPACE_INDEX.set_resource(SERVICE, srv_name, srv_source, srv_tree)
+
 
-        output = f"- {srv_name}:\n"
-        inputs = srv_tree.get_inputs()
-        if inputs:
-            output += "    input_values:\n"
-            for input in inputs:
-                if input.value:
-                    output += f"      - {input.key.text}: {input.value.text}\n"
-                else:
-                    output += f"      - {input.key.text}: \n"
-    except ParserError as e:
-        logging.warning(f"Unable to load service '{dir}.yaml' due to error: {e.message}")
-    except Exception as e:
-        logging.warning(f"Unable to load service '{dir}.yaml' due to error: {str(e)}")
+def reload_service_details(srv_name, srv_source, srv_tree: ServiceTree = None) -> bool:
+    """Updates the details of the indexed service. Returns False if the parts
+    used by blueprints (inputs and outputs) are the same as before"""
+    old_tree, old_summary = _SERVICE_TREES.pop(srv_name, (None, None))
+    details = WORKSPACE_INDEX.get_resources(SERVICE).get(srv_name)
+    indexed_summary = details.summary if details is not None else None
+    changed = WORKSPACE_INDEX.update_resource(SERVICE, srv_name, srv_source, srv_tree)
+    details = WORKSPACE_INDEX.get_resources(SERVICE).get(srv_name)
+    if srv_tree is None or details is None:
+        return changed
 
-    SERVICES[srv_name] = {
-        "srv_tree": srv_tree,
-        "srv_completion": format_yaml(output) if output else None
-    }
+    _SERVICE_TREES[srv_name] = (srv_tree, details.summary)
+    # the tree of an open document could be changed in place by incremental parsing,
+    # it can't be compared with itself. The trees are compared only if the previous
+    # summary was made of the previous tree
+    if changed and old_tree is not None and old_tree is not srv_tree and indexed_summary is old_summary:
+        # reordering of the inputs and outputs doesn't matter to blueprints
+        return diff(old_tree, srv_tree).affects(("kind",), ("inputs",), ("outputs",))
 
+    return changed
 
-def reload_service_details(srv_name, srv_source):
-    if SERVICES:  # if there is already a cache, add this file
-        load_service_details(srv_name, srv_source)
+
+def forget_service_document(srv_name):
+    """Drops the tree of the closed service document"""
+    _SERVICE_TREES.pop(srv_name, None)
 
 
 def remove_service_details(srv_name):
-    if SERVICES: # if there is already a cache, remove this file
-        if srv_name in SERVICES:
-            SERVICES.pop(srv_name)
+    _SERVICE_TREES.pop(srv_name, None)
+    WORKSPACE_INDEX.remove_resource(SERVICE, srv_name)
             
 
 def get_vars_from_tfvars(file_path: str):
-    vars = []
+    """Returns names of the top-level variables of the tfvars file"""
     with open(file_path, "r") as f:
-        content = f.read()
-        vars = re.findall(r"(^.+?)\s*=", content, re.MULTILINE)
+        return [var.name for var in iter_tfvars_variables(f)]
+
 
-    return vars
+def _read_document_kind(file_path: str) -> Optional[str]:
+    try:
+        with open(file_path, 'r') as stream:
+            return Parser.get_document_kind(stream.read())
+    except (OSError, yaml.YAMLError):
+        return None
 
 
 def get_service_vars(service_dir_path: str):
-    with open(service_dir_path.replace("file://", ""), 'r') as stream:
-        try:
-            yaml_obj = yaml.load(stream, Loader=yaml.FullLoader)  # todo: refactor
-            doc_type = yaml_obj.get('kind', '')
-        except yaml.YAMLError as exc:
-            return []
+    srv_path = pathlib.Path(service_dir_path.replace("file://", ""))
+    details = WORKSPACE_INDEX.get_resource(SERVICE, srv_path.parent.name)
+
+    if details is not None and details.kind is not None:
+        doc_type = details.kind
+        tfvars_files = [srv_path.parent / name for name in details.get_tfvars_files()]
+    else:
+        doc_type = get_file_data(srv_path, _read_document_kind)
+        tfvars_files = [srv_path.parent / name for name in list_directory(srv_path.parent) if name.endswith('.tfvars')]
 
     if doc_type == "TerraForm":
         tfvars = []
-        files = pathlib.Path(service_dir_path.replace("file://", "")).parent.glob("./*")
-        for file in files:
-            if file.name.endswith('.tfvars'):
-                item = {
-                    "file": pathlib.Path(file).name,
-                    "variables": get_vars_from_tfvars(file)
-                }
-                tfvars.append(item)
+        for file in tfvars_files:
+            item = {
+                "file": pathlib.Path(file).name,
+                "variables": get_file_data(file, get_vars_from_tfvars)
+            }
+            tfvars.append(item)
 
         return tfvars
 
@@ -108,21 +108,18 @@ def get_service_vars(service_dir_path: str):
 
 
 def get_service_inputs(srv_name):
-    if srv_name in SERVICES:
-        srv_tree = SERVICES[srv_name]["srv_tree"]
-        if srv_tree and srv_tree.inputs_node:
-            inputs = {}
-            for input in srv_tree.get_inputs():
-                inputs[input.key.text] = input.value.text if input.value else None
-            return inputs
-
-    return {}
+    details = WORKSPACE_INDEX.get_resource(SERVICE, srv_name)
+    return details.inputs if details is not None else {}
 
 
 def get_service_outputs(srv_name):
-    if srv_name in SERVICES:
-        srv_tree = SERVICES[srv_name]["srv_tree"]
-        outputs = [out.text for out in srv_tree.get_outputs()]
-        return outputs
+    details = WORKSPACE_INDEX.get_resource(SERVICE, srv_name)
+    return list(details.outputs) if details is not None else []
 
-    return []
+
+def get_service_completion(srv_name) -> Optional[str]:
+    """Returns the snippet adding the service to a blueprint, None if it's not valid"""
+    details = WORKSPACE_INDEX.get_resource(SERVICE, srv_name)
+    if details is None or not details.valid:
+        return None
+    return get_completion_snippet(SERVICE, srv_name, details.inputs)
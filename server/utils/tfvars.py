@@ -0,0 +1,133 @@
+import re
+from dataclasses import dataclass
+from typing import Iterable, Iterator, List, Tuple
+
+# assignment at the start of a top-level line: name = value, the name could be quoted
+_ATTRIBUTE = re.compile(r"\s*(\"?)([A-Za-z_][\w-]*)\1\s*=(?![=>])")
+# tokens changing the state of the lexer in expressions
+_CODE_TOKENS = re.compile(r'"|[{}\[\]()]|#|//|/\*|<<-?([A-Za-z_][\w-]*)')
+# tokens changing the state of the lexer in quoted strings, '$${' and '%%{' are escapes
+_STRING_TOKENS = re.compile(r'\\.|\$\$\{|%%\{|"|[$%]\{')
+_COMMENT_END = re.compile(r"\*/")
+
+_OPENING = "{[("
+_CLOSING = "}])"
+_STRING = '"'
+_TEMPLATE = "${"
+
+
+@dataclass(frozen=True)
+class TfvarsVariable:
+    """Top-level variable assignment of a tfvars file"""
+
+    name: str
+    start_pos: Tuple[int, int]
+    end_pos: Tuple[int, int]
+    # span of the value expression, it could take several lines (maps, lists, heredocs)
+    value_start: Tuple[int, int]
+    value_end: Tuple[int, int]
+
+
+def iter_tfvars_variables(lines: Iterable[str]) -> Iterator[TfvarsVariable]:
+    """
+    Yields the top-level variables of the tfvars (HCL) file in a single pass
+    over its lines, the lines are not kept. Nested maps and lists, quoted strings
+    with template interpolations, heredocs and comments are skipped.
+    """
+    # open brackets, quoted strings and template interpolations
+    stack: List[str] = []
+    in_comment = False
+    # end marker of the heredoc whose body is being read
+    heredoc = None
+    # line, name match and value start of the variable whose value is being read
+    current = None
+    value_end = None
+
+    for line_num, line in enumerate(lines):
+        line = line.rstrip("\r\n")
+        if line_num == 0:
+            line = line.lstrip("\ufeff")
+
+        if heredoc is not None:
+            if line.strip() != heredoc:
+                continue
+            heredoc = None
+            value_end = (line_num, len(line))
+
+        else:
+            pos = 0
+            if current is None and not stack and not in_comment:
+                match = _ATTRIBUTE.match(line)
+                if match is not None:
+                    pos = match.end()
+                    value_col = len(line) - len(line[pos:].lstrip())
+                    current = (line_num, match, (line_num, value_col))
+                    value_end = current[2]
+
+            # tokens of the line changing the state, up to a line comment
+            code_end = len(line)
+            while True:
+                if in_comment:
+                    match = _COMMENT_END.search(line, pos)
+                    if match is None:
+                        break
+                    in_comment = False
+                    pos = match.end()
+
+                elif stack and stack[-1] == _STRING:
+                    match = _STRING_TOKENS.search(line, pos)
+                    if match is None:
+                        # quoted strings can't span lines
+                        stack.pop()
+                        break
+                    token = match.group()
+                    pos = match.end()
+                    if token == _STRING:
+                        stack.pop()
+                    elif token == "${" or token == "%{":
+                        stack.append(_TEMPLATE)
+
+                else:
+                    match = _CODE_TOKENS.search(line, pos)
+                    if match is None:
+                        break
+                    token = match.group()
+                    pos = match.end()
+                    if token == _STRING or token in _OPENING:
+                        stack.append(token)
+                    elif token in _CLOSING:
+                        if stack:
+                            stack.pop()
+                    elif token == "#" or token == "//":
+                        code_end = match.start()
+                        break
+                    elif token == "/*":
+                        in_comment = True
+                    else:
+                        heredoc = match.group(1)
+
+            if current is not None:
+                content_end = len(line[:code_end].rstrip()) if code_end < len(line) else len(line.rstrip())
+                if content_end > 0 and (content_end > value_end[1] or line_num > value_end[0]):
+                    value_end = (line_num, content_end)
+
+            if heredoc is not None:
+                continue
+
+        if current is not None and not stack and not in_comment:
+            yield _make_variable(current, value_end)
+            current = None
+
+    if current is not None:
+        # unterminated value at the end of the file
+        yield _make_variable(current, value_end)
+
+
+def _make_variable(current, value_end: Tuple[int, int]) -> TfvarsVariable:
+    name_line, match, value_start = current
+    # the name without the quotes around it
+    return TfvarsVariable(name=match.group(2),
+                          start_pos=(name_line, match.start(2)),
+                          end_pos=(name_line, match.end(2)),
+                          value_start=value_start,
+                          value_end=value_end)
@@ -0,0 +1,87 @@
+import asyncio
+import logging
+from typing import Awaitable, Callable, Dict, Optional
+
+# seconds the validation of a changed document is postponed by
+DEBOUNCE_DELAY = 0.3
+
+# callback(uri, version) validating the version of the document, coroutines are run as tasks
+ValidationCallback = Callable[[str, Optional[int]], Optional[Awaitable[None]]]
+
+
+class ValidationScheduler:
+    """
+    Debounces validation of the documents being edited. Changes made within
+    the delay are coalesced into a single validation of the newest version,
+    validations scheduled for superseded versions are dropped. Versions of the
+    published diagnostics are tracked, so diagnostics of an older version never
+    replace the ones already published for a newer version.
+    """
+
+    def __init__(self, delay: float = DEBOUNCE_DELAY):
+        self.delay = delay
+        self._pending: Dict[str, asyncio.TimerHandle] = {}
+        # uri -> version of the document the last published diagnostics belong to
+        self._published: Dict[str, int] = {}
+
+    def set_delay(self, delay: float) -> None:
+        """Changes the delay of the validations scheduled from now on"""
+        self.delay = max(0.0, delay)
+
+    def schedule(self, uri: str, version: Optional[int], callback: ValidationCallback) -> None:
+        """Validates the version of the document once the delay passes without
+        newer versions being scheduled. The pending validation is replaced"""
+        self.cancel(uri)
+        if self.delay <= 0:
+            self._run(uri, version, callback)
+            return
+
+        loop = asyncio.get_event_loop()
+        self._pending[uri] = loop.call_later(self.delay, self._run, uri, version, callback)
+
+    def _run(self, uri: str, version: Optional[int], callback: ValidationCallback) -> None:
+        self._pending.pop(uri, None)
+        try:
+            result = callback(uri, version)
+        except Exception as ex:
+            logging.error(f"Validation of '{uri}' (version {version}) failed: {ex}")
+            return
+
+        if asyncio.iscoroutine(result):
+            task = asyncio.ensure_future(result)
+            task.add_done_callback(lambda done: self._log_failure(uri, version, done))
+
+    @staticmethod
+    def _log_failure(uri: str, version: Optional[int], task: asyncio.Future) -> None:
+        if not task.cancelled() and task.exception() is not None:
+            logging.error(f"Validation of '{uri}' (version {version}) failed: {task.exception()}")
+
+    def cancel(self, uri: str) -> bool:
+        """Drops the pending validation of the document, returns False if there was none"""
+        handle = self._pending.pop(uri, None)
+        if handle is None:
+            return False
+
+        handle.cancel()
+        return True
+
+    def is_pending(self, uri: str) -> bool:
+        return uri in self._pending
+
+    def can_publish(self, uri: str, version: Optional[int]) -> bool:
+        """Checks that no diagnostics were published for a newer version of the document.
+        Documents which are not open in the editor don't have versions"""
+        published = self._published.get(uri)
+        return version is None or published is None or version >= published
+
+    def set_published(self, uri: str, version: Optional[int]) -> None:
+        if version is not None:
+            self._published[uri] = version
+
+    def forget(self, uri: str) -> None:
+        """Drops the state of the closed document, a reopened one starts its versions anew"""
+        self.cancel(uri)
+        self._published.pop(uri, None)
+
+
+VALIDATION_SCHEDULER = ValidationScheduler()
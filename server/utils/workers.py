@@ -0,0 +1,58 @@
+import asyncio
+import os
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Callable, Optional, TypeVar
+
+T = TypeVar("T")
+
+# threads validating documents, validators look up the other files of the workspace
+THREAD_WORKERS = 2
+# processes parsing large documents and indexing the workspace
+PROCESS_WORKERS = max(1, min(4, (os.cpu_count() or 1) - 1))
+# documents larger than this (in characters) are parsed in the worker processes,
+# for smaller ones sending the tree back costs more than it saves
+LARGE_DOCUMENT_SIZE = 100_000
+
+
+class WorkerPool:
+    """
+    Bounded executors running parsing and validation of documents off the
+    event loop, so requests like completion are served while a big document
+    is being validated. Results are returned to the coroutine awaiting them
+    on the loop. Executors are created on the first use.
+    """
+
+    def __init__(self, thread_workers: int = THREAD_WORKERS, process_workers: int = PROCESS_WORKERS):
+        self.thread_workers = thread_workers
+        self.process_workers = process_workers
+        self._threads: Optional[ThreadPoolExecutor] = None
+        self._processes: Optional[ProcessPoolExecutor] = None
+
+    def get_thread_executor(self) -> Executor:
+        if self._threads is None:
+            self._threads = ThreadPoolExecutor(max_workers=self.thread_workers,
+                                               thread_name_prefix="torque-worker")
+        return self._threads
+
+    def get_process_executor(self) -> Executor:
+        if self._processes is None:
+            self._processes = ProcessPoolExecutor(max_workers=self.process_workers)
+        return self._processes
+
+    async def run_in_thread(self, func: Callable[..., T], *args) -> T:
+        """Runs the function in a worker thread, it shares the state of the server"""
+        return await asyncio.get_running_loop().run_in_executor(self.get_thread_executor(), func, *args)
+
+    async def run_in_process(self, func: Callable[..., T], *args) -> T:
+        """Runs the function in a worker process, the arguments and
+        the result must be picklable"""
+        return await asyncio.get_running_loop().run_in_executor(self.get_process_executor(), func, *args)
+
+    def shutdown(self) -> None:
+        for executor in (self._threads, self._processes):
+            if executor is not None:
+                executor.shutdown(wait=False)
+        self._threads = self._processes = None
+
+
+WORKER_POOL = WorkerPool()
@@ -0,0 +1,590 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+from concurrent.futures import Executor
+from dataclasses import dataclass, field
+from typing import AbstractSet, Awaitable, Callable, Dict, Iterable, List, NamedTuple, Optional, Set, Tuple
+
+from server.ats import yaml_backend
+from server.ats.parser import Parser, ParserError
+from server.ats.trees.app import AppTree
+from server.ats.trees.common import BaseTree
+from server.ats.trees.service import ServiceTree
+
+APPLICATION = "application"
+SERVICE = "service"
+
+# folder of the workspace containing the resources of each kind
+RESOURCE_FOLDERS = {
+    APPLICATION: "applications",
+    SERVICE: "services"
+}
+
+# (mtime_ns, size, inode) of a file or a folder
+FileStat = Tuple[int, int, int]
+
+# top-level sections of the definitions the summaries are made of,
+# the rest of the sections are skipped when the definitions are indexed
+SUMMARY_SECTIONS = frozenset({"kind", "inputs", "outputs", "configuration", "variables", "tfvars_file"})
+
+# (kind, name, inputs) -> snippet adding the resource to a blueprint
+COMPLETION_SNIPPETS: Dict[Tuple[str, str, Tuple[Tuple[str, Optional[str]], ...]], str] = {}
+COMPLETION_SNIPPETS_LIMIT = 10000
+
+# scalars written as they are in the snippets, the other ones are double-quoted
+_PLAIN_SCALAR = re.compile(r"(?![-?:](\s|$))[^\s,\[\]{}#&*!|>'\"%@`](?:[^:#\s]|:(?!\s|$)|(?<!\s)#| +(?=[^\s#]))*")
+
+
+class ResourceSummary(NamedTuple):
+    """
+    Compact immutable summary of an application or a service definition, it's
+    all the index keeps of the definition instead of its tree. The full tree
+    is parsed again on demand (see WorkspaceIndex.get_tree).
+    """
+
+    # kind of the definition ('application', 'TerraForm'), None if it's not known
+    kind: Optional[str] = None
+    # (input name, default value) pairs, None if the input has no default
+    inputs: Tuple[Tuple[str, Optional[str]], ...] = ()
+    outputs: Tuple[str, ...] = ()
+    # scripts referenced by the application configuration
+    scripts: Tuple[str, ...] = ()
+    # tfvars file referenced by the service variables
+    var_file: Optional[str] = None
+    # errors found in the parsed sections
+    error_count: int = 0
+    content_hash: int = 0
+    # message of the error the definition couldn't be parsed due to
+    error: Optional[str] = None
+    # False if only the summarized sections were parsed. Such a summary is taken
+    # for valid until the whole definition is parsed (see WorkspaceIndex.verify)
+    verified: bool = True
+
+    @property
+    def valid(self) -> bool:
+        return self.error is None
+
+    def get_interface(self) -> tuple:
+        """Parts of the summary used by blueprints"""
+        return self.valid, self.inputs, self.outputs
+
+
+@dataclass
+class ResourceDetails:
+    """Details of an application or a service used by blueprints"""
+
+    name: str
+    summary: ResourceSummary = ResourceSummary()
+    # names of the files in the folder of the resource (except of its definition)
+    files: Set[str] = field(default_factory=set)
+    # stat of the definition file the summary was made of,
+    # None if it comes from a document with unsaved changes
+    stat: Optional[FileStat] = None
+    # path of the definition file, None if it is not known
+    path: Optional[str] = None
+
+    @property
+    def kind(self) -> Optional[str]:
+        """Kind of the resource definition ('application', 'TerraForm')"""
+        return self.summary.kind
+
+    @property
+    def valid(self) -> bool:
+        return self.summary.valid
+
+    @property
+    def inputs(self) -> Dict[str, Optional[str]]:
+        """Input name -> default value"""
+        return dict(self.summary.inputs)
+
+    @property
+    def outputs(self) -> Tuple[str, ...]:
+        return self.summary.outputs
+
+    def get_scripts(self) -> List[str]:
+        return sorted(name for name in self.files if not name.endswith(".yaml"))
+
+    def get_tfvars_files(self) -> List[str]:
+        return sorted(name for name in self.files if name.endswith(".tfvars"))
+
+
+class WorkspaceIndex:
+    """
+    Index of the applications and services of the workspace.
+
+    Resources of each kind are loaded from the workspace folder on the first
+    request and then kept up to date by the notifications about changed
+    documents and files. Lookups by name are counted as hits and misses.
+    """
+
+    def __init__(self):
+        self._resources: Dict[str, Dict[str, ResourceDetails]] = {APPLICATION: {}, SERVICE: {}}
+        self._loaded: Set[str] = set()
+        # workspace folder the resources of the kind are loaded from
+        self._roots: Dict[str, str] = {}
+        # stats of the resource folders when they were listed
+        self._folder_stats: Dict[str, FileStat] = {}
+        # incremented on every change of the resources of the kind
+        self._generations: Dict[str, int] = {APPLICATION: 0, SERVICE: 0}
+        self.hits = 0
+        self.misses = 0
+        self._warming_up = False
+        # the worker threads validating documents load the resources on demand
+        # while the event loop updates them
+        self._lock = threading.RLock()
+
+    def is_loaded(self, kind: str) -> bool:
+        return kind in self._loaded
+
+    def is_warming_up(self) -> bool:
+        """Checks if the workspace is still being indexed in the background,
+        the resources indexed so far are available meanwhile"""
+        return self._warming_up
+
+    def load(self, kind: str, root_folder: str = None) -> Optional[Dict[str, ResourceDetails]]:
+        """Returns resources of the kind, loads them from the workspace
+        folder if it wasn't done yet. None if they can't be loaded"""
+        if kind in self._loaded:
+            return self._resources[kind]
+
+        if not root_folder:
+            return None
+
+        with self._lock:
+            if kind in self._loaded:
+                return self._resources[kind]
+
+            jobs, _ = self._scan(kind, root_folder)
+            for name, path, files, stat in jobs:
+                # the resources are needed right away, there is nothing to verify them later
+                self._set_scanned_resource(kind, name, read_resource(path, sections=None), files, stat, path)
+
+            self._roots[kind] = root_folder
+            self._loaded.add(kind)
+
+        logging.debug(f"Workspace index loaded {RESOURCE_FOLDERS[kind]}: {self.get_stats()}")
+        return self._resources[kind]
+
+    def get_resources(self, kind: str) -> Dict[str, ResourceDetails]:
+        return self._resources[kind]
+
+    def get_resource(self, kind: str, name: str) -> Optional[ResourceDetails]:
+        details = self._resources[kind].get(name)
+        if details is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+
+        return details
+
+    def get_generation(self, kind: str) -> int:
+        return self._generations[kind]
+
+    def get_tree(self, kind: str, name: str) -> Optional[BaseTree]:
+        """Parses the definition file of the indexed resource, the trees are not kept.
+        None if the resource doesn't come from a file or it can't be parsed"""
+        details = self._resources[kind].get(name)
+        if details is None or details.path is None:
+            return None
+
+        try:
+            with open(details.path, "r") as f:
+                tree, _ = parse_resource(f.read())
+        except OSError:
+            return None
+
+        return tree
+
+    def set_resource(self, kind: str, name: str, source: str, tree: BaseTree = None) -> None:
+        """Indexes the resource definition, it's parsed if the tree is not provided"""
+        summary = summarize_resource(source, tree, sections=None)
+        self._set_summary(kind, name, summary)
+        self._refresh_stat(kind, self._resources[kind][name])
+
+    def _set_summary(self, kind: str, name: str, summary: ResourceSummary) -> None:
+        if summary.error is not None:
+            logging.warning(f"Unable to load {kind} '{name}.yaml' due to error: {summary.error}")
+
+        details = ResourceDetails(name=name, summary=summary)
+        with self._lock:
+            previous = self._resources[kind].get(name)
+            if previous is not None:
+                details.files = previous.files
+                details.stat = previous.stat
+                details.path = previous.path
+
+            self._resources[kind][name] = details
+            self._generations[kind] += 1
+
+    def _set_scanned_resource(self, kind: str, name: str, summary: ResourceSummary,
+                              files: Set[str], stat: FileStat, path: str) -> None:
+        self._set_summary(kind, name, summary)
+        details = self._resources[kind][name]
+        details.files = files
+        details.stat = stat
+        details.path = path
+
+    def update_resource(self, kind: str, name: str, source: str, tree: BaseTree = None) -> bool:
+        """Updates the indexed resource definition if the resources of the kind are loaded.
+        Returns False if the parts used by blueprints (inputs and outputs) are the same as before"""
+        if kind not in self._loaded:
+            return True
+
+        previous = self._resources[kind].get(name)
+        if tree is None and previous is not None and previous.summary.content_hash == get_content_hash(source):
+            # the file was saved without changes
+            if previous.stat is None:
+                self._refresh_stat(kind, previous)
+            return False
+
+        changed = self._update_summary(kind, name, summarize_resource(source, tree, sections=None))
+        self._refresh_stat(kind, self._resources[kind][name])
+        return changed
+
+    def _refresh_stat(self, kind: str, details: ResourceDetails) -> None:
+        """Stores the stat of the definition file if the summary was made of its current content,
+        so the next rescan doesn't read it again. Summaries of unsaved documents get no stat"""
+        root_folder = self._roots.get(kind)
+        if details.path is None and root_folder is not None:
+            # the resource was added after the folder had been scanned
+            details.path = os.path.join(root_folder, RESOURCE_FOLDERS[kind], details.name, f'{details.name}.yaml')
+
+        stat = None
+        if details.path is not None:
+            try:
+                with open(details.path, "r") as f:
+                    file_stat = _get_file_stat(os.fstat(f.fileno()))
+                    if get_content_hash(f.read()) == details.summary.content_hash:
+                        stat = file_stat
+            except OSError:
+                pass
+
+        details.stat = stat
+
+    def _update_summary(self, kind: str, name: str, summary: ResourceSummary) -> bool:
+        previous = self._resources[kind].get(name)
+        if previous is not None and previous.summary.get_interface() == summary.get_interface():
+            previous.summary = summary
+            return False
+
+        self._set_summary(kind, name, summary)
+        return True
+
+    def remove_resource(self, kind: str, name: str) -> bool:
+        with self._lock:
+            if self._resources[kind].pop(name, None) is None:
+                return False
+
+            self._generations[kind] += 1
+            return True
+
+    def _scan(self, kind: str, root_folder: str) -> Tuple[List[Tuple[str, str, Set[str], FileStat]], Set[str]]:
+        """
+        Scans the folder of the resources of the kind. Returns the definitions to read
+        as (name, path, files, stat) and the names of all the resources found.
+        Resource folders whose stat is the same as on the previous scan are not listed
+        again, definitions whose stat didn't change are not read again.
+        """
+        with self._lock:
+            resources = self._resources[kind]
+            jobs = []
+            found = set()
+            try:
+                entries = os.scandir(os.path.join(root_folder, RESOURCE_FOLDERS[kind]))
+            except OSError:
+                return jobs, found
+
+            with entries:
+                for entry in entries:
+                    if not entry.is_dir():
+                        continue
+
+                    name = entry.name
+                    definition = os.path.join(entry.path, f'{name}.yaml')
+                    folder_stat = _get_file_stat(entry.stat())
+                    details = resources.get(name)
+                    if details is not None and self._folder_stats.get(entry.path) == folder_stat:
+                        # no files were added or removed, the definition could only be changed in place
+                        files = details.files
+                        try:
+                            stat = _get_file_stat(os.stat(definition))
+                        except OSError:
+                            continue
+                    else:
+                        self._folder_stats[entry.path] = folder_stat
+                        files, stat = _list_resource_folder(entry.path, f'{name}.yaml')
+                        if stat is None:
+                            continue
+
+                    found.add(name)
+                    if details is None or details.stat != stat:
+                        jobs.append((name, definition, files, stat))
+                    else:
+                        details.files = files
+
+            return jobs, found
+
+    def rescan(self, kind: str, exclude: Iterable[str] = ()) -> Set[str]:
+        """
+        Brings the loaded resources of the kind up to date with the workspace folder
+        after changes which were not notified one by one (like a git pull). It costs
+        a stat call per resource, only the definitions whose stat changed are read and
+        parsed again. Resources of the open documents can be excluded. Returns names
+        of the resources whose inputs or outputs changed or which were added or removed.
+        """
+        root_folder = self._roots.get(kind)
+        if root_folder is None:
+            return set()
+
+        jobs, found = self._scan(kind, root_folder)
+        changed = set()
+        for name, path, files, stat in jobs:
+            if name in exclude:
+                continue
+
+            try:
+                summary = read_resource(path)
+            except OSError as e:
+                logging.warning(f"Unable to read {kind} '{path}' due to error: {str(e)}")
+                continue
+
+            if self._update_summary(kind, name, summary):
+                changed.add(name)
+            details = self._resources[kind][name]
+            details.files = files
+            details.stat = stat
+            details.path = path
+
+        for name in set(self._resources[kind]) - found:
+            if name not in exclude and self.remove_resource(kind, name):
+                changed.add(name)
+
+        logging.debug(f"Workspace index rescanned {RESOURCE_FOLDERS[kind]}: {len(jobs)} definitions read, "
+                      f"{len(changed)} changed")
+        return changed
+
+    async def verify(self, kind: str, executor: Executor = None,
+                     checkpoint: Callable[[], Awaitable[None]] = None) -> Set[str]:
+        """
+        Parses the whole definition files of the resources of the kind whose summaries
+        are unverified, the files are parsed by the executor. An error found in the
+        sections the summaries skipped makes the resources invalid, files changed since
+        they were summarized are summarized again. checkpoint() is awaited after every
+        file. Returns names of the resources whose inputs, outputs or validity changed.
+        """
+        loop = asyncio.get_running_loop()
+        changed = set()
+        for name, details in list(self._resources[kind].items()):
+            summary = details.summary
+            if summary.verified or details.path is None:
+                continue
+
+            try:
+                verified = await loop.run_in_executor(executor, read_resource, details.path, None)
+            except Exception as e:
+                logging.warning(f"Unable to read {kind} '{details.path}' due to error: {str(e)}")
+                continue
+
+            # the resource could be updated from a document or removed meanwhile
+            if self._resources[kind].get(name) is details and details.summary is summary:
+                if self._update_summary(kind, name, verified):
+                    changed.add(name)
+
+            if checkpoint is not None:
+                await checkpoint()
+
+        return changed
+
+    def update_file(self, kind: str, name: str, file_name: str, exists: bool) -> None:
+        """Tracks files (scripts, tfvars) in the folder of the indexed resource"""
+        details = self._resources[kind].get(name)
+        if details is None or file_name == f'{name}.yaml':
+            return
+
+        if exists:
+            details.files.add(file_name)
+        else:
+            details.files.discard(file_name)
+
+    async def warm_up(self, root_folder: str, executor: Executor,
+                      on_progress: Callable[[int, int], None] = None,
+                      checkpoint: Callable[[], Awaitable[None]] = None) -> int:
+        """
+        Indexes the resources of the workspace folder in the background, the definitions
+        are parsed in parallel by the executor. The kinds being indexed are considered
+        loaded from the start, so lookups made meanwhile return the resources indexed
+        so far instead of scanning the workspace. on_progress(done, total) is called
+        for every parsed definition and checkpoint() is awaited after it, so more
+        important work could go first. Returns the number of definitions found.
+        """
+        loop = asyncio.get_running_loop()
+        kinds = [kind for kind, folder in RESOURCE_FOLDERS.items()
+                 if kind not in self._loaded and os.path.isdir(os.path.join(root_folder, folder))]
+        if not kinds:
+            return 0
+
+        self._loaded.update(kinds)
+        self._warming_up = True
+        try:
+            jobs = []
+            for kind in kinds:
+                self._roots[kind] = root_folder
+                scanned, _ = await loop.run_in_executor(None, self._scan, kind, root_folder)
+                jobs += [(kind, *job) for job in scanned]
+
+            async def read(job):
+                try:
+                    return job, await loop.run_in_executor(executor, read_resource, job[2])
+                except Exception as e:
+                    logging.warning(f"Unable to read {job[0]} '{job[2]}' due to error: {str(e)}")
+                    return job, None
+
+            for done, result in enumerate(asyncio.as_completed([read(job) for job in jobs]), 1):
+                (kind, name, path, files, stat), summary = await result
+                # resources indexed meanwhile come from changed documents and are more recent
+                if summary is not None and name not in self._resources[kind]:
+                    self._set_scanned_resource(kind, name, summary, files, stat, path)
+
+                if on_progress is not None:
+                    on_progress(done, len(jobs))
+                if checkpoint is not None:
+                    await checkpoint()
+
+            # the definitions were summarized from some of their sections,
+            # diagnostics depending on their validity are provisional until then
+            for kind in kinds:
+                await self.verify(kind, executor, checkpoint)
+
+        finally:
+            self._warming_up = False
+            # results based on the partial index are outdated
+            for kind in kinds:
+                self._generations[kind] += 1
+
+        logging.debug(f"Workspace index warmed up: {self.get_stats()}")
+        return len(jobs)
+
+    def get_stats(self) -> Dict[str, int]:
+        resources = list(self._resources[APPLICATION].values()) + list(self._resources[SERVICE].values())
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "applications": len(self._resources[APPLICATION]),
+            "services": len(self._resources[SERVICE]),
+            "inputs": sum(len(details.inputs) for details in resources),
+            "outputs": sum(len(details.outputs) for details in resources),
+            "files": sum(len(details.files) for details in resources),
+        }
+
+
+def parse_resource(source: str, sections: AbstractSet[str] = None) -> Tuple[Optional[BaseTree], Optional[str]]:
+    """Parses the resource definition (only the top-level sections if they are provided).
+    Returns the tree or the error message"""
+    try:
+        # the parser tolerates some invalid documents the YAML loader rejects
+        yaml_backend.load(Parser.normalize(source))
+        return Parser(document=source, sections=sections).parse(), None
+    except ParserError as e:
+        return None, e.message
+    except Exception as e:
+        return None, str(e)
+
+
+def get_content_hash(source: str) -> int:
+    # stable across the worker processes unlike hash()
+    return int.from_bytes(hashlib.blake2b(source.encode("utf-8", "surrogatepass"), digest_size=8).digest(), "big")
+
+
+def summarize_resource(source: str, tree: BaseTree = None,
+                       sections: AbstractSet[str] = SUMMARY_SECTIONS) -> ResourceSummary:
+    """Returns the summary of the resource definition. If the tree is not provided, only
+    the sections are parsed (the whole definition if they are None). A summary of some
+    of the sections is unverified: errors in the rest of the definition are not known"""
+    content_hash = get_content_hash(source)
+    error = None
+    verified = True
+    if tree is None:
+        tree, error = parse_resource(source, sections)
+        verified = sections is None
+    if tree is None:
+        return ResourceSummary(content_hash=content_hash, error=error)
+
+    scripts = ()
+    var_file = None
+    if isinstance(tree, AppTree) and tree.configuration is not None:
+        stages = (tree.configuration.initialization, tree.configuration.start, tree.configuration.healthcheck)
+        scripts = tuple(stage.script.text for stage in stages
+                        if stage and stage.script and stage.script.value)
+    elif isinstance(tree, ServiceTree):
+        node = tree.variables.var_file if tree.variables is not None else tree.tfvars_file
+        if node and node.value:
+            var_file = node.text
+
+    return ResourceSummary(
+        kind=tree.kind.text if tree.kind is not None else None,
+        inputs=tuple((input.key.text, input.value.text if input.value else None) for input in tree.get_inputs()),
+        outputs=tuple(out.text for out in tree.get_outputs()) if hasattr(tree, 'outputs') else (),
+        scripts=scripts,
+        var_file=var_file,
+        error_count=len(tree.error_sink),
+        content_hash=content_hash,
+        verified=verified)
+
+
+def read_resource(path: str, sections: AbstractSet[str] = SUMMARY_SECTIONS) -> ResourceSummary:
+    """Reads the resource definition file and returns its summary (see summarize_resource).
+    Runs in the worker processes of the warm-up, only the summary is sent back"""
+    with open(path, "r") as f:
+        return summarize_resource(f.read(), sections=sections)
+
+
+def _get_file_stat(stat: os.stat_result) -> FileStat:
+    return stat.st_mtime_ns, stat.st_size, stat.st_ino
+
+
+def _list_resource_folder(path: str, definition_name: str) -> Tuple[Set[str], Optional[FileStat]]:
+    """Returns names of the files in the resource folder except of the definition
+    and stat of the definition, None if the folder doesn't contain it"""
+    files = set()
+    stat = None
+    with os.scandir(path) as entries:
+        for entry in entries:
+            if entry.name == definition_name:
+                stat = _get_file_stat(entry.stat())
+            else:
+                files.add(entry.name)
+
+    return files, stat
+
+
+def _format_scalar(text: str) -> str:
+    return text if _PLAIN_SCALAR.fullmatch(text) else json.dumps(text)
+
+
+def get_completion_snippet(kind: str, name: str, inputs: Dict[str, Optional[str]]) -> str:
+    """Returns the snippet adding the resource with its inputs to the blueprint.
+    Snippets are built on the first request and memoized by the inputs"""
+    key = (kind, name, tuple(inputs.items()))
+    snippet = COMPLETION_SNIPPETS.get(key)
+    if snippet is None:
+        lines = [f"  - {_format_scalar(name)}:"]
+        if kind == APPLICATION:
+            lines.append("      instances: 1")
+        if inputs:
+            lines.append("      input_values:")
+            for input, value in inputs.items():
+                lines.append(f"        - {_format_scalar(input)}:" + (f" {_format_scalar(value)}" if value else ""))
+        snippet = "\n".join(lines) + "\n"
+
+        if len(COMPLETION_SNIPPETS) >= COMPLETION_SNIPPETS_LIMIT:
+            COMPLETION_SNIPPETS.clear()
+        COMPLETION_SNIPPETS[key] = snippet
+
+    return snippet
+
+
+WORKSPACE_INDEX = WorkspaceIndex()
@@ -8,6 +8,9 @@ from pygls.lsp.types.basic_structures import Diagnostic, DiagnosticSeverity, Pos
 from server.ats.trees.blueprint import BlueprintTree
 from server.constants import PREDEFINED_TORQUE_INPUTS
 from server.utils import applications, services
+from server.utils.workspace_index import WORKSPACE_INDEX
+
+PROVISIONAL_NOTE = " (provisional: the workspace is still being indexed)"
 
 
 class BlueprintValidationHandler(ValidationHandler):
@@ -24,6 +27,19 @@ class BlueprintValidationHandler(ValidationHandler):
         else:
             raise ValueError(f"Wrong document path of blueprint file: {path.as_posix()}")    
 
+    def _validate_cross_file(self, rule):
+        """Runs the rule depending on the applications and services of the workspace.
+        While the workspace is indexed in the background its diagnostics are based
+        on a partial index, so they are reported as provisional information"""
+        first = len(self._diagnostics)
+        rule()
+        if WORKSPACE_INDEX.is_warming_up():
+            self._diagnostics[first:] = [
+                d.copy(update={"message": d.message + PROVISIONAL_NOTE,
+                               "severity": DiagnosticSeverity.Information,
+                               "data": {"provisional": True}})
+                for d in self._diagnostics[first:]]
+
     def _check_for_deprecated_properties(self):
         deprecated_properties = {"availability": "bastion_availability",
                                  "environmentType": None}
@@ -66,31 +82,31 @@ class BlueprintValidationHandler(ValidationHandler):
             line_num += 1
 
     def _validate_dependency_exists(self):
-        message = "The application/service '{}' is not defined in the applications/services section"
-        apps = self.blueprint_apps
-        srvs = self.blueprint_services
-
-        apps_n_srvs = set(apps + srvs)
+        apps_n_srvs = frozenset(self.blueprint_apps + self.blueprint_services)
         tree_resources = self._tree.get_applications() + self._tree.get_services()
 
         for res in tree_resources:
-            deps_names = [dep.text for dep in res.deps]
-            deps = res.deps
+            self._validate_subtree(self._validate_resource_dependencies, res, apps_n_srvs)
+
+    def _validate_resource_dependencies(self, res, apps_n_srvs):
+        message = "The application/service '{}' is not defined in the applications/services section"
+        deps_names = [dep.text for dep in res.deps]
+        deps = res.deps
             
-            for dep in deps:
-                if dep.text not in apps_n_srvs:
-                    self._add_diagnostic(dep, message=message.format(dep.text))
-                elif dep.text == res.id.text:
-                    self._add_diagnostic(dep, message=f"The resource '{res.id.text}' cannot be dependent of itself")
-
-            for input in res.inputs:
-                if input.value is None:
-                    continue
-                if input.value and ('torque.applications.' in input.value.text or 'torque.services.' in input.value.text):
-                    found = re.findall('torque\.(applications|services)\.(.+?)\.', input.value.text)
-                    for f in found:
-                        if f[1] not in deps_names:
-                            self._add_diagnostic(input.value, message=f"The app '{res.id.text}' is missing a dependency to '{f[1]}'.")
+        for dep in deps:
+            if dep.text not in apps_n_srvs:
+                self._add_diagnostic(dep, message=message.format(dep.text))
+            elif dep.text == res.id.text:
+                self._add_diagnostic(dep, message=f"The resource '{res.id.text}' cannot be dependent of itself")
+
+        for input in res.inputs:
+            if input.value is None:
+                continue
+            for var in input.value.get_variables():
+                path = var.path
+                if len(path) > 3 and path[0] == "torque" and path[1] in ("applications", "services"):
+                    if path[2] not in deps_names:
+                        self._add_diagnostic(input.value, message=f"The app '{res.id.text}' is missing a dependency to '{path[2]}'.")
 
     def _validate_non_existing_app_is_used(self):
         message = "The app '{}' could not be found in the /applications folder"
@@ -104,15 +120,18 @@ class BlueprintValidationHandler(ValidationHandler):
         available_apps = applications.get_available_applications()
         for app in self._tree.get_applications():
             if app.id.text in available_apps:
-                if available_apps[app.id.text]["app_tree"] is None:
+                if not available_apps[app.id.text].valid:
                     self._add_diagnostic(app.id, message=message.format(app.id.text))
             
     def _validate_blueprint_apps_have_input_values(self):
-        blueprint_inputs = {input.key.text: 1 for input in self._tree.get_inputs()}
+        blueprint_inputs = frozenset(input.key.text for input in self._tree.get_inputs())
         for app in self._tree.get_applications():
-            for var in app.inputs:
-                if not var.value and var.key.text not in blueprint_inputs:
-                    self._add_diagnostic(var.key, message="Application input must have a value or a blueprint input with the same name should be defined")
+            self._validate_subtree(self._validate_app_has_input_values, app, blueprint_inputs)
+
+    def _validate_app_has_input_values(self, app, blueprint_inputs):
+        for var in app.inputs:
+            if not var.value and var.key.text not in blueprint_inputs:
+                self._add_diagnostic(var.key, message="Application input must have a value or a blueprint input with the same name should be defined")
 
     def _validate_blueprint_services_have_input_values(self):
         blueprint_inputs = {input.key.text: 1 for input in self._tree.get_inputs()}
@@ -133,13 +152,12 @@ class BlueprintValidationHandler(ValidationHandler):
         available_srvs = services.get_available_services()
         for srv in self._tree.get_services():
             if srv.id.text in available_srvs:
-                if available_srvs[srv.id.text]["srv_tree"] is None:
+                if not available_srvs[srv.id.text].valid:
                     self._add_diagnostic(srv.id, message=message.format(srv.id.text))
 
     def _check_for_unused_blueprint_inputs(self):
         if self._tree.inputs_node:
             message = "Unused variable {}"
-            source = self._document.source
             # build a list of inputs used as "name only" to be matched with a blueprint input
             name_only_inputs = {}
             
@@ -153,16 +171,28 @@ class BlueprintValidationHandler(ValidationHandler):
                     if var.value is None and var.key.text not in name_only_inputs:
                         name_only_inputs[var.key.text] = 1
             # search if used as a variable
-            for input in self._tree.get_inputs():
+            inputs = self._tree.get_inputs()
+            used_vars = self._get_used_inputs({input.key.text for input in inputs})
+            for input in inputs:
                 if input.key.text not in name_only_inputs:
-                    found = re.findall('^[^#\\n]*(\$\{'+input.key.text+'\}|\$'+input.key.text+'\\b)', source, re.MULTILINE)
-                    if len(found) == 0:
+                    if input.key.text not in used_vars:
                         self._add_diagnostic(
                             input.key,
                             message=message.format(input.key.text),
                             diag_severity=DiagnosticSeverity.Warning
                         )
                 
+    def _get_used_inputs(self, names: set) -> set:
+        """Returns the names referenced as $NAME or ${NAME} anywhere in the lines of the
+        document outside of the comments, e.g. in 'http://$HOST:80' as well"""
+        # only the parts of the lines which could contain references are searched
+        code = "\n".join(part for part in (line.split('#', 1)[0] for line in self._document.lines) if '$' in part)
+        if not code:
+            return set()
+
+        return {name for name in names
+                if re.search(r"\$(?:\{" + re.escape(name) + r"\}|" + re.escape(name) + r"\b)", code)}
+
     def _is_valid_auto_var(self, var_name):
         if var_name.lower() in PREDEFINED_TORQUE_INPUTS:
             return True, ""
@@ -223,66 +253,55 @@ class BlueprintValidationHandler(ValidationHandler):
         return True, ""
 
     def _validate_var_being_used_is_defined(self):
-        bp_inputs = {input.key.text for input in self._tree.get_inputs()} if self._tree.inputs_node else {}
-
-        for app in self._tree.get_applications():            
-            for input in app.inputs:
-                self._confirm_variable_defined_in_blueprint_or_auto_var(bp_inputs, input)
+        bp_inputs = frozenset(input.key.text for input in self._tree.get_inputs()) if self._tree.inputs_node else frozenset()
+        # valid Torque-generated variables depend on the resources of the blueprint and their outputs
+        context = (bp_inputs, tuple(self.blueprint_apps), tuple(self.blueprint_services),
+                   applications.get_applications_generation(), services.get_services_generation())
 
-        for srv in self._tree.get_services():
-            for input in srv.inputs:
-                self._confirm_variable_defined_in_blueprint_or_auto_var(bp_inputs, input)
+        for res in self._tree.get_applications() + self._tree.get_services():
+            self._validate_subtree(self._validate_resource_variables_are_defined, res, *context)
 
         for art in self._tree.get_artifacts():
-            self._confirm_variable_defined_in_blueprint_or_auto_var(bp_inputs, art)
+            self._validate_subtree(self._validate_artifact_variables_are_defined, art, *context)
+
+    def _validate_resource_variables_are_defined(self, res, bp_inputs, *_):
+        for input in res.inputs:
+            self._confirm_variable_defined_in_blueprint_or_auto_var(bp_inputs, input)
+
+    def _validate_artifact_variables_are_defined(self, art, bp_inputs, *_):
+        self._confirm_variable_defined_in_blueprint_or_auto_var(bp_inputs, art)
 
     def _confirm_variable_defined_in_blueprint_or_auto_var(self, bp_inputs, input):
         # need to break value to parts to handle variables in {} like: 
         # abcd/${some_var}/asfsd/${var2}
         # and highlight these portions      
         message = "Variable '{}' is not defined"
-        regex = re.compile('(\$\{.+?\}|^\$.+?$)')
         try:
             if input.value:
-                iterator = regex.finditer(input.value.text)
-                for match in iterator:
-                    cur_var = match.group()
-                    pos = match.span()
-                    if cur_var.startswith("${") and cur_var.endswith("}"):
-                        cur_var = "$" + cur_var[2:-1]
-
-                    if cur_var.startswith("$") and "." not in cur_var:
-                        var = cur_var.replace("$", "")
-                        if var not in bp_inputs:
+                for var in input.value.get_variables():
+                    cur_var = var.expression
+                    var_range = Range(
+                        start=Position(line=var.start_pos[0], character=var.start_pos[1]),
+                        end=Position(line=input.value.end_pos[0], character=var.end_pos[1]),
+                    )
+
+                    if "." not in cur_var:
+                        var_name = cur_var.replace("$", "")
+                        if var_name not in bp_inputs:
                             self._diagnostics.append(Diagnostic(
-                                range=Range(
-                                    start=Position(line=input.value.start_pos[0],
-                                                   character=input.value.start_pos[1] + pos[0]),
-                                    end=Position(line=input.value.end_pos[0],
-                                                 character=input.value.start_pos[1] + pos[1]),
-                                ),
+                                range=var_range,
                                 message=message.format(cur_var),
                             ))
                     elif cur_var.lower().startswith("$torque"):
                         valid_var, error_message = self._is_valid_auto_var(cur_var)
                         if not valid_var:
                             self._diagnostics.append(Diagnostic(
-                                range=Range(
-                                    start=Position(line=input.value.start_pos[0],
-                                                   character=input.value.start_pos[1] + pos[0]),
-                                    end=Position(line=input.value.end_pos[0],
-                                                 character=input.value.start_pos[1] + pos[1]),
-                                ),
+                                range=var_range,
                                 message=error_message
                             ))
                     else:
                         self._diagnostics.append(Diagnostic(
-                                range=Range(
-                                    start=Position(line=input.value.start_pos[0],
-                                                   character=input.value.start_pos[1] + pos[0]),
-                                    end=Position(line=input.value.end_pos[0],
-                                                 character=input.value.start_pos[1] + pos[1]),
-                                ),
+                                range=var_range,
                                 message=message.format(cur_var)
                             ))
         except Exception as ex:
@@ -350,53 +369,61 @@ class BlueprintValidationHandler(ValidationHandler):
                         duplicated[prev_art.key.text] = 1
 
     def _validate_apps_inputs_exists(self):
-        apps = applications.get_available_applications_names()
+        generation = applications.get_applications_generation()
         for app in self._tree.get_applications():
-            if app.id.text in apps:
-                app_inputs = applications.get_app_inputs(app.id.text)
-                used_inputs = []
-                for input in app.inputs:   
-                    used_inputs.append(input.key.text)
-                    if input.key.text not in app_inputs:
-                        self._add_diagnostic(
-                            input.key,
-                            message=f"The application '{app.id.text}' does not have "
-                                    f"an input named '{input.key.text}'"
-                        )
-                missing_inputs = []
-                for input in app_inputs:
-                    if app_inputs[input] is None and input not in used_inputs:
-                        missing_inputs.append(input)
-                if missing_inputs:
+            self._validate_subtree(self._validate_app_inputs_exist, app, generation)
+
+    def _validate_app_inputs_exist(self, app, _generation):
+        apps = applications.get_available_applications_names()
+        if app.id.text in apps:
+            app_inputs = applications.get_app_inputs(app.id.text)
+            used_inputs = []
+            for input in app.inputs:   
+                used_inputs.append(input.key.text)
+                if input.key.text not in app_inputs:
                     self._add_diagnostic(
-                        app.id,
-                        message=f"The following mandatory inputs are missing: {', '.join(missing_inputs)}"
+                        input.key,
+                        message=f"The application '{app.id.text}' does not have "
+                                f"an input named '{input.key.text}'"
                     )
+            missing_inputs = []
+            for input in app_inputs:
+                if app_inputs[input] is None and input not in used_inputs:
+                    missing_inputs.append(input)
+            if missing_inputs:
+                self._add_diagnostic(
+                    app.id,
+                    message=f"The following mandatory inputs are missing: {', '.join(missing_inputs)}"
+                )
 
     def _validate_services_inputs_exists(self):
-        srvs = services.get_available_services_names()
+        generation = services.get_services_generation()
         for srv in self._tree.get_services():
-            if srv.id.text in srvs:
-                srv_inputs = services.get_service_inputs(srv.id.text)
-                used_inputs = []
+            self._validate_subtree(self._validate_service_inputs_exist, srv, generation)
 
-                for input in srv.inputs:
-                    used_inputs.append(input.key.text)
-                    if input.key.text not in srv_inputs:
-                        self._add_diagnostic(
-                            input.key,
-                            message=f"The service '{srv.id.text}' does not have an "
-                                    f"input named '{input.key.text}'"
-                        )
-                missing_inputs = []
-                for input in srv_inputs:
-                    if srv_inputs[input] is None and input not in used_inputs:
-                        missing_inputs.append(input)
-                if missing_inputs:
+    def _validate_service_inputs_exist(self, srv, _generation):
+        srvs = services.get_available_services_names()
+        if srv.id.text in srvs:
+            srv_inputs = services.get_service_inputs(srv.id.text)
+            used_inputs = []
+
+            for input in srv.inputs:
+                used_inputs.append(input.key.text)
+                if input.key.text not in srv_inputs:
                     self._add_diagnostic(
-                        srv.id,
-                        message=f"The following mandatory inputs are missing: {', '.join(missing_inputs)}"
+                        input.key,
+                        message=f"The service '{srv.id.text}' does not have an "
+                                f"input named '{input.key.text}'"
                     )
+            missing_inputs = []
+            for input in srv_inputs:
+                if srv_inputs[input] is None and input not in used_inputs:
+                    missing_inputs.append(input)
+            if missing_inputs:
+                self._add_diagnostic(
+                    srv.id,
+                    message=f"The following mandatory inputs are missing: {', '.join(missing_inputs)}"
+                )
 
     def _validate_blueprint_networking_gateway_not_same_as_management_or_application(self):
         if self._tree.infrastructure and self._tree.infrastructure.connectivity:
@@ -430,16 +457,16 @@ class BlueprintValidationHandler(ValidationHandler):
             self._validate_blueprint_apps_have_input_values()
             self._validate_blueprint_services_have_input_values()
             self._validate_dependency_exists()
-            self._validate_var_being_used_is_defined()
-            self._validate_non_existing_app_is_used()
-            self._validate_non_existing_service_is_used()
+            self._validate_cross_file(self._validate_var_being_used_is_defined)
+            self._validate_cross_file(self._validate_non_existing_app_is_used)
+            self._validate_cross_file(self._validate_non_existing_service_is_used)
             self._validate_apps_and_services_are_unique()
             self._validate_artifacts_apps_are_defined()
             self._validate_artifacts_are_unique()
-            self._validate_apps_inputs_exists()
-            self._validate_services_inputs_exists()
-            self._validate_used_apps_are_valid()
-            self._validate_used_services_are_valid()
+            self._validate_cross_file(self._validate_apps_inputs_exists)
+            self._validate_cross_file(self._validate_services_inputs_exists)
+            self._validate_cross_file(self._validate_used_apps_are_valid)
+            self._validate_cross_file(self._validate_used_services_are_valid)
             self._validate_blueprint_networking_gateway_not_same_as_management_or_application()
         except Exception as ex:
             print('Error on line {}'.format(sys.exc_info()[-1].tb_lineno), type(ex).__name__, ex)
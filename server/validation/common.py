@@ -1,8 +1,22 @@
-from typing import List
+import threading
+from typing import Callable, Dict, Hashable, List, Tuple
 from pygls.lsp.types.basic_structures import Diagnostic, DiagnosticSeverity, Position, Range
 from pygls.workspace import Document
 from server.ats.trees.common import BaseTree, YamlNode
 
+# (rule, subtree digest, context) -> diagnostics with positions relative to the subtree start
+SUBTREE_RESULTS: Dict[Tuple[str, int, Hashable], List[Diagnostic]] = {}
+SUBTREE_RESULTS_LIMIT = 10000
+# documents are validated by several worker threads
+_SUBTREE_RESULTS_LOCK = threading.Lock()
+
+
+def _move_diagnostic(diagnostic: Diagnostic, lines: int, cols: int) -> Diagnostic:
+    return diagnostic.copy(update={"range": Range(
+        start=Position(line=diagnostic.range.start.line + lines, character=diagnostic.range.start.character + cols),
+        end=Position(line=diagnostic.range.end.line + lines, character=diagnostic.range.end.character + cols),
+    )})
+
 
 class ValidationHandler:
     def __init__(self, tree: BaseTree, document: Document) -> None:
@@ -46,6 +60,30 @@ class ValidationHandler:
                     severity=diag_severity
                 ))
 
+    def _validate_subtree(self, rule: Callable[..., None], node: YamlNode, *context: Hashable) -> None:
+        """Runs the rule for the node as rule(node, *context). The rule must depend only
+        on the subtree of the node and the context, so the diagnostics it added for
+        an identical subtree are reused (moved to the position of the node)"""
+        if node is None or node.start_pos is None:
+            rule(node, *context)
+            return
+
+        line, col = node.start_pos
+        key = (rule.__qualname__, node.get_hash(), context)
+        results = SUBTREE_RESULTS.get(key)
+        if results is not None:
+            self._diagnostics.extend(_move_diagnostic(d, line, col) for d in results)
+            return
+
+        first = len(self._diagnostics)
+        rule(node, *context)
+
+        results = [_move_diagnostic(d, -line, -col) for d in self._diagnostics[first:]]
+        with _SUBTREE_RESULTS_LOCK:
+            if len(SUBTREE_RESULTS) >= SUBTREE_RESULTS_LIMIT:
+                SUBTREE_RESULTS.clear()
+            SUBTREE_RESULTS[key] = results
+
     def _validate_no_duplicates_in_inputs(self):
         message = "Multiple declarations of input '{}'"
 